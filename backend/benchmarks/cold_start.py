@@ -0,0 +1,193 @@
+"""
+Measure the cold start of each Lambda function by timing the import of its handler.
+
+Each function is imported in a fresh interpreter with its layers on the path and
+placeholder values for the environment variables it requires. The slowest imports are
+reported from python -X importtime, followed by the time taken to create each AWS
+client the function creates on first use. With --baseline the same measurements are
+taken from another git revision so the change can be compared.
+
+This is an offline probe for comparing changes before they are deployed. Deployed
+functions report the time to their first invocation as the InitDuration metric.
+
+Requires the function and layer requirements to be installed:
+
+    pip install -r ../requirements.txt -r ../layers/tams-client/requirements.txt
+    python cold_start.py --runs 5 --baseline HEAD~1
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import subprocess  # nosec B404 - only runs the current interpreter on local files
+import sys
+import tarfile
+import tempfile
+
+BACKEND = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Imports the handler, then creates the AWS clients it creates on first use
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+init = time.perf_counter() - start
+clients = {}
+for service_name in json.loads(sys.argv[1]):
+    if hasattr(app, "get_client"):
+        start = time.perf_counter()
+        app.get_client(service_name)
+        clients[service_name] = time.perf_counter() - start
+print(json.dumps({"init": init, "clients": clients}))
+"""
+
+
+def find_functions(backend):
+    return sorted(
+        os.path.dirname(path)
+        for pattern in ("components/*/functions/*/app.py", "functions/*/app.py")
+        for path in glob.glob(os.path.join(backend, pattern))
+    )
+
+
+def get_environment(function_dir, backend):
+    """Environment with placeholders for every variable the function requires"""
+    with open(os.path.join(function_dir, "app.py"), encoding="utf-8") as f:
+        source = f.read()
+    env = {
+        **os.environ,
+        "AWS_REGION": "eu-west-1",
+        "AWS_DEFAULT_REGION": "eu-west-1",
+        "AWS_ACCESS_KEY_ID": "placeholder",
+        "AWS_SECRET_ACCESS_KEY": "placeholder",
+        "AWS_EC2_METADATA_DISABLED": "true",
+        "POWERTOOLS_TRACE_DISABLED": "true",
+        "POWERTOOLS_SERVICE_NAME": os.path.basename(function_dir),
+        # Shared layers and those of each component, such as ffprobe for ingest-hls
+        "PYTHONPATH": os.pathsep.join(
+            [
+                function_dir,
+                *sorted(glob.glob(os.path.join(backend, "layers", "*"))),
+                *sorted(
+                    glob.glob(os.path.join(backend, "components", "*", "layers", "*"))
+                ),
+            ]
+        ),
+    }
+    for name in set(re.findall(r'os\.environ\["([A-Z0-9_]+)"\]', source)):
+        if name.endswith("_ARN"):
+            env.setdefault(name, f"arn:aws:sqs:eu-west-1:123456789012:{name.lower()}")
+        elif name.endswith(("_URL", "_ENDPOINT")):
+            env.setdefault(name, f"https://example.com/{name.lower()}")
+        else:
+            env.setdefault(name, "1")
+    return env, sorted(set(re.findall(r'get_client\("([a-z0-9-]+)"\)', source)))
+
+
+def parse_importtime(stderr):
+    """Self time in microseconds of each module from python -X importtime"""
+    imports = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(.+)$", line)
+        if match:
+            imports[match.group(3).strip()] = int(match.group(1))
+    return imports
+
+
+def measure(function_dir, backend, runs):
+    env, services = get_environment(function_dir, backend)
+    results = []
+    for _ in range(runs):
+        probe = subprocess.run(  # nosec B603 - runs the current interpreter
+            [sys.executable, "-X", "importtime", "-c", PROBE, json.dumps(services)],
+            cwd=function_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=120,
+            check=False,
+        )
+        if probe.returncode != 0:
+            error = probe.stderr.strip().splitlines()
+            return {"error": error[-1] if error else "failed"}
+        results.append(
+            {**json.loads(probe.stdout), "imports": parse_importtime(probe.stderr)}
+        )
+    return {
+        "init": statistics.median(result["init"] for result in results),
+        "clients": {
+            service_name: statistics.median(
+                result["clients"][service_name] for result in results
+            )
+            for service_name in results[0]["clients"]
+        },
+        "imports": results[-1]["imports"],
+    }
+
+
+def extract_revision(revision, directory):
+    """Extract the backend of a git revision into a directory"""
+    archive = subprocess.run(  # nosec B603 B607 - git with fixed arguments
+        ["git", "archive", revision, "backend"],
+        cwd=os.path.dirname(BACKEND),
+        capture_output=True,
+        check=True,
+    ).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(directory, filter="data")
+    return os.path.join(directory, "backend")
+
+
+def report(name, result, baseline, top):
+    if "error" in result:
+        print(f"{name}: failed to import: {result['error']}")
+        return
+    line = f"{name}: init {result['init'] * 1000:.0f} ms"
+    if baseline and "init" in baseline:
+        line += (
+            f" (baseline {baseline['init'] * 1000:.0f} ms,"
+            f" {(result['init'] - baseline['init']) * 1000:+.0f} ms)"
+        )
+    print(line)
+    slowest = sorted(result["imports"].items(), key=lambda item: -item[1])[:top]
+    for module, self_us in slowest:
+        print(f"    {self_us / 1000:8.1f} ms  {module}")
+    for service_name, elapsed in result["clients"].items():
+        print(f"    {elapsed * 1000:8.1f} ms  client {service_name} on first use")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "functions", nargs="*", help="Function directory names, default all"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Median of this many")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports shown")
+    parser.add_argument("--baseline", help="Git revision to compare against")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_backend = (
+            extract_revision(args.baseline, directory) if args.baseline else None
+        )
+        for function_dir in find_functions(BACKEND):
+            name = os.path.basename(function_dir)
+            if args.functions and name not in args.functions:
+                continue
+            baseline = None
+            if baseline_backend:
+                baseline_dir = os.path.join(
+                    baseline_backend, os.path.relpath(function_dir, BACKEND)
+                )
+                if os.path.isdir(baseline_dir):
+                    baseline = measure(baseline_dir, baseline_backend, args.runs)
+            report(name, measure(function_dir, BACKEND, args.runs), baseline, args.top)
+
+
+if __name__ == "__main__":
+    main()
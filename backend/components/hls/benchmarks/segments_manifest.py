@@ -0,0 +1,115 @@
+"""
+Compare the m3u8 object model against the string builder used by the HLS generator
+for rendering a large VOD segments manifest.
+
+Requires the hls-generator and tams-client layer requirements to be installed:
+
+    pip install -r ../functions/hls-generator/requirements.txt \
+        -r ../../../layers/tams-client/requirements.txt
+    python segments_manifest.py --segments 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import m3u8
+from mediatimestamp.immutable import TimeRange
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "functions", "hls-generator")
+)
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "..", "..", "..", "layers", "tams-client"),
+)
+
+# pylint: disable=wrong-import-position
+from playlist import render_media_playlist  # noqa: E402
+
+
+def synthetic_segments(count):
+    """Generate TAMS segments of 6.006 seconds (180 frames at 29.97)"""
+    duration_ns = 6_006_000_000
+    start_ns = 1_700_000_000 * 1_000_000_000
+    for i in range(count):
+        start = start_ns + i * duration_ns
+        end = start + duration_ns
+        yield {
+            "object_id": f"object-{i}",
+            "timerange": f"[{start // 1_000_000_000}:{start % 1_000_000_000}_{end // 1_000_000_000}:{end % 1_000_000_000})",
+            "get_urls": [
+                {
+                    "url": f"https://bucket.s3.eu-west-1.amazonaws.com/object-{i}?X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Expires=3600&X-Amz-Signature={'0' * 64}",
+                    "presigned": True,
+                }
+            ],
+        }
+
+
+def render_m3u8(segments):
+    """Previous implementation based on the m3u8 object model"""
+    manifest = m3u8.M3U8()
+    manifest.version = 4
+    manifest.target_duration = 6.006
+    manifest.media_sequence = 1
+    manifest.playlist_type = "VOD"
+    prev_ts_offset = ""
+    for segment in segments:
+        presigned_urls = [
+            get_url["url"]
+            for get_url in segment["get_urls"]
+            if get_url.get("presigned", False)
+        ]
+        segment_duration = TimeRange.from_str(
+            segment["timerange"]
+        ).length.to_unix_float()
+        ts_offset = segment.get("ts_offset", "")
+        manifest.add_segment(
+            segment=m3u8.Segment(
+                duration=segment_duration,
+                uri=f"{presigned_urls[0]}",
+                discontinuity=(prev_ts_offset != ts_offset),
+            )
+        )
+        prev_ts_offset = ts_offset
+    manifest.is_endlist = True
+    return manifest.dumps()
+
+
+def render_string_builder(segments):
+    return render_media_playlist(
+        segments, target_duration=6.006, playlist_type="VOD", endlist=True
+    )
+
+
+def measure(name, render, count):
+    start = time.perf_counter()
+    body = render(synthetic_segments(count))
+    elapsed = time.perf_counter() - start
+    # Memory is traced in a separate run as tracing slows down rendering
+    tracemalloc.start()
+    render(synthetic_segments(count))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<16} {elapsed:8.3f} s  peak {peak / 1_000_000:8.1f} MB  "
+        f"body {len(body) / 1_000_000:6.1f} MB"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--segments", type=int, default=100_000)
+    args = parser.parse_args()
+    print(f"Rendering {args.segments} segments")
+    m3u8_elapsed = measure("m3u8", render_m3u8, args.segments)
+    builder_elapsed = measure("string builder", render_string_builder, args.segments)
+    print(f"Speed up: {m3u8_elapsed / builder_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,55 @@
+import concurrent.futures
+import contextvars
+import hashlib
+import itertools
 import json
 import os
-from collections import defaultdict, deque
-from datetime import datetime
+import time
+import zlib
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from functools import lru_cache
 from http import HTTPStatus
-from urllib.parse import urlparse, quote
-
-import boto3
-import m3u8
-import requests
-from botocore.auth import SigV4QueryAuth
-from botocore.awsrequest import AWSRequest
-from aws_lambda_powertools import Logger, Tracer
-from aws_lambda_powertools.event_handler import LambdaFunctionUrlResolver, Response
+from urllib.parse import quote, urlencode
+
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.event_handler import Response
+from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from mediatimestamp.immutable import TimeRange
+from botocore.exceptions import BotoCoreError, ClientError
+from lambda_init import add_init_duration_metric, get_client
 from openid_auth import Credentials
+from tams_client import TamsClient, format_timestamp, parse_timerange_bounds
+
+from cache import FileSingleFlight, Lazy, SingleFlight, TtlCache, request_documents
+from dash import (
+    PROFILE_ISOFF_MAIN,
+    PROFILE_MP2T,
+    format_duration,
+    format_element,
+    get_segment_timeline,
+    get_timeline_bounds,
+    render_mpd,
+    to_ticks,
+)
+from playlist import (
+    EMPTY_PLAYLIST,
+    get_segment_duration,
+    get_skipped_segment_count,
+    parse_timerange,
+    render_media_playlist,
+)
+from resolver import RequestLocalFunctionUrlResolver
+from signer import UrlSigner
 
 tracer = Tracer()
 logger = Logger()
-app = LambdaFunctionUrlResolver()
+metrics = Metrics()
+# The server resolves requests concurrently, so the event is kept per request
+app = RequestLocalFunctionUrlResolver()
 
-ssm = boto3.client("ssm")
 
 endpoint = os.environ["TAMS_ENDPOINT"]
 creds = Credentials(
@@ -29,7 +57,49 @@ creds = Credentials(
     secret_arn=os.environ["SECRET_ARN"],
 )
 default_hls_segments = os.environ["DEFAULT_HLS_SEGMENTS"]
+segment_prefetch_pages = int(os.environ.get("SEGMENT_PREFETCH_PAGES", "2"))
 codec_parameter = os.environ["CODEC_PARAMETER"]
+max_concurrency = int(os.environ.get("MAX_CONCURRENCY", "8"))
+http_pool_size = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+# Connections to the TAMS API are kept alive and shared between threads
+tams = TamsClient(endpoint, creds, pool_size=http_pool_size)
+signed_url_expires = int(os.environ.get("SIGNED_URL_EXPIRES", "60"))
+signature_bucket = int(os.environ.get("SIGNATURE_BUCKET", "300"))
+vod_cache_max_age = int(os.environ.get("VOD_CACHE_MAX_AGE", "300"))
+compression_min_bytes = int(os.environ.get("COMPRESSION_MIN_BYTES", "4096"))
+cache_ttl = float(os.environ.get("CACHE_TTL", "300"))
+cache_ttl_ingesting = float(os.environ.get("CACHE_TTL_INGESTING", "2"))
+document_cache = TtlCache(int(os.environ.get("CACHE_MAX_ENTRIES", "512")))
+incremental_segments = os.environ.get("INCREMENTAL_SEGMENTS", "true").lower() == "true"
+segment_window_ttl = float(os.environ.get("SEGMENT_WINDOW_TTL", "300"))
+tams_url_expires = float(os.environ.get("TAMS_URL_EXPIRES", "3600"))
+segment_window_table = os.environ.get("SEGMENT_WINDOW_TABLE", "")
+segment_windows = TtlCache(int(os.environ.get("CACHE_MAX_ENTRIES", "512")))
+blocking_reload_timeout = float(os.environ.get("BLOCKING_RELOAD_TIMEOUT", "20"))
+blocking_reload_interval = float(os.environ.get("BLOCKING_RELOAD_INTERVAL", "0.5"))
+# The HLS spec requires CAN-SKIP-UNTIL to be at least six target durations
+skip_target_durations = max(float(os.environ.get("SKIP_TARGET_DURATIONS", "6")), 6)
+request_flights = SingleFlight()
+# Latest windows polled by blocked playlist reloads, shared by every request waiting
+window_polls = TtlCache(int(os.environ.get("CACHE_MAX_ENTRIES", "512")))
+window_poll_flights = SingleFlight()
+# Only set when several long-lived server processes share a host
+coalesce_dir = os.environ.get("COALESCE_DIR", "")
+edl_url_prefixes = [
+    prefix for prefix in os.environ.get("EDL_URL_PREFIXES", "").split(",") if prefix
+]
+process_flights = FileSingleFlight(coalesce_dir) if coalesce_dir else None
+# DynamoDB items are limited to 400 KB, leaving room for the key and expiry
+max_shared_window_bytes = 390_000
+
+
+@lru_cache()
+def get_async_tams():
+    """Client used to fan out flow collection lookups, imported on first use"""
+    # pylint: disable=import-outside-toplevel
+    from tams_client_async import AsyncTamsClient
+
+    return AsyncTamsClient(endpoint, creds, max_concurrency=max_concurrency)
 
 
 @lru_cache()
@@ -39,8 +109,9 @@ def get_function_url():
     if not function_name:
         return None
     try:
-        lambda_client = boto3.client("lambda")
-        response = lambda_client.get_function_url_config(FunctionName=function_name)
+        response = get_client("lambda").get_function_url_config(
+            FunctionName=function_name
+        )
         return response.get("FunctionUrl")
     # pylint: disable=broad-exception-caught
     except Exception as ex:
@@ -49,36 +120,41 @@ def get_function_url():
         return None
 
 
-@tracer.capture_method(capture_response=False)
-def get_signed_url(obj, expires_in=60):
-    """Generate presigned URL for Lambda Function URL path"""
+@lru_cache()
+def get_url_signer():
+    """Signer for this Lambda's Function URL, shared across invocations"""
     function_url = get_function_url()
     if not function_url:
-        return f"/{obj}"
-
-    region = os.environ["AWS_REGION"]
-    # Encode path segments but keep slashes
-    encoded_obj = "/".join(quote(segment, safe="") for segment in obj.split("/"))
-    full_url = f"{function_url.rstrip('/')}/{encoded_obj}"
-
-    # Get credentials from Lambda execution role
-    session = boto3.Session()
-    credentials = session.get_credentials().get_frozen_credentials()
-
-    # Create request for signing
-    request = AWSRequest(method="GET", url=full_url)
-    parsed = urlparse(full_url)
-    request.headers["Host"] = parsed.netloc
+        return None
+    return UrlSigner(
+        function_url, os.environ["AWS_REGION"], bucket_seconds=signature_bucket
+    )
 
-    # Sign with query string auth (adds signature as URL params)
-    SigV4QueryAuth(credentials, "lambda", region, expires=expires_in).add_auth(request)
 
-    return request.url
+@tracer.capture_method(capture_response=False)
+def get_signed_urls(objs, query=None):
+    """Generate presigned URLs for a batch of Lambda Function URL paths"""
+    signer = get_url_signer()
+    # Encode path segments but keep slashes
+    encoded_objs = {
+        obj: "/".join(quote(segment, safe="") for segment in obj.split("/"))
+        for obj in objs
+    }
+    if not signer:
+        query_string = f"?{urlencode(query)}" if query else ""
+        return {
+            obj: f"/{encoded_obj}{query_string}"
+            for obj, encoded_obj in encoded_objs.items()
+        }
+    signed_urls = signer.sign_all(
+        list(encoded_objs.values()), expires_in=signed_url_expires, query=query
+    )
+    return {obj: signed_urls[encoded_obj] for obj, encoded_obj in encoded_objs.items()}
 
 
 @lru_cache()
 def get_codec_mappings():
-    get_parameter = ssm.get_parameter(Name=codec_parameter)["Parameter"]
+    get_parameter = get_client("ssm").get_parameter(Name=codec_parameter)["Parameter"]
     codecs_list = json.loads(get_parameter["Value"])
     return {codec["tams"]: codec["hls"] for codec in codecs_list}
 
@@ -132,98 +208,352 @@ def get_hls_props(flow, flow_pos):
     return tagged_props
 
 
+def get_flow_segment_duration(flow):
+    """Nominal segment duration of a flow in seconds, 0 when not set"""
+    flow_segment_duration = flow.get(
+        "segment_duration", {"numerator": 0, "denominator": 1}
+    )
+    return flow_segment_duration["numerator"] / flow_segment_duration.get(
+        "denominator", 1
+    )
+
+
+def get_tile_resolution(flow):
+    """Resolution of the images in an image flow, None for other formats"""
+    if flow["format"] != "urn:x-tam:format:image":
+        return None
+    essence_parameters = flow["essence_parameters"]
+    return f'{essence_parameters["frame_width"]}x{essence_parameters["frame_height"]}'
+
+
+def get_image_bandwidth(flow):
+    """Peak bit rate of an image flow, estimated when TAMS does not provide one"""
+    if flow.get("max_bit_rate"):
+        return flow["max_bit_rate"]
+    essence_parameters = flow["essence_parameters"]
+    segment_duration = flow.get("segment_duration", {"numerator": 0})
+    seconds = segment_duration["numerator"] / segment_duration.get("denominator", 1)
+    # Assumes at most 2 bits per pixel for a single JPEG per segment
+    return int(
+        essence_parameters["frame_width"]
+        * essence_parameters["frame_height"]
+        * 2
+        / (seconds or 1)
+    )
+
+
+def get_document_ttl(document):
+    """Ingesting flows change frequently so are cached for a shorter time"""
+    documents = document if isinstance(document, list) else [document]
+    if any(d.get("tags", {}).get("flow_status") == "ingesting" for d in documents):
+        return cache_ttl_ingesting
+    return cache_ttl
+
+
+def find_document(path):
+    """Look up a document in the per-request identity map and the TTL cache"""
+    documents = request_documents.get()
+    if documents is not None and path in documents:
+        return True, documents[path], None
+    entry = document_cache.get(path)
+    if entry and entry.is_fresh():
+        return True, remember_document(path, entry.value), entry
+    return False, None, entry
+
+
+def remember_document(path, value):
+    documents = request_documents.get()
+    if documents is not None:
+        documents[path] = value
+    return value
+
+
+def get_revalidation_headers(entry):
+    """Expired cache entries are revalidated when the TAMS API supplied an ETag"""
+    return {"If-None-Match": entry.etag} if entry and entry.etag else {}
+
+
+def store_document(path, entry, response):
+    """Cache the document in a TAMS response, keeping the cached one if not modified"""
+    if entry and response.status_code == HTTPStatus.NOT_MODIFIED.value:
+        value = entry.value
+        etag = entry.etag
+    else:
+        response.raise_for_status()
+        value = response.json()
+        etag = response.headers.get("ETag")
+    document_cache.set(path, value, get_document_ttl(value), etag)
+    return remember_document(path, value)
+
+
 @tracer.capture_method(capture_response=False)
-def get_source(source_id):
-    get = requests.get(
-        f"{endpoint}/sources/{source_id}",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
+def get_document(path):
+    """Get a TAMS document via the per-request identity map and the TTL cache"""
+    found, value, entry = find_document(path)
+    if found:
+        return value
+    get = tams.request("GET", path, headers=get_revalidation_headers(entry))
+    return store_document(path, entry, get)
+
+
+async def get_document_async(path):
+    """Asyncio equivalent of get_document, sharing the same caches"""
+    found, value, entry = find_document(path)
+    if found:
+        return value
+    get = await get_async_tams().request(
+        "GET", path, headers=get_revalidation_headers(entry)
     )
-    get.raise_for_status()
-    return get.json()
+    return store_document(path, entry, get)
+
+
+@tracer.capture_method(capture_response=False)
+def get_source(source_id):
+    return get_document(f"/sources/{source_id}")
 
 
 @tracer.capture_method(capture_response=False)
 def get_flow(flow_id):
-    get = requests.get(
-        f"{endpoint}/flows/{flow_id}?include_timerange=true",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
-    )
-    get.raise_for_status()
-    return get.json()
+    return get_document(f"/flows/{flow_id}?include_timerange=true")
+
+
+async def get_flow_async(flow_id):
+    return await get_document_async(f"/flows/{flow_id}?include_timerange=true")
 
 
 @tracer.capture_method(capture_response=False)
 def get_flows(source_id):
-    get = requests.get(
-        f"{endpoint}/flows?source_id={source_id}",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
-    )
-    get.raise_for_status()
-    return get.json()
+    return get_document(f"/flows?source_id={source_id}")
 
 
 @tracer.capture_method(capture_response=False)
-def get_segments(flow_id, segment_count):
-    limit_query = (
-        f"&limit={int(segment_count)}" if segment_count != float("inf") else ""
+def get_segments(flow_id, segment_count, timerange=None, reverse_order=True):
+    limit = int(segment_count) if segment_count != float("inf") else None
+    # Pages after the one containing the last segment needed are never requested,
+    # so pages are only read ahead when every segment in the timerange is wanted
+    yield from itertools.islice(
+        tams.get_segments(
+            flow_id,
+            timerange=timerange,
+            reverse_order=reverse_order,
+            limit=limit,
+            prefetch=0 if limit else segment_prefetch_pages,
+        ),
+        limit,
     )
-    get = requests.get(
-        f"{endpoint}/flows/{flow_id}/segments?reverse_order=true{limit_query}",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
+
+
+def get_window_ttl(ttl):
+    """Windows hold pre-signed URLs, which must still be valid when they are served"""
+    return min(ttl, tams_url_expires / 2)
+
+
+@tracer.capture_method(capture_response=False)
+def load_segment_window(flow_id):
+    """Get the cached segment window for a flow, falling back to the shared table"""
+    entry = segment_windows.get(flow_id)
+    if entry and entry.is_fresh():
+        return entry.value
+    if not segment_window_table:
+        return None
+    try:
+        item = (
+            get_client("dynamodb")
+            .get_item(
+                TableName=segment_window_table,
+                Key={"flowId": {"S": flow_id}},
+            )
+            .get("Item")
+        )
+    except (BotoCoreError, ClientError) as ex:
+        logger.warning("Could not read shared segment window")
+        logger.exception(ex)
+        return None
+    # Windows shared before their URLs were kept are stored as strings, not binary
+    if (
+        not item
+        or "B" not in item["segments"]
+        or float(item["expires"]["N"]) < time.time()
+    ):
+        return None
+    segments = json.loads(zlib.decompress(item["segments"]["B"]))
+    if not segments:
+        return None
+    # The window expires before the URLs signed at its last full refresh do
+    ttl = float(item["expires"]["N"]) - time.time()
+    segment_windows.set(flow_id, segments, get_window_ttl(ttl))
+    return segments
+
+
+@tracer.capture_method(capture_response=False)
+def save_segment_window(flow_id, segments, refreshed):
+    """Cache the segment window for a flow, only a full refresh restarts its expiry"""
+    entry = segment_windows.get(flow_id)
+    ttl = get_window_ttl(
+        segment_window_ttl
+        if refreshed or entry is None
+        else max(entry.expires_at - time.monotonic(), 0)
     )
-    get.raise_for_status()
-    count = 0
-    for segment in get.json():
-        count += 1
-        yield segment
-        if count >= segment_count:
-            break
-    while "next" in get.links and count < segment_count:
-        get = requests.get(
-            get.links["next"]["url"],
-            headers={
-                "Authorization": f"Bearer {creds.token()}",
+    segment_windows.set(flow_id, segments, ttl)
+    if not segment_window_table:
+        return
+    # Shared with their pre-signed URLs so readers need not list the window again
+    window = zlib.compress(json.dumps(segments, separators=(",", ":")).encode())
+    if len(window) > max_shared_window_bytes:
+        logger.error(
+            "Segment window is too large to share",
+            extra={"flow_id": flow_id, "bytes": len(window)},
+        )
+        return
+    try:
+        get_client("dynamodb").put_item(
+            TableName=segment_window_table,
+            Item={
+                "flowId": {"S": flow_id},
+                "segments": {"B": window},
+                "expires": {"N": str(int(time.time() + ttl))},
             },
-            timeout=30,
         )
-        get.raise_for_status()
-        for segment in get.json():
-            count += 1
-            yield segment
-            if count >= segment_count:
-                break
+    except (BotoCoreError, ClientError) as ex:
+        logger.warning("Could not write shared segment window")
+        logger.exception(ex)
+
+
+@tracer.capture_method(capture_response=False)
+def get_window_segments(flow_id, segment_count):
+    """Get the latest segments in playing order, only querying TAMS for new ones"""
+    window = load_segment_window(flow_id)
+    if not window:
+        segments = list(get_segments(flow_id, segment_count))[::-1]
+        save_segment_window(flow_id, segments, True)
+        return segments
+    window_end = format_timestamp(parse_timerange(window[-1]["timerange"])[1])
+    new_segments = list(get_segments(flow_id, segment_count, f"[{window_end}_)"))[::-1]
+    if not new_segments:
+        return window
+    known_timeranges = set(segment["timerange"] for segment in window)
+    segments = [
+        *window,
+        *[s for s in new_segments if s["timerange"] not in known_timeranges],
+    ][-int(segment_count) :]
+    save_segment_window(flow_id, segments, False)
+    return segments
+
+
+@tracer.capture_method(capture_response=False)
+def get_playlist_segments(flow_id, segment_count, flow_ingesting):
+    if incremental_segments and flow_ingesting and segment_count != float("inf"):
+        return get_window_segments(flow_id, segment_count)
+    # Need to reverse segments for correct playing order
+    return list(get_segments(flow_id, segment_count))[::-1]
+
+
+def get_media_sequence(segments, flow_created_epoch, flow_segment_duration_float):
+    """Media sequence of the first segment, counted from the flow creation time"""
+    if not flow_segment_duration_float:
+        return 1
+    first_segment_start, _ = parse_timerange(segments[0]["timerange"])
+    return int(
+        (first_segment_start / 1_000_000_000 - flow_created_epoch)
+        / flow_segment_duration_float
+    )
+
+
+def get_delivery_directive(name):
+    """Parse an integer HLS delivery directive from the query string"""
+    value = app.current_event.get_query_string_value(name)
+    if value is None:
+        return None
+    directive = int(value)
+    if directive < 0:
+        raise ValueError(f"{name} must not be negative")
+    return directive
+
+
+def poll_window_segments(flow_id, segment_count):
+    """Latest segment window of an ingesting flow, polled at most once per interval"""
+    key = f"{flow_id}|{segment_count}"
+    entry = window_polls.get(key)
+    if entry and entry.is_fresh():
+        return entry.value
+
+    def poll():
+        segments = get_playlist_segments(flow_id, segment_count, True)
+        window_polls.set(key, segments, blocking_reload_interval)
+        return segments
+
+    segments, _ = window_poll_flights.do(key, poll)
+    return segments
+
+
+@tracer.capture_method(capture_response=False)
+def wait_for_media_sequence(
+    flow_id,
+    segment_count,
+    msn,
+    last_media_sequence,
+    flow_created_epoch,
+    flow_segment_duration_float,
+):
+    """Hold a blocking playlist reload until segment msn has been registered"""
+    # Hold for at most three target durations as recommended by the HLS spec
+    deadline = time.monotonic() + min(
+        blocking_reload_timeout, 3 * flow_segment_duration_float
+    )
+    # Segments after the next one cannot arrive until the next one has, so there is
+    # nothing to check for until they are at most a target duration away
+    delay = (msn - last_media_sequence - 1) * flow_segment_duration_float
+    if time.monotonic() + delay > deadline:
+        return None
+    time.sleep(delay)
+    # Backs off towards a quarter of a target duration while the segment is missing
+    interval = blocking_reload_interval
+    max_interval = max(blocking_reload_interval, flow_segment_duration_float / 4)
+    while True:
+        segments = poll_window_segments(flow_id, segment_count)
+        if segments:
+            media_sequence = get_media_sequence(
+                segments, flow_created_epoch, flow_segment_duration_float
+            )
+            if media_sequence + len(segments) - 1 >= msn:
+                return segments
+        if time.monotonic() + interval > deadline:
+            return None
+        time.sleep(interval)
+        interval = min(interval * 1.5, max_interval)
+
+
+@tracer.capture_method(capture_response=False)
+def get_timerange_segments(flow, timerange, flow_segment_duration_float):
+    """Get all segments within timerange in playing order, paging shards concurrently"""
+    yield from tams.get_segments_sharded(
+        flow["id"],
+        timerange,
+        flow.get("timerange", "()"),
+        shards=max_concurrency,
+        segment_duration=flow_segment_duration_float,
+    )
 
 
 @tracer.capture_method(capture_response=False)
 def get_collected_flows(flows):
-    flows_queue = deque(flows)
+    """Resolve flow collections breadth first, fetching each level concurrently"""
     flows_dict = defaultdict(list)
-    while flows_queue:
-        flow = flows_queue.pop()
-        # Check if flow is marked as exclude
-        if flow.get("tags", {}).get("hls_exclude", "false").lower() == "true":
-            continue
-        elif flow.get("flow_collection"):
-            for collected in flow["flow_collection"]:
-                # Only add it if not already processed to avoid duplicates and loops
-                if collected["id"] not in set(
-                    v["id"] for ft in flows_dict.values() for v in ft
-                ):
-                    flows_queue.append(get_flow(collected["id"]))
-        else:
-            if (
+    # Shared across all levels to avoid duplicates and loops
+    visited = set(flow["id"] for flow in flows)
+    level = list(flows)
+    while level:
+        child_ids = []
+        for flow in level:
+            # Check if flow is marked as exclude
+            if flow.get("tags", {}).get("hls_exclude", "false").lower() == "true":
+                continue
+            elif flow.get("flow_collection"):
+                for collected in flow["flow_collection"]:
+                    if collected["id"] not in visited:
+                        visited.add(collected["id"])
+                        child_ids.append(collected["id"])
+            elif (
                 flow["format"] == "urn:x-nmos:format:data"
                 and flow.get("essence_parameters", {}).get("data_type", "")
                 == "urn:x-tams:data:subtitle"
@@ -231,14 +561,33 @@ def get_collected_flows(flows):
                 flows_dict["subtitle"].append(flow)
             else:
                 flows_dict[flow["format"].split(":")[3]].append(flow)
+        level = get_async_tams().run_all(
+            get_flow_async(flow_id) for flow_id in child_ids
+        )
     return flows_dict
 
 
 @tracer.capture_method(capture_response=False)
-def get_collection_hls(video_flows, audio_flows, subtitle_flows):
+def get_collection_hls(
+    video_flows, audio_flows, subtitle_flows, image_flows=(), path_prefix="", query=None
+):
     # Sort by max_bit_rate descending (highest quality first)
     # TAMS spec: max_bit_rate is optional, default to 0 for flows without bit rate info
     video_flows.sort(key=lambda k: k.get("max_bit_rate", 0), reverse=True)
+    # Image flows are only used for trick play alongside video
+    image_flows = image_flows if video_flows else []
+    # Sign every rendition URI of the manifest in one batch
+    rendition_paths = {
+        flow["id"]: f'{path_prefix}flows/{flow["id"]}/segments/manifest.m3u8'
+        for flow in [*video_flows, *audio_flows, *subtitle_flows, *image_flows]
+    }
+    signed_paths = get_signed_urls(list(rendition_paths.values()), query)
+    signed_urls = {
+        flow_id: signed_paths[path] for flow_id, path in rendition_paths.items()
+    }
+    # Only multivariant playlists need the m3u8 object model, so it is imported late
+    import m3u8  # pylint: disable=import-outside-toplevel
+
     manifest = m3u8.M3U8()
     manifest.version = 4
     manifest.is_independent_segments = True
@@ -253,7 +602,7 @@ def get_collection_hls(video_flows, audio_flows, subtitle_flows):
                         "average_bandwidth": flow.get("avg_bit_rate", 0),
                         "codecs": map_codec(flow),
                     },
-                    uri=get_signed_url(f'flows/{flow["id"]}/segments/manifest.m3u8'),
+                    uri=signed_urls[flow["id"]],
                     media=m3u8.MediaList([]),
                     base_uri=None,
                 )
@@ -266,7 +615,7 @@ def get_collection_hls(video_flows, audio_flows, subtitle_flows):
             **get_hls_props(flow, i),
             type="SUBTITLES",
             group_id="subs",
-            uri=get_signed_url(f'flows/{flow["id"]}/segments/manifest.m3u8'),
+            uri=signed_urls[flow["id"]],
         )
         if i == 0:
             first_subtitle = media
@@ -279,7 +628,7 @@ def get_collection_hls(video_flows, audio_flows, subtitle_flows):
             type="AUDIO",
             group_id="audio",
             channels=flow["essence_parameters"]["channels"],
-            uri=get_signed_url(f'flows/{flow["id"]}/segments/manifest.m3u8'),
+            uri=signed_urls[flow["id"]],
             codecs=map_codec(flow),
         )
         if i == 0:
@@ -306,148 +655,706 @@ def get_collection_hls(video_flows, audio_flows, subtitle_flows):
                     "audio": first_audio.group_id if first_audio else None,
                     "subtitles": first_subtitle.group_id if first_subtitle else None,
                 },
-                uri=get_signed_url(f'flows/{flow["id"]}/segments/manifest.m3u8'),
+                uri=signed_urls[flow["id"]],
                 media=m3u8.MediaList(
                     [media for media in [first_audio, first_subtitle] if media]
                 ),
                 base_uri=None,
             )
         )
+    for flow in image_flows:
+        manifest.add_image_playlist(
+            m3u8.ImagePlaylist(
+                base_uri=None,
+                uri=signed_urls[flow["id"]],
+                image_stream_info={
+                    "bandwidth": get_image_bandwidth(flow),
+                    "resolution": get_tile_resolution(flow),
+                    "codecs": map_codec(flow),
+                },
+            )
+        )
     return manifest.dumps()
 
 
-@app.get("/sources/<sourceId>/manifest.m3u8")
+def get_etag(*parts):
+    """Strong ETag from the parts identifying a manifest and the signature bucket"""
+    bucket = int(time.time() // signature_bucket)
+    digest = hashlib.sha256(
+        "\n".join([*(str(part) for part in parts), str(bucket)]).encode("utf-8")
+    ).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def get_bucket_max_age():
+    """Seconds until the current signature bucket ends"""
+    return signature_bucket - int(time.time() % signature_bucket)
+
+
+def is_not_modified(etag):
+    if_none_match = app.current_event.get_header_value("If-None-Match")
+    if not if_none_match:
+        return False
+    # Weak comparison is used for If-None-Match
+    return any(
+        tag.strip().removeprefix("W/") in [etag, "*"]
+        for tag in if_none_match.split(",")
+    )
+
+
+@tracer.capture_method(capture_response=False)
+def manifest_response(
+    body, etag, max_age, content_type="application/vnd.apple.mpegurl"
+):
+    """Build a cacheable response, body may be callable to skip rendering on 304"""
+    headers = {
+        "Cache-Control": f"max-age={max_age}",
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if is_not_modified(etag):
+        return Response(
+            status_code=HTTPStatus.NOT_MODIFIED.value,  # 304
+            headers=headers,
+            compress=False,
+        )
+    if callable(body):
+        body = body()
+    # Routes compress with gzip when it is accepted, small manifests are sent as is
+    return Response(
+        status_code=HTTPStatus.OK.value,  # 200
+        content_type=content_type,
+        headers=headers,
+        body=body,
+        compress=len(body) >= compression_min_bytes,
+    )
+
+
+def error_response(body):
+    """Fallback manifest response that must not be cached"""
+    return Response(
+        status_code=HTTPStatus.OK.value,  # 200
+        content_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "no-store"},
+        body=body,
+    )
+
+
+def get_flow_manifest_flows(flow_id):
+    """The flow itself when it has media, followed by the flows it collects"""
+    flow = get_flow(flow_id)
+    flows = []
+    if flow.get("container"):
+        flows.append(flow)
+    if flow.get("flow_collection"):
+        # Renditions are fetched concurrently, like deeper levels of the collection
+        flows.extend(
+            get_async_tams().run_all(
+                get_flow_async(collected["id"]) for collected in flow["flow_collection"]
+            )
+        )
+    return flows
+
+
+@app.get("/sources/<sourceId>/manifest.m3u8", compress=True)
 @tracer.capture_method(capture_response=False)
 def get_source_hls(sourceId: str):
-    manifest = m3u8.M3U8()
-    manifest.version = 4
     try:
         flows = get_flows(sourceId)
         flows_dict = get_collected_flows(flows)
         m3u8_content = get_collection_hls(
-            flows_dict["video"], flows_dict["audio"], flows_dict["subtitle"]
+            flows_dict["video"],
+            flows_dict["audio"],
+            flows_dict["subtitle"],
+            flows_dict["image"],
         )
-        return Response(
-            status_code=HTTPStatus.OK.value,  # 200
-            content_type="application/vnd.apple.mpegurl",
-            body=m3u8_content,
+        # Signed URIs are identical within a bucket so the content can be cached
+        return manifest_response(
+            m3u8_content, get_etag(m3u8_content), get_bucket_max_age()
         )
     # pylint: disable=broad-exception-caught
     except Exception as ex:
         logger.error("Error generating source manifest")
         logger.exception(ex)
-    return Response(
-        status_code=HTTPStatus.OK.value,  # 200
-        content_type="application/vnd.apple.mpegurl",
-        body=manifest.dumps(),
-    )
+    return error_response(EMPTY_PLAYLIST)
 
 
-@app.get("/flows/<flowId>/manifest.m3u8")
+@app.get("/flows/<flowId>/manifest.m3u8", compress=True)
 @tracer.capture_method(capture_response=False)
 def get_flow_hls(flowId: str):
-    manifest = m3u8.M3U8()
-    manifest.version = 4
     try:
-        flow = get_flow(flowId)
-        flows = []
-        if flow.get("container"):
-            flows.append(get_flow(flowId))
-        if flow.get("flow_collection"):
-            flows.extend(
-                [get_flow(collected["id"]) for collected in flow["flow_collection"]]
-            )
-        flows_dict = get_collected_flows(flows)
+        flows_dict = get_collected_flows(get_flow_manifest_flows(flowId))
         m3u8_content = get_collection_hls(
-            flows_dict["video"], flows_dict["audio"], flows_dict["subtitle"]
+            flows_dict["video"],
+            flows_dict["audio"],
+            flows_dict["subtitle"],
+            flows_dict["image"],
         )
-        return Response(
-            status_code=HTTPStatus.OK.value,  # 200
-            content_type="application/vnd.apple.mpegurl",
-            body=m3u8_content,
+        # Signed URIs are identical within a bucket so the content can be cached
+        return manifest_response(
+            m3u8_content, get_etag(m3u8_content), get_bucket_max_age()
         )
     # pylint: disable=broad-exception-caught
     except Exception as ex:
         logger.error("Error generating flow manifest")
         logger.exception(ex)
-    return Response(
-        status_code=HTTPStatus.OK.value,  # 200
-        content_type="application/vnd.apple.mpegurl",
-        body=manifest.dumps(),
+    return error_response(EMPTY_PLAYLIST)
+
+
+class ManifestError(Exception):
+    """Request that cannot be served with a playlist, shared by coalesced requests"""
+
+    def __init__(self, status_code: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class SegmentsManifest:
+    etag: str
+    max_age: int
+    render: Callable[[], str]
+
+
+def build_segments_manifest(
+    flow_id: str, hls_msn: int | None, hls_skip: str, timerange: str | None
+) -> SegmentsManifest:
+    """Fetches what is needed for a segments manifest, rendering it on first use"""
+    flow = get_flow(flow_id)
+    flow_created_epoch = datetime.strptime(
+        flow["created"], "%Y-%m-%dT%H:%M:%SZ"
+    ).timestamp()
+    flow_segment_duration_float = get_flow_segment_duration(flow)
+    hls_segment_count = float(
+        flow.get("tags", {}).get("hls_segments", default_hls_segments)
+    )
+    flow_ingesting = flow.get("tags", {}).get("flow_status", "") == "ingesting"
+    tile_resolution = get_tile_resolution(flow)
+    if timerange:
+        # Windows are served as VOD containing every segment in the timerange
+        return SegmentsManifest(
+            # Latest segment of a complete flow is the end of the flow timerange
+            get_etag(flow_id, flow.get("timerange"), timerange),
+            vod_cache_max_age,
+            Lazy(
+                lambda: render_media_playlist(
+                    get_timerange_segments(
+                        flow, timerange, flow_segment_duration_float
+                    ),
+                    target_duration=flow_segment_duration_float,
+                    playlist_type="VOD",
+                    endlist=True,
+                    tile_resolution=tile_resolution,
+                )
+            ),
+        )
+    if not flow_ingesting:
+        return SegmentsManifest(
+            get_etag(flow_id, flow.get("timerange"), hls_segment_count),
+            vod_cache_max_age,
+            Lazy(
+                lambda: render_media_playlist(
+                    (
+                        # Complete listings are paged in shards of the flow timerange
+                        get_timerange_segments(flow, "_", flow_segment_duration_float)
+                        if hls_segment_count == float("inf")
+                        else get_playlist_segments(flow_id, hls_segment_count, False)
+                    ),
+                    target_duration=flow_segment_duration_float,
+                    playlist_type="VOD",
+                    endlist=True,
+                    tile_resolution=tile_resolution,
+                )
+            ),
+        )
+    segments = get_playlist_segments(flow_id, hls_segment_count, True)
+    if hls_msn is not None:
+        last_media_sequence = (
+            get_media_sequence(
+                segments, flow_created_epoch, flow_segment_duration_float
+            )
+            + len(segments)
+            - 1
+        )
+        if hls_msn > last_media_sequence + 2:
+            raise ManifestError(
+                HTTPStatus.BAD_REQUEST, "_HLS_msn is too far in the future"
+            )
+        if hls_msn > last_media_sequence:
+            segments = wait_for_media_sequence(
+                flow_id,
+                hls_segment_count,
+                hls_msn,
+                last_media_sequence,
+                flow_created_epoch,
+                flow_segment_duration_float,
+            )
+            if segments is None:
+                raise ManifestError(
+                    HTTPStatus.SERVICE_UNAVAILABLE, "Timed out waiting for _HLS_msn"
+                )
+    # Without a segment duration no skip boundary can be advertised or honoured
+    can_skip_until = skip_target_durations * flow_segment_duration_float or None
+    if can_skip_until is None:
+        hls_skip = "NO"
+
+    def render() -> str:
+        skipped_segments = (
+            get_skipped_segment_count(
+                [get_segment_duration(segment) for segment in segments],
+                can_skip_until,
+            )
+            if hls_skip != "NO"
+            else 0
+        )
+        return render_media_playlist(
+            segments[skipped_segments:],
+            target_duration=flow_segment_duration_float,
+            media_sequence=get_media_sequence(
+                segments, flow_created_epoch, flow_segment_duration_float
+            ),
+            playlist_type="EVENT",
+            version=9 if skipped_segments else 4,  # EXT-X-SKIP requires version 9
+            server_control={
+                "CAN-SKIP-UNTIL": can_skip_until,
+                "CAN-BLOCK-RELOAD": "YES",
+                "HOLD-BACK": 3 * flow_segment_duration_float or None,
+            },
+            skipped_segments=skipped_segments,
+            prev_ts_offset=(
+                segments[skipped_segments - 1].get("ts_offset", "")
+                if skipped_segments
+                else ""
+            ),
+            tile_resolution=tile_resolution,
+        )
+
+    return SegmentsManifest(
+        get_etag(flow_id, segments[-1]["timerange"], hls_skip != "NO"),
+        # Live playlists are cached for at most half a target duration
+        max(int(flow_segment_duration_float / 2), 1),
+        Lazy(render),
+    )
+
+
+def get_coalesced_segments_manifest(
+    flow_id: str, hls_msn: int | None, hls_skip: str, timerange: str | None
+) -> SegmentsManifest:
+    """
+    Shares one segments manifest between concurrent requests for the same flow and
+    window, across processes as well when a coalescing directory is configured.
+    """
+    key = f"{flow_id}|{timerange}|{hls_msn}|{hls_skip}"
+
+    def build() -> SegmentsManifest:
+        if process_flights is None:
+            return build_segments_manifest(flow_id, hls_msn, hls_skip, timerange)
+
+        def build_shared() -> dict:
+            manifest = build_segments_manifest(flow_id, hls_msn, hls_skip, timerange)
+            return {
+                "etag": manifest.etag,
+                "max_age": manifest.max_age,
+                "body": manifest.render(),
+            }
+
+        shared, process_hit = process_flights.do(key, build_shared)
+        if process_hit:
+            metrics.add_metric(
+                name="ProcessCoalescingHit", unit=MetricUnit.Count, value=1
+            )
+        return SegmentsManifest(
+            shared["etag"], shared["max_age"], lambda: shared["body"]
+        )
+
+    manifest, hit = request_flights.do(key, build)
+    # The average of this metric is the coalescing hit ratio
+    metrics.add_metric(
+        name="CoalescingHit", unit=MetricUnit.Count, value=1 if hit else 0
     )
+    return manifest
 
 
-@app.get("/flows/<flowId>/segments/manifest.m3u8")
+@app.get("/flows/<flowId>/segments/manifest.m3u8", compress=True)
 @tracer.capture_method(capture_response=False)
 def get_segments_hls(flowId: str):
-    manifest = m3u8.M3U8()
-    manifest.version = 4
     try:
-        flow = get_flow(flowId)
-        flow_created_epoch = datetime.strptime(
-            flow["created"], "%Y-%m-%dT%H:%M:%SZ"
-        ).timestamp()
-        flow_segment_duration = flow.get(
-            "segment_duration", {"numerator": 0, "denominator": 1}
-        )
-        flow_segment_duration_float = flow_segment_duration[
-            "numerator"
-        ] / flow_segment_duration.get("denominator", 1)
-        hls_segment_count = float(
-            flow.get("tags", {}).get("hls_segments", default_hls_segments)
-        )
-        flow_ingesting = flow.get("tags", {}).get("flow_status", "") == "ingesting"
-        segments = list(get_segments(flowId, hls_segment_count))[
-            ::-1
-        ]  # Need to reverse segments for correct playing order
-        first_segment_timestamp = TimeRange.from_str(segments[0]["timerange"])
-        if (
-            flow_segment_duration_float > 0
-        ):  # Zero value would be where Flow does not have segment_duration specified
-            manifest.target_duration = flow_segment_duration_float
-        if flow_ingesting:
-            manifest.media_sequence = int(
-                (first_segment_timestamp.start.to_float() - flow_created_epoch)
-                / flow_segment_duration_float
-            )
-        else:
-            manifest.media_sequence = 1
-        manifest.program_date_time = f'{datetime.fromtimestamp(first_segment_timestamp.start.to_float()).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}+00:00'
-        manifest.playlist_type = "EVENT" if flow_ingesting else "VOD"
-        prev_ts_offset = ""
-        for segment in segments:
-            presigned_urls = [
-                get_url["url"]
-                for get_url in segment["get_urls"]
-                if get_url.get("presigned", False)
-            ]
-            segment_duration = TimeRange.from_str(
-                segment["timerange"]
-            ).length.to_unix_float()
-            ts_offset = segment.get("ts_offset", "")
-            manifest.add_segment(
-                segment=m3u8.Segment(
-                    duration=segment_duration,
-                    uri=f"{presigned_urls[0]}",
-                    discontinuity=(prev_ts_offset != ts_offset),
-                )
-            )
-            prev_ts_offset = ts_offset
-        if not flow_ingesting:
-            manifest.is_endlist = True
+        hls_msn = get_delivery_directive("_HLS_msn")
+        # Partial segments are not available so _HLS_part blocks for the whole segment
+        hls_part = get_delivery_directive("_HLS_part")
+        if hls_part is not None and hls_msn is None:
+            raise ValueError("_HLS_part requires _HLS_msn")
+        hls_skip = app.current_event.get_query_string_value("_HLS_skip", "NO")
+        if hls_skip not in ["YES", "v2", "NO"]:
+            raise ValueError("_HLS_skip must be YES or v2")
+        timerange = app.current_event.get_query_string_value("timerange")
+        if timerange:
+            parse_timerange_bounds(timerange)
+    except ValueError as ex:
+        return Response(
+            status_code=HTTPStatus.BAD_REQUEST.value,  # 400
+            content_type="text/plain",
+            body=str(ex),
+        )
+    try:
+        manifest = get_coalesced_segments_manifest(flowId, hls_msn, hls_skip, timerange)
+        return manifest_response(manifest.render, manifest.etag, manifest.max_age)
+    except ManifestError as ex:
+        return Response(
+            status_code=ex.status_code.value,
+            content_type="text/plain",
+            body=str(ex),
+        )
     # pylint: disable=broad-exception-caught
     except Exception as ex:
         logger.error("Error generating segments manifest")
         logger.exception(ex)
+    return error_response(EMPTY_PLAYLIST)
+
+
+def get_edl():
+    """EDL passed inline in edl or by reference in edl_url, with the query to pass on"""
+    # EDL previews are rare, so mediatimestamp is only imported when one is requested
+    from edl import decode_edl, validate_edl  # pylint: disable=import-outside-toplevel
+
+    edl_value = app.current_event.get_query_string_value("edl")
+    if edl_value:
+        return decode_edl(edl_value), {"edl": edl_value}
+    edl_url = app.current_event.get_query_string_value("edl_url")
+    if not edl_url:
+        raise ValueError("edl or edl_url is required")
+    if not any(edl_url.startswith(prefix) for prefix in edl_url_prefixes):
+        raise ValueError("edl_url is not an allowed location")
+    entry = document_cache.get(f"edl:{edl_url}")
+    if entry and entry.is_fresh():
+        return entry.value, {"edl_url": edl_url}
+    get = tams.session.get(edl_url, timeout=30)
+    get.raise_for_status()
+    edl = validate_edl(get.json())
+    document_cache.set(f"edl:{edl_url}", edl, cache_ttl)
+    return edl, {"edl_url": edl_url}
+
+
+@app.get("/edits/manifest.m3u8", compress=True)
+@tracer.capture_method(capture_response=False)
+def get_edit_hls():
+    from edl import get_edl_flow_ids  # pylint: disable=import-outside-toplevel
+
+    try:
+        edl, edl_query = get_edl()
+    except ValueError as ex:
+        return Response(
+            status_code=HTTPStatus.BAD_REQUEST.value,  # 400
+            content_type="text/plain",
+            body=str(ex),
+        )
+    try:
+        flows_dict = defaultdict(list)
+        for flow_id in get_edl_flow_ids(edl):
+            flow = get_flow(flow_id)
+            # Only video and audio flows can be listed as renditions
+            if flow["format"] in ["urn:x-nmos:format:video", "urn:x-nmos:format:audio"]:
+                flows_dict[flow["format"].split(":")[3]].append(flow)
+        m3u8_content = get_collection_hls(
+            flows_dict["video"],
+            flows_dict["audio"],
+            [],
+            path_prefix="edits/",
+            query=edl_query,
+        )
+        return manifest_response(
+            m3u8_content, get_etag(m3u8_content), get_bucket_max_age()
+        )
+    # pylint: disable=broad-exception-caught
+    except Exception as ex:
+        logger.error("Error generating edit manifest")
+        logger.exception(ex)
+    return error_response(EMPTY_PLAYLIST)
+
+
+@app.get("/edits/flows/<flowId>/segments/manifest.m3u8", compress=True)
+@tracer.capture_method(capture_response=False)
+def get_edit_segments_hls(flowId: str):
+    # pylint: disable=import-outside-toplevel
+    from edl import get_edl_flow_ids, get_virtual_segments
+
+    try:
+        edl, _ = get_edl()
+        if flowId not in get_edl_flow_ids(edl):
+            raise ValueError("Flow is not referenced by the EDL")
+    except ValueError as ex:
+        return Response(
+            status_code=HTTPStatus.BAD_REQUEST.value,  # 400
+            content_type="text/plain",
+            body=str(ex),
+        )
+    try:
+        flow = get_flow(flowId)
+        return manifest_response(
+            # Segments are listed as edit-by-reference would create them, unwritten
+            lambda: render_media_playlist(
+                get_virtual_segments(
+                    edl,
+                    flowId,
+                    lambda timerange: get_segments(
+                        flowId, float("inf"), timerange=timerange, reverse_order=False
+                    ),
+                ),
+                target_duration=get_flow_segment_duration(flow),
+                playlist_type="VOD",
+                endlist=True,
+            ),
+            get_etag(flowId, flow.get("timerange"), json.dumps(edl, sort_keys=True)),
+            vod_cache_max_age,
+        )
+    # pylint: disable=broad-exception-caught
+    except Exception as ex:
+        logger.error("Error generating edit segments manifest")
+        logger.exception(ex)
+    return error_response(EMPTY_PLAYLIST)
+
+
+def get_representation_segments(flow):
+    """Segments of a flow in playing order, as listed in its segments manifest"""
+    hls_segment_count = float(
+        flow.get("tags", {}).get("hls_segments", default_hls_segments)
+    )
+    flow_ingesting = flow.get("tags", {}).get("flow_status", "") == "ingesting"
+    if hls_segment_count == float("inf") and not flow_ingesting:
+        return get_segments(flow["id"], hls_segment_count, reverse_order=False)
+    return get_playlist_segments(flow["id"], hls_segment_count, flow_ingesting)
+
+
+def get_timescale(flow):
+    """Audio is addressed in samples, everything else at 90kHz"""
+    if flow["format"] == "urn:x-nmos:format:audio":
+        return int(flow.get("essence_parameters", {}).get("sample_rate", 90000))
+    return 90000
+
+
+def get_representation(flow, timeline, urls, presentation_start_ns):
+    timescale = get_timescale(flow)
+    essence_parameters = flow.get("essence_parameters", {})
+    attributes = {
+        "id": flow["id"],
+        # TAMS spec: max_bit_rate is optional, default to 0
+        "bandwidth": flow.get("max_bit_rate", 0),
+        "codecs": map_codec(flow),
+    }
+    children = []
+    if flow["format"] == "urn:x-nmos:format:audio":
+        attributes["audioSamplingRate"] = essence_parameters.get("sample_rate")
+        children.append(
+            format_element(
+                "AudioChannelConfiguration",
+                {
+                    "schemeIdUri": (
+                        "urn:mpeg:dash:23003:3:audio_channel_configuration:2011"
+                    ),
+                    "value": essence_parameters.get("channels"),
+                },
+            )
+        )
+    else:
+        frame_rate = essence_parameters.get("frame_rate")
+        attributes["width"] = essence_parameters.get("frame_width")
+        attributes["height"] = essence_parameters.get("frame_height")
+        attributes["frameRate"] = (
+            f'{frame_rate["numerator"]}/{frame_rate.get("denominator", 1)}'
+            if frame_rate
+            else None
+        )
+    return {
+        "attributes": attributes,
+        "children": children,
+        # Segment URLs are pre-signed individually, so they are listed like in HLS
+        "segment_list": {
+            "timescale": timescale,
+            "presentationTimeOffset": (
+                to_ticks(presentation_start_ns, timescale)
+                if presentation_start_ns is not None
+                else None
+            ),
+        },
+        "timeline": timeline,
+        "urls": urls,
+    }
+
+
+@tracer.capture_method(capture_response=False)
+def get_collection_mpd(video_flows, audio_flows):
+    """Render an MPD for the flows, returning it with whether it is live"""
+    video_flows.sort(key=lambda k: k.get("max_bit_rate", 0), reverse=True)
+    flows = [*video_flows, *audio_flows]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                lambda flow: get_segment_timeline(
+                    get_representation_segments(flow), get_timescale(flow)
+                ),
+                flow,
+            )
+            for flow in flows
+        ]
+        timelines = {}
+        segment_urls = {}
+        for flow, future in zip(flows, futures):
+            timelines[flow["id"]], segment_urls[flow["id"]] = future.result()
+    flows = [flow for flow in flows if timelines[flow["id"]]]
+    if not flows:
+        raise ValueError("No segments to list in the MPD")
+    dynamic = any(
+        flow.get("tags", {}).get("flow_status", "") == "ingesting" for flow in flows
+    )
+    bounds = []
+    max_segment_duration = 0
+    for flow in flows:
+        timescale = get_timescale(flow)
+        start, end = get_timeline_bounds(timelines[flow["id"]])
+        bounds.append(
+            (start * 1_000_000_000 // timescale, end * 1_000_000_000 // timescale)
+        )
+        max_segment_duration = max(
+            max_segment_duration,
+            *(d / timescale for _, d, _ in timelines[flow["id"]]),
+        )
+    start_ns = min(start for start, _ in bounds)
+    end_ns = max(end for _, end in bounds)
+    # Static presentations start at the first segment, live ones at the Unix epoch
+    presentation_start_ns = None if dynamic else start_ns
+    adaptation_sets = []
+    video_ids = set(flow["id"] for flow in video_flows)
+    video_flows = [flow for flow in flows if flow["id"] in video_ids]
+    if video_flows:
+        adaptation_sets.append(
+            {
+                "attributes": {
+                    "contentType": "video",
+                    "mimeType": video_flows[0].get("container"),
+                    "startWithSAP": 1,
+                },
+                "representations": [
+                    get_representation(
+                        flow,
+                        timelines[flow["id"]],
+                        segment_urls[flow["id"]],
+                        presentation_start_ns,
+                    )
+                    for flow in video_flows
+                ],
+            }
+        )
+    for flow in flows:
+        if flow["id"] in video_ids:
+            continue
+        adaptation_sets.append(
+            {
+                "attributes": {
+                    "contentType": "audio",
+                    "mimeType": flow.get("container"),
+                    "lang": flow.get("tags", {}).get("hls_language"),
+                    "startWithSAP": 1,
+                },
+                "representations": [
+                    get_representation(
+                        flow,
+                        timelines[flow["id"]],
+                        segment_urls[flow["id"]],
+                        presentation_start_ns,
+                    )
+                ],
+            }
+        )
+    mpd = {
+        "type": "dynamic" if dynamic else "static",
+        "profiles": ",".join(
+            sorted(
+                {
+                    (
+                        PROFILE_MP2T
+                        if flow.get("container") == "video/mp2t"
+                        else PROFILE_ISOFF_MAIN
+                    )
+                    for flow in flows
+                }
+            )
+        ),
+        "minBufferTime": format_duration(2 * max_segment_duration),
+    }
+    if dynamic:
+        mpd.update(
+            {
+                "availabilityStartTime": "1970-01-01T00:00:00Z",
+                "publishTime": datetime.now(timezone.utc).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                "minimumUpdatePeriod": format_duration(max_segment_duration),
+                "timeShiftBufferDepth": format_duration(
+                    (end_ns - start_ns) / 1_000_000_000
+                ),
+                "suggestedPresentationDelay": format_duration(3 * max_segment_duration),
+            }
+        )
+    else:
+        mpd["mediaPresentationDuration"] = format_duration(
+            (end_ns - start_ns) / 1_000_000_000
+        )
+    return render_mpd(mpd, adaptation_sets), dynamic, max_segment_duration
+
+
+def mpd_response(flows_dict):
+    content, dynamic, max_segment_duration = get_collection_mpd(
+        flows_dict["video"], flows_dict["audio"]
+    )
+    return manifest_response(
+        content,
+        get_etag(content),
+        # Live MPDs are cached for at most half a segment duration
+        max(int(max_segment_duration / 2), 1) if dynamic else vod_cache_max_age,
+        content_type="application/dash+xml",
+    )
+
+
+def mpd_error_response():
+    """MPDs cannot be empty so failures are reported as server errors"""
     return Response(
-        status_code=HTTPStatus.OK.value,  # 200
-        content_type="application/vnd.apple.mpegurl",
-        body=manifest.dumps(),
+        status_code=HTTPStatus.INTERNAL_SERVER_ERROR.value,  # 500
+        content_type="text/plain",
+        headers={"Cache-Control": "no-store"},
+        body="Error generating MPD",
     )
 
 
+@app.get("/sources/<sourceId>/manifest.mpd", compress=True)
+@tracer.capture_method(capture_response=False)
+def get_source_mpd(sourceId: str):
+    try:
+        return mpd_response(get_collected_flows(get_flows(sourceId)))
+    # pylint: disable=broad-exception-caught
+    except Exception as ex:
+        logger.error("Error generating source MPD")
+        logger.exception(ex)
+    return mpd_error_response()
+
+
+@app.get("/flows/<flowId>/manifest.mpd", compress=True)
+@tracer.capture_method(capture_response=False)
+def get_flow_mpd(flowId: str):
+    try:
+        return mpd_response(get_collected_flows(get_flow_manifest_flows(flowId)))
+    # pylint: disable=broad-exception-caught
+    except Exception as ex:
+        logger.error("Error generating flow MPD")
+        logger.exception(ex)
+    return mpd_error_response()
+
+
 @logger.inject_lambda_context(log_event=True)
 @tracer.capture_lambda_handler(capture_response=False)
+@metrics.log_metrics
 # pylint: disable=unused-argument
 def lambda_handler(event, context: LambdaContext) -> dict:
+    add_init_duration_metric(metrics)
+    request_documents.set({})
     return app.resolve(event, context)
@@ -0,0 +1,172 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+# Per-request identity map, set to a fresh dict at the start of each request
+request_documents: ContextVar[dict[str, Any] | None] = ContextVar(
+    "request_documents", default=None
+)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    etag: str | None
+    expires_at: float
+
+    def is_fresh(self) -> bool:
+        return self.expires_at > time.monotonic()
+
+
+class TtlCache:
+    """Bounded LRU cache where every entry carries its own expiry and ETag"""
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CacheEntry | None:
+        """Returns the entry for key, fresh or stale, and marks it as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, ttl: float, etag: str | None = None) -> None:
+        """Stores value for ttl seconds, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = CacheEntry(value, etag, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class Lazy:
+    """Computes a value on first call, once, however many threads call it"""
+
+    def __init__(self, fn: Callable[[], Any]) -> None:
+        self._fn = fn
+        self._lock = threading.Lock()
+        self._done = False
+        self._value = None
+
+    def __call__(self) -> Any:
+        with self._lock:
+            if not self._done:
+                self._value = self._fn()
+                self._done = True
+            return self._value
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key so only the first caller does the
+    work and every caller waiting on it shares its result or exception.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Returns the result of fn and whether it was shared from another caller"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class FileSingleFlight:
+    """
+    Coalesces calls with the same key across processes sharing a directory.
+
+    The first process takes an exclusive lock on a file for the key and writes the
+    JSON serialisable result alongside it, removing the lock file before releasing
+    it. Processes that find the lock held wait for it and reuse that result when it
+    was written after they started waiting, otherwise they do the work themselves.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """Returns the result of fn and whether it was shared from another process"""
+        path = os.path.join(
+            self._directory, hashlib.sha256(key.encode("utf-8")).hexdigest()
+        )
+        started = time.time()
+        while True:
+            with open(f"{path}.lock", "a", encoding="utf-8") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    waited = False
+                except BlockingIOError:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    waited = True
+                try:
+                    if waited:
+                        try:
+                            if os.stat(path).st_mtime >= started:
+                                with open(path, encoding="utf-8") as result_file:
+                                    return json.load(result_file), True
+                        except (OSError, ValueError):
+                            pass
+                    if not self._is_linked(lock_file, f"{path}.lock"):
+                        # Removed by the previous holder, so lock the current file
+                        continue
+                    try:
+                        result = fn()
+                        with open(f"{path}.tmp", "w", encoding="utf-8") as result_file:
+                            json.dump(result, result_file)
+                        os.replace(f"{path}.tmp", path)
+                        return result, False
+                    finally:
+                        os.unlink(f"{path}.lock")
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _is_linked(lock_file, lock_path: str) -> bool:
+        """Whether the open lock file is still the one at lock_path"""
+        try:
+            return os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino
+        except FileNotFoundError:
+            return False
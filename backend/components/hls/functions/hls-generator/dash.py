@@ -0,0 +1,121 @@
+from collections.abc import Iterable
+from xml.sax.saxutils import quoteattr
+
+from playlist import format_decimal, get_presigned_url, parse_timerange
+
+MPD_NAMESPACE = "urn:mpeg:dash:schema:mpd:2011"
+PROFILE_MP2T = "urn:mpeg:dash:profile:mp2t-main:2011"
+# The live profile requires SegmentTemplate, so segment lists use the main profile
+PROFILE_ISOFF_MAIN = "urn:mpeg:dash:profile:isoff-main:2011"
+
+
+def to_ticks(timestamp_ns: int, timescale: int) -> int:
+    """Convert nanoseconds to the nearest tick of timescale"""
+    return (timestamp_ns * timescale + 500_000_000) // 1_000_000_000
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as an ISO 8601 duration"""
+    return f"PT{format_decimal(seconds)}S"
+
+
+def format_element(name: str, attributes: dict, close: bool = True) -> str:
+    """Format an XML start tag, ignoring attributes without a value"""
+    formatted = "".join(
+        f" {k}={quoteattr(str(v))}" for k, v in attributes.items() if v is not None
+    )
+    return f"<{name}{formatted}{'/' if close else ''}>"
+
+
+def get_segment_timeline(
+    segments: Iterable[dict], timescale: int
+) -> tuple[list[tuple[int, int, int]], list[str]]:
+    """
+    Collapse TAMS segments into SegmentTimeline entries.
+
+    Args:
+        segments: TAMS segments in playing order
+        timescale: Ticks per second of the SegmentList
+
+    Returns:
+        List of (t, d, r) entries where each run of contiguous segments with the same
+        duration is a single entry, and the pre-signed URL of each segment in order
+    """
+    timeline = []
+    urls = []
+    expected_start = None
+    for segment in segments:
+        urls.append(get_presigned_url(segment))
+        start_ns, end_ns = parse_timerange(segment["timerange"])
+        start = to_ticks(start_ns, timescale)
+        # End is rounded separately so rounding errors do not accumulate
+        duration = to_ticks(end_ns, timescale) - start
+        if timeline and start == expected_start and timeline[-1][1] == duration:
+            t, d, r = timeline[-1]
+            timeline[-1] = (t, d, r + 1)
+        else:
+            timeline.append((start, duration, 0))
+        expected_start = start + duration
+    return timeline, urls
+
+
+def get_timeline_bounds(timeline: list[tuple[int, int, int]]) -> tuple[int, int]:
+    """Start and end ticks of a SegmentTimeline"""
+    t, d, r = timeline[-1]
+    return timeline[0][0], t + d * (r + 1)
+
+
+def render_mpd(mpd: dict, adaptation_sets: list[dict]) -> str:
+    """
+    Render a single period MPD with SegmentList and SegmentTimeline addressing.
+
+    Args:
+        mpd: Attributes of the MPD element, excluding the namespace
+        adaptation_sets: Each with the AdaptationSet "attributes", optional "children"
+            lines and "representations". Each representation has "attributes",
+            optional "children" lines, "segment_list" attributes, and the "timeline"
+            entries and segment "urls" from get_segment_timeline
+
+    Returns:
+        The MPD as a string
+    """
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        format_element("MPD", {"xmlns": MPD_NAMESPACE, **mpd}, close=False),
+        format_element("Period", {"id": "0", "start": "PT0S"}, close=False),
+    ]
+    append = lines.append
+    for adaptation_set in adaptation_sets:
+        append(format_element("AdaptationSet", adaptation_set["attributes"], False))
+        lines.extend(adaptation_set.get("children", []))
+        for representation in adaptation_set["representations"]:
+            append(
+                format_element("Representation", representation["attributes"], False)
+            )
+            lines.extend(representation.get("children", []))
+            append(format_element("SegmentList", representation["segment_list"], False))
+            append("<SegmentTimeline>")
+            previous_end = None
+            for t, d, r in representation["timeline"]:
+                # Start is only needed when there is a gap after the previous entry
+                append(
+                    format_element(
+                        "S",
+                        {
+                            "t": t if t != previous_end else None,
+                            "d": d,
+                            "r": r or None,
+                        },
+                    )
+                )
+                previous_end = t + d * (r + 1)
+            append("</SegmentTimeline>")
+            for url in representation["urls"]:
+                append(format_element("SegmentURL", {"media": url}))
+            append("</SegmentList>")
+            append("</Representation>")
+        append("</AdaptationSet>")
+    append("</Period>")
+    append("</MPD>")
+    append("")
+    return "\n".join(lines)
@@ -0,0 +1,115 @@
+import base64
+import binascii
+import json
+from collections.abc import Callable, Generator, Iterable
+from typing import Any
+
+from mediatimestamp.immutable import TimeRange, Timestamp
+
+DEFAULT_START_TIME = "0:0"
+
+
+def validate_edl(edl: Any) -> dict[str, Any]:
+    """
+    Check an EDL has the shape of an edit-by-reference payload.
+
+    Args:
+        edl: The decoded EDL
+
+    Returns:
+        The EDL when it is valid
+
+    Raises:
+        ValueError: If the EDL is not valid
+    """
+    if not isinstance(edl, dict) or not isinstance(edl.get("edit"), list):
+        raise ValueError("EDL must contain an edit list")
+    for edit_item in edl["edit"]:
+        if (
+            not isinstance(edit_item, dict)
+            or not isinstance(edit_item.get("timerange"), str)
+            or not isinstance(edit_item.get("flows"), list)
+        ):
+            raise ValueError("EDL edit items must contain a timerange and flows")
+        TimeRange.from_str(edit_item["timerange"])
+    Timestamp.from_str(edl.get("configuration", {}).get("start", DEFAULT_START_TIME))
+    return edl
+
+
+def decode_edl(value: str) -> dict[str, Any]:
+    """
+    Decode an inline EDL passed as base64url encoded JSON.
+
+    Args:
+        value: The encoded EDL, padding is optional
+
+    Returns:
+        The validated EDL
+
+    Raises:
+        ValueError: If the EDL cannot be decoded or is not valid
+    """
+    try:
+        edl = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+    except (binascii.Error, UnicodeDecodeError) as ex:
+        raise ValueError("EDL must be base64url encoded JSON") from ex
+    return validate_edl(edl)
+
+
+def get_edl_flow_ids(edl: dict[str, Any]) -> list[str]:
+    """Ids of the flows referenced by an EDL, in the order they first appear"""
+    return list(
+        dict.fromkeys(
+            flow_id for edit_item in edl["edit"] for flow_id in edit_item["flows"]
+        )
+    )
+
+
+def get_virtual_segments(
+    edl: dict[str, Any],
+    flow_id: str,
+    get_segments: Callable[[str], Iterable[dict[str, Any]]],
+) -> Generator[dict[str, Any], None, None]:
+    """
+    Segments that edit-by-reference would create for a flow, computed in memory.
+
+    Args:
+        edl: The EDL being previewed
+        flow_id: The source flow to build the edited timeline of
+        get_segments: Returns the source flow segments in a timerange in playing order
+
+    Yields:
+        Segments on the edited timeline, keeping the get_urls of the source segments
+    """
+    next_start = Timestamp.from_str(
+        edl.get("configuration", {}).get("start", DEFAULT_START_TIME)
+    )
+    for edit_item in edl["edit"]:
+        if flow_id not in edit_item["flows"]:
+            continue
+        edit_timerange = TimeRange.from_str(edit_item["timerange"])
+        for segment in get_segments(edit_item["timerange"]):
+            intersection_timerange = TimeRange.from_str(
+                segment["timerange"]
+            ).intersect_with(edit_timerange)
+            new_timerange = TimeRange(
+                start=next_start,
+                end=intersection_timerange.length + next_start,
+                inclusivity=intersection_timerange.inclusivity,
+            )
+            next_start = new_timerange.end
+            new_ts_offset = (
+                Timestamp.from_str(segment.get("ts_offset", "0:0"))
+                + new_timerange.start
+                - intersection_timerange.start
+            )
+            yield {
+                "object_id": segment["object_id"],
+                "timerange": str(new_timerange),
+                "get_urls": segment["get_urls"],
+                **(
+                    {"ts_offset": str(new_ts_offset)}
+                    if str(new_ts_offset) != "0:0"
+                    else {}
+                ),
+            }
@@ -0,0 +1,137 @@
+import math
+from collections.abc import Iterable
+from datetime import datetime, timezone
+
+from tams_client import parse_timestamp
+
+EMPTY_PLAYLIST = "#EXTM3U\n#EXT-X-VERSION:4\n"
+
+
+def parse_timerange(timerange: str) -> tuple[int, int]:
+    """Parse a bounded TAMS timerange string into start and end nanoseconds"""
+    start, separator, end = timerange.strip("[]()").partition("_")
+    start_ns = parse_timestamp(start)
+    return start_ns, parse_timestamp(end) if separator else start_ns
+
+
+def get_segment_duration(segment: dict) -> float:
+    start_ns, end_ns = parse_timerange(segment["timerange"])
+    return (end_ns - start_ns) / 1_000_000_000
+
+
+def get_skipped_segment_count(
+    segment_durations: list[float], can_skip_until: float
+) -> int:
+    """Number of leading segments that end more than can_skip_until from the end"""
+    skip_boundary = sum(segment_durations) - can_skip_until
+    elapsed = 0
+    skipped = 0
+    for segment_duration in segment_durations:
+        elapsed += segment_duration
+        if elapsed > skip_boundary:
+            break
+        skipped += 1
+    return skipped
+
+
+def get_presigned_url(segment: dict) -> str:
+    """First pre-signed URL TAMS returned for a segment"""
+    return [
+        get_url["url"]
+        for get_url in segment["get_urls"]
+        if get_url.get("presigned", False)
+    ][0]
+
+
+def format_program_date_time(timestamp_ns: int) -> str:
+    date_time = datetime.fromtimestamp(timestamp_ns / 1_000_000_000, timezone.utc)
+    return f'{date_time.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}+00:00'
+
+
+def format_decimal(value: float) -> str:
+    return f"{value:.3f}".rstrip("0").rstrip(".")
+
+
+def format_attributes(attributes: dict) -> str:
+    """Format an HLS attribute list, ignoring attributes without a value"""
+    return ",".join(
+        f"{k}={format_decimal(v) if isinstance(v, float) else v}"
+        for k, v in attributes.items()
+        if v is not None
+    )
+
+
+def render_media_playlist(
+    segments: Iterable[dict],
+    target_duration: float | None,
+    media_sequence: int = 1,
+    playlist_type: str | None = None,
+    version: int = 4,
+    server_control: dict | None = None,
+    skipped_segments: int = 0,
+    endlist: bool = False,
+    prev_ts_offset: str = "",
+    tile_resolution: str | None = None,
+) -> str:
+    """
+    Render a media playlist directly from an iterable of TAMS segments.
+
+    Lines are written as segments are consumed so a segments generator is never
+    materialised as a list of objects.
+
+    Args:
+        segments: TAMS segments in playing order, excluding any skipped segments
+        target_duration: Nominal segment duration in seconds, omitted when not set
+        media_sequence: Media sequence number of the first segment, including skipped
+        playlist_type: EVENT, VOD or None for a sliding window playlist
+        version: Value for EXT-X-VERSION
+        server_control: Attributes for EXT-X-SERVER-CONTROL
+        skipped_segments: Number of segments replaced by EXT-X-SKIP
+        endlist: Whether to add EXT-X-ENDLIST
+        prev_ts_offset: ts_offset of the segment preceding the first one listed
+        tile_resolution: Image size (WxH) when rendering an image media playlist with
+            one image per segment
+
+    Returns:
+        The playlist as a string
+    """
+    if tile_resolution:
+        # Image media playlists require version 7
+        version = max(version, 7)
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{version}"]
+    if target_duration:
+        # Target duration is an integer that rounded segment durations must not exceed
+        lines.append(f"#EXT-X-TARGETDURATION:{math.floor(target_duration + 0.5)}")
+    lines.append(f"#EXT-X-MEDIA-SEQUENCE:{media_sequence}")
+    if playlist_type:
+        lines.append(f"#EXT-X-PLAYLIST-TYPE:{playlist_type}")
+    if server_control:
+        lines.append(f"#EXT-X-SERVER-CONTROL:{format_attributes(server_control)}")
+    if skipped_segments:
+        lines.append(f"#EXT-X-SKIP:SKIPPED-SEGMENTS={skipped_segments}")
+    if tile_resolution:
+        lines.append("#EXT-X-IMAGES-ONLY")
+    append = lines.append
+    first = True
+    for segment in segments:
+        start_ns, end_ns = parse_timerange(segment["timerange"])
+        if first:
+            append(f"#EXT-X-PROGRAM-DATE-TIME:{format_program_date_time(start_ns)}")
+            first = False
+        ts_offset = segment.get("ts_offset", "")
+        if ts_offset != prev_ts_offset:
+            append("#EXT-X-DISCONTINUITY")
+        prev_ts_offset = ts_offset
+        duration = f"{(end_ns - start_ns) / 1_000_000_000:.6f}"
+        if tile_resolution:
+            # Each image is a single tile shown for the whole segment
+            append(
+                f"#EXT-X-TILES:RESOLUTION={tile_resolution},"
+                f"LAYOUT=1x1,DURATION={duration}"
+            )
+        append(f"#EXTINF:{duration},")
+        append(get_presigned_url(segment))
+    if endlist:
+        append("#EXT-X-ENDLIST")
+    lines.append("")
+    return "\n".join(lines)
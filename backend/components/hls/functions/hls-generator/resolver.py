@@ -0,0 +1,60 @@
+from contextvars import ContextVar
+from typing import Any
+
+from aws_lambda_powertools.event_handler import LambdaFunctionUrlResolver
+from aws_lambda_powertools.utilities.data_classes.common import BaseProxyEvent
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+_current_event: ContextVar[BaseProxyEvent | None] = ContextVar(
+    "current_event", default=None
+)
+_lambda_context: ContextVar[LambdaContext | None] = ContextVar(
+    "lambda_context", default=None
+)
+_routing_context: ContextVar[dict | None] = ContextVar("routing_context", default=None)
+
+
+class RequestLocalFunctionUrlResolver(LambdaFunctionUrlResolver):
+    """
+    Function URL resolver that keeps the event being resolved local to its request.
+
+    Powertools stores the current event on the router class and the routing context
+    on the resolver, so requests resolved concurrently on different threads would
+    read each other's event. Here they are held in context variables instead, so
+    each request, and any thread it copies its context to, only sees its own.
+    """
+
+    @property
+    def current_event(self) -> BaseProxyEvent:
+        return _current_event.get()
+
+    @current_event.setter
+    def current_event(self, value: BaseProxyEvent) -> None:
+        _current_event.set(value)
+
+    @property
+    def lambda_context(self) -> LambdaContext:
+        return _lambda_context.get()
+
+    @lambda_context.setter
+    def lambda_context(self, value: LambdaContext) -> None:
+        _lambda_context.set(value)
+
+    @property
+    def context(self) -> dict:
+        routing_context = _routing_context.get()
+        if routing_context is None:
+            routing_context = {}
+            _routing_context.set(routing_context)
+        return routing_context
+
+    @context.setter
+    def context(self, value: dict) -> None:
+        _routing_context.set(value)
+
+    def resolve(self, event: dict[str, Any], context: LambdaContext) -> dict[str, Any]:
+        self.current_event = self._to_proxy_event(event)
+        self.lambda_context = context
+        # A copied context shares the dict of its parent, so every request gets its own
+        self.context = {}
+        return super().resolve(event, context)
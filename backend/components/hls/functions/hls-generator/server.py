@@ -0,0 +1,188 @@
+"""
+ASGI entry point serving the HLS generator routes from a long-running process.
+
+Requests are translated into Lambda Function URL events and handled by the same
+resolver as the Lambda function, so caches, pooled TAMS connections, credentials and
+request coalescing are shared by every request the process serves.
+
+Only requests from this host are served unless ORIGIN_TOKEN is set, in which case
+every request must carry it in an X-Origin-Token header, as added by the CDN or load
+balancer in front of the server.
+
+    pip install -r requirements.txt -r requirements-server.txt
+    ORIGIN_TOKEN=... uvicorn server:app --host 0.0.0.0 --port 8080 --workers 4
+"""
+
+import asyncio
+import base64
+import contextvars
+import hmac
+import ipaddress
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl
+
+import app as hls_generator
+from cache import request_documents
+
+# Blocking playlist reloads hold a thread each, so size for concurrent viewers
+executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SERVER_THREADS", "64")),
+    thread_name_prefix="hls",
+)
+metrics_flush_interval = float(os.environ.get("METRICS_FLUSH_INTERVAL", "60"))
+origin_token = os.environ.get("ORIGIN_TOKEN", "")
+cors_headers = {
+    "access-control-allow-origin": "*",
+    "access-control-allow-methods": "GET",
+    "access-control-allow-headers": "*",
+}
+
+
+def get_event(scope: dict) -> dict:
+    """Build a Function URL (payload version 2.0) event from an ASGI HTTP scope"""
+    headers = {}
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        value = value.decode("latin-1")
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+    raw_query_string = scope["query_string"].decode("latin-1")
+    query_string_parameters = {}
+    for name, value in parse_qsl(raw_query_string, keep_blank_values=True):
+        query_string_parameters[name] = (
+            f"{query_string_parameters[name]},{value}"
+            if name in query_string_parameters
+            else value
+        )
+    now = datetime.now(timezone.utc)
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": scope["path"],
+        "rawQueryString": raw_query_string,
+        "headers": headers,
+        "queryStringParameters": query_string_parameters or None,
+        "requestContext": {
+            "domainName": headers.get("host", ""),
+            "http": {
+                "method": scope["method"],
+                "path": scope["path"],
+                "protocol": f'HTTP/{scope.get("http_version", "1.1")}',
+                "sourceIp": (scope.get("client") or ("", 0))[0],
+                "userAgent": headers.get("user-agent", ""),
+            },
+            "requestId": "",
+            "routeKey": "$default",
+            "stage": "$default",
+            "time": now.strftime("%d/%b/%Y:%H:%M:%S +0000"),
+            "timeEpoch": int(now.timestamp() * 1000),
+        },
+        "body": None,
+        "isBase64Encoded": False,
+    }
+
+
+def is_authorized(scope: dict) -> bool:
+    """Requests must carry the origin token, or come from this host when none is set"""
+    if not origin_token:
+        client = scope.get("client")
+        # Clients on a Unix socket are on this host
+        if client is None:
+            return True
+        try:
+            return ipaddress.ip_address(client[0]).is_loopback
+        except ValueError:
+            return False
+    for name, value in scope["headers"]:
+        if name == b"x-origin-token":
+            return hmac.compare_digest(value, origin_token.encode("latin-1"))
+    return False
+
+
+def handle(event: dict) -> dict:
+    """Run the resolver for one request, equivalent to the Lambda handler"""
+    request_documents.set({})
+    return hls_generator.app.resolve(event, None)
+
+
+def get_health() -> dict:
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"status": "ok"}),
+    }
+
+
+async def send_response(send, response: dict) -> None:
+    body = response.get("body") or ""
+    if response.get("isBase64Encoded"):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+    headers = {**cors_headers}
+    for name, value in (response.get("headers") or {}).items():
+        headers[name.lower()] = str(value)
+    raw_headers = [
+        (name.encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers.items()
+    ]
+    for cookie in response.get("cookies") or []:
+        raw_headers.append((b"set-cookie", cookie.encode("latin-1")))
+    await send(
+        {
+            "type": "http.response.start",
+            "status": response["statusCode"],
+            "headers": raw_headers,
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def flush_metrics() -> None:
+    """Publish metrics periodically as there is no end of invocation to do it"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(metrics_flush_interval)
+        await loop.run_in_executor(
+            None, lambda: hls_generator.metrics.flush_metrics(False)
+        )
+
+
+async def lifespan(receive, send) -> None:
+    flush_task = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            flush_task = asyncio.create_task(flush_metrics())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if flush_task:
+                flush_task.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            hls_generator.metrics.flush_metrics(False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    if not is_authorized(scope):
+        await send_response(send, {"statusCode": 403, "body": "Forbidden"})
+        return
+    if scope["method"] == "OPTIONS":
+        await send_response(send, {"statusCode": 204})
+        return
+    if scope["path"] == "/healthz":
+        await send_response(send, get_health())
+        return
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(
+        executor, contextvars.copy_context().run, handle, get_event(scope)
+    )
+    await send_response(send, response)
@@ -0,0 +1,147 @@
+import hashlib
+import hmac
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote, urlparse
+
+import boto3
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+# GET requests have an empty payload. Only S3 accepts UNSIGNED-PAYLOAD in its place
+EMPTY_PAYLOAD_HASH = hashlib.sha256(b"").hexdigest()
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _encode(value: str) -> str:
+    return quote(value, safe="-_.~")
+
+
+class UrlSigner:
+    """
+    SigV4 query string signer for GET requests to a single endpoint.
+
+    Frozen credentials and the derived signing key are reused between calls, and the
+    signing time is aligned to buckets so identical URLs are produced within a bucket.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        region: str,
+        service: str = "lambda",
+        bucket_seconds: int = 300,
+        refresh_margin: int = 300,
+    ) -> None:
+        parsed = urlparse(base_url)
+        self._base_url = base_url.rstrip("/")
+        self._host = parsed.netloc
+        self._base_path = parsed.path.rstrip("/")
+        self._region = region
+        self._service = service
+        self._bucket_seconds = bucket_seconds
+        self._refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._credentials = None
+        self._frozen_credentials = None
+        self._signing_key = None
+        self._signing_key_scope = None
+
+    def bucket_start(self, now: float | None = None) -> int:
+        """Start of the signing time bucket containing now"""
+        now = time.time() if now is None else now
+        return int(now // self._bucket_seconds * self._bucket_seconds)
+
+    def _get_frozen_credentials(self):
+        """Frozen credentials, refreshed when they are close to expiry"""
+        if self._credentials is None:
+            self._credentials = boto3.Session().get_credentials()
+        refreshable = hasattr(self._credentials, "refresh_needed")
+        if self._frozen_credentials is None or (
+            refreshable and self._credentials.refresh_needed(self._refresh_margin)
+        ):
+            self._frozen_credentials = self._credentials.get_frozen_credentials()
+            self._signing_key = None
+        return self._frozen_credentials
+
+    def _get_signing_key(self, secret_key: str, date_stamp: str) -> bytes:
+        """Signing key derived from the secret key, only recalculated once per day"""
+        scope = (date_stamp, self._region, self._service)
+        if self._signing_key is None or self._signing_key_scope != scope:
+            key = _hmac(f"AWS4{secret_key}".encode("utf-8"), date_stamp)
+            key = _hmac(key, self._region)
+            key = _hmac(key, self._service)
+            self._signing_key = _hmac(key, "aws4_request")
+            self._signing_key_scope = scope
+        return self._signing_key
+
+    def sign_all(
+        self,
+        paths: list[str],
+        expires_in: int = 60,
+        query: dict[str, str] | None = None,
+    ) -> dict[str, str]:
+        """
+        Pre-sign GET URLs for a batch of paths relative to the base URL.
+
+        Args:
+            paths: Paths with each segment already percent-encoded
+            expires_in: Minimum number of seconds the URLs remain valid for
+            query: Additional query string parameters to include in every URL
+
+        Returns:
+            Dictionary mapping each path to its pre-signed URL
+        """
+        with self._lock:
+            credentials = self._get_frozen_credentials()
+            signing_time = datetime.fromtimestamp(self.bucket_start(), timezone.utc)
+            amz_date = signing_time.strftime("%Y%m%dT%H%M%SZ")
+            date_stamp = signing_time.strftime("%Y%m%d")
+            signing_key = self._get_signing_key(credentials.secret_key, date_stamp)
+        scope = f"{date_stamp}/{self._region}/{self._service}/aws4_request"
+        params = {
+            **(query or {}),
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{credentials.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            # Extended by the bucket length as the signing time is in the past
+            "X-Amz-Expires": str(expires_in + self._bucket_seconds),
+            "X-Amz-SignedHeaders": "host",
+        }
+        if credentials.token:
+            params["X-Amz-Security-Token"] = credentials.token
+        canonical_query = "&".join(
+            f"{k}={v}"
+            for k, v in sorted((_encode(k), _encode(v)) for k, v in params.items())
+        )
+        signed_urls = {}
+        for path in paths:
+            url_path = f"{self._base_path}/{path}"
+            canonical_request = "\n".join(
+                [
+                    "GET",
+                    quote(url_path, safe="/~"),
+                    canonical_query,
+                    f"host:{self._host}\n",
+                    "host",
+                    EMPTY_PAYLOAD_HASH,
+                ]
+            )
+            string_to_sign = "\n".join(
+                [
+                    ALGORITHM,
+                    amz_date,
+                    scope,
+                    hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+                ]
+            )
+            signature = hmac.new(
+                signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+            ).hexdigest()
+            signed_urls[path] = (
+                f"{self._base_url}/{path}?{canonical_query}&X-Amz-Signature={signature}"
+            )
+        return signed_urls
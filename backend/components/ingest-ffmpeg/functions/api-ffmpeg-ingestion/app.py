@@ -3,18 +3,16 @@ import os
 from collections import defaultdict
 from http import HTTPStatus
 
-import boto3
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.event_handler import APIGatewayHttpResolver, CORSConfig
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from lambda_init import get_client
 
 tracer = Tracer()
 logger = Logger()
 app = APIGatewayHttpResolver(cors=CORSConfig())
 
-events = boto3.client("events")
-sfn = boto3.client("stepfunctions")
 queue_arn = os.environ["QUEUE_ARN"]
 ffmpeg_batch_arn = os.environ["FFMPEG_BATCH_ARN"]
 ffmpeg_export_arn = os.environ["FFMPEG_EXPORT_ARN"]
@@ -43,7 +41,7 @@ def put_ffmpeg_rule(flowId: str, outputFlowId: str):
     requestBody = json.loads(app.current_event.body)
     rule_name = f"{rule_id_prefix}{flowId}"
     rules = get_rule_names()
-    start_execution = sfn.start_sync_execution(
+    start_execution = get_client("stepfunctions").start_sync_execution(
         stateMachineArn=ffmpeg_rule_arn,
         input=json.dumps(
             {
@@ -63,14 +61,14 @@ def put_ffmpeg_rule(flowId: str, outputFlowId: str):
 @tracer.capture_method(capture_response=False)
 def delete_ffmpeg_rule(flowId: str, outputFlowId: str):
     rule_name = f"{rule_id_prefix}{flowId}"
-    events.remove_targets(
+    get_client("events").remove_targets(
         Rule=rule_name,
         EventBusName=event_bus_name,
         Ids=[outputFlowId],
     )
     targets = get_rule_targets(rule_name)
     if len(targets) == 0:
-        events.delete_rule(
+        get_client("events").delete_rule(
             Name=rule_name,
             EventBusName=event_bus_name,
         )
@@ -108,12 +106,12 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
 
 @tracer.capture_method(capture_response=False)
 def get_rule_names():
-    list_rules = events.list_rule_names_by_target(
+    list_rules = get_client("events").list_rule_names_by_target(
         TargetArn=queue_arn, EventBusName=event_bus_name
     )
     rules = list_rules["RuleNames"]
     while "NextToken" in list_rules:
-        list_rules = events.list_rule_names_by_target(
+        list_rules = get_client("events").list_rule_names_by_target(
             TargetArn=queue_arn,
             EventBusName=event_bus_name,
             NextToken=list_rules["NextToken"],
@@ -124,13 +122,13 @@ def get_rule_names():
 
 @tracer.capture_method(capture_response=False)
 def get_rule_targets(rule_name):
-    list_targets = events.list_targets_by_rule(
+    list_targets = get_client("events").list_targets_by_rule(
         Rule=rule_name,
         EventBusName=event_bus_name,
     )
     targets = list_targets["Targets"]
     while "NextToken" in list_targets:
-        list_targets = events.list_targets_by_rule(
+        list_targets = get_client("events").list_targets_by_rule(
             Rule=rule_name,
             EventBusName=event_bus_name,
             NextToken=list_targets["NextToken"],
@@ -153,11 +151,13 @@ def parse_rule_target(target):
 
 @tracer.capture_method(capture_response=False)
 def get_executions(state_machine_arn):
-    list_executions = sfn.list_executions(stateMachineArn=state_machine_arn)
+    list_executions = get_client("stepfunctions").list_executions(
+        stateMachineArn=state_machine_arn
+    )
     for execution in list_executions["executions"]:
         yield execution["executionArn"]
     while "NextToken" in list_executions:
-        list_executions = sfn.list_executions(
+        list_executions = get_client("stepfunctions").list_executions(
             stateMachineArn=state_machine_arn,
             NextToken=list_executions["NextToken"],
         )
@@ -167,7 +167,9 @@ def get_executions(state_machine_arn):
 
 @tracer.capture_method(capture_response=False)
 def get_job_details(execution_arn):
-    describe_execution = sfn.describe_execution(executionArn=execution_arn)
+    describe_execution = get_client("stepfunctions").describe_execution(
+        executionArn=execution_arn
+    )
     job_input = json.loads(describe_execution["input"])
     return job_input["inputFlow"], {
         "executionArn": describe_execution["executionArn"],
@@ -186,7 +188,9 @@ def get_job_details(execution_arn):
 
 @tracer.capture_method(capture_response=False)
 def get_export_details(execution_arn):
-    describe_execution = sfn.describe_execution(executionArn=execution_arn)
+    describe_execution = get_client("stepfunctions").describe_execution(
+        executionArn=execution_arn
+    )
     job_input = json.loads(describe_execution["input"])
     return {
         "executionArn": describe_execution["executionArn"],
@@ -1,9 +1,14 @@
 import concurrent.futures
+import contextlib
 import json
 import math
 import os
+import re
 import subprocess  # nosec B404 - subprocess call is safe as command input is controlled
+import threading
+import time
 import uuid
+from functools import lru_cache
 
 import boto3
 from aws_lambda_powertools import Logger, Metrics, Tracer
@@ -16,18 +21,65 @@ from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from mediatimestamp.immutable import TimeRange, Timestamp
 from botocore.config import Config
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+from lambda_init import add_init_duration_metric, get_client
 
 tracer = Tracer()
 logger = Logger()
 metrics = Metrics()
 batch_processor = BatchProcessor(event_type=EventType.SQS)
 
-s3 = boto3.client("s3")
-sqs = boto3.client("sqs")
 INGEST_QUEUE_URL = os.environ["INGEST_QUEUE_URL"]
 FFMPEG_BUCKET = os.environ["FFMPEG_BUCKET"]
 TAMS_MEDIA_BUCKET = os.environ["TAMS_MEDIA_BUCKET"]
+# Size of the reads from S3 that are written to ffmpeg
+STREAM_CHUNK_SIZE = 1_048_576
+# Memory allowed for each segment transcoded at once, for ffmpeg and upload parts
+SEGMENT_WORKER_MEMORY_MB = 1024
+SEGMENT_UPLOAD_CONCURRENCY = 2
+# Multipart uploads
+MIN_PART_SIZE = 5_242_880
+MAX_PART_COUNT = 10_000
+UPLOAD_CONCURRENCY = 8
+PART_RETRIES = 3
+MAX_COPY_PART_SIZE = 5_368_709_120
+# ffmpeg reads its inputs from pre-signed URLs that must outlast the function
+PRESIGNED_URL_EXPIRY = 3600
+# Output formats written front to back, so complete when piped. Formats such as
+# Matroska, FLAC and MP3 also pipe but then leave out the index or header they would
+# seek back to write, so they are written to /tmp like any format not listed here
+STREAMABLE_OUTPUT_FORMATS = {
+    "mpegts",
+    "adts",
+    "ac3",
+    "eac3",
+    "h264",
+    "hevc",
+    "mjpeg",
+    "image2pipe",
+}
+# MP4 formats, which only stream when fragmented
+FRAGMENTABLE_OUTPUT_FORMATS = {"mp4", "mov", "ipod", "ismv", "3gp", "3g2", "f4v", "psp"}
+# Any of these movflags or options make the MP4 muxer fragment its output
+FRAGMENTING_MOVFLAGS = {
+    "frag_keyframe",
+    "frag_custom",
+    "frag_every_frame",
+    "empty_moov",
+}
+FRAGMENTING_OPTIONS = ("-frag_duration", "-frag_size")
+client_lock = threading.Lock()
+
+
+@lru_cache()
+def get_signing_client():
+    """S3 client for pre-signed URLs, reused rather than created for every URL"""
+    with client_lock:
+        return boto3.client(
+            "s3",
+            region_name=os.environ["AWS_REGION"],
+            config=Config(signature_version="s3v4", s3={"addressing_style": "virtual"}),
+        )
 
 
 @tracer.capture_method(capture_response=False)
@@ -62,7 +114,7 @@ def calculate_ffmpeg_timing(segment):
 
 @tracer.capture_method(capture_response=False)
 def send_ingest_message(message_body):
-    sqs.send_message(
+    get_client("sqs").send_message(
         QueueUrl=INGEST_QUEUE_URL,
         MessageBody=json.dumps(message_body),
     )
@@ -70,74 +122,323 @@ def send_ingest_message(message_body):
 
 @tracer.capture_method(capture_response=False)
 def get_signed_url(bucket, obj, expires_in=60):
-    s3_cli = boto3.client(
-        "s3",
-        region_name=os.environ["AWS_REGION"],
-        config=Config(signature_version="s3v4", s3={"addressing_style": "virtual"}),
-    )
-    presigned_url = s3_cli.generate_presigned_url(
+    presigned_url = get_signing_client().generate_presigned_url(
         "get_object", Params={"Bucket": bucket, "Key": obj}, ExpiresIn=expires_in
     )
     return presigned_url
 
 
+def get_part_size(expected_size=None, concurrency=UPLOAD_CONCURRENCY, memory_mb=None):
+    """
+    Size of the parts of a multipart upload.
+
+    An object of known size is split between the concurrent uploads, while a stream
+    of unknown size uses 50MB parts. Parts are limited so the parts held in memory
+    use at most a quarter of memory_mb, the memory of the function by default, but
+    are never smaller than S3 allows or so small that more than 10,000 are needed.
+    """
+    if memory_mb is None:
+        memory_mb = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "1024"))
+    # The parts being uploaded and the part being read are held in memory
+    memory_limit = memory_mb * 1_048_576 // 4 // (concurrency + 1)
+    part_size = math.ceil(expected_size / concurrency) if expected_size else 50_000_000
+    part_size = max(min(part_size, memory_limit), MIN_PART_SIZE)
+    if expected_size:
+        part_size = max(part_size, math.ceil(expected_size / MAX_PART_COUNT))
+    return part_size
+
+
+class MultipartUpload:
+    """
+    Multipart upload of an S3 object with several parts uploaded at once.
+
+    Parts are numbered in the order they are added. Adding a part blocks while
+    concurrency parts are in flight, so memory use is bounded however large the
+    object is. Failed parts are retried individually. Used as a context manager the
+    upload is completed when the block exits, or aborted if it raises once parts in
+    flight have finished.
+    """
+
+    def __init__(self, bucket, key, concurrency=UPLOAD_CONCURRENCY):
+        self.bucket = bucket
+        self.key = key
+        self._concurrency = concurrency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._futures = []
+        self._executor = None
+        self._upload_id = None
+
+    def __enter__(self):
+        self._upload_id = get_client("s3").create_multipart_upload(
+            Bucket=self.bucket, Key=self.key
+        )["UploadId"]
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._concurrency
+        )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                self.complete()
+                return
+            except Exception:
+                self.abort()
+                raise
+        self.abort()
+
+    def _submit(self, upload, **kwargs):
+        # Fail early rather than uploading the rest of an object that cannot complete
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise future.exception()
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(
+                self._upload_with_retries, upload, len(self._futures) + 1, **kwargs
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_with_retries(self, upload, part_number, **kwargs):
+        for attempt in range(PART_RETRIES + 1):
+            try:
+                return upload(part_number, **kwargs)
+            except (BotoCoreError, ClientError) as ex:
+                if attempt == PART_RETRIES:
+                    raise
+                logger.warning(f"Retrying part {part_number} after error: {ex}")
+                time.sleep(0.5 * 2**attempt)
+
+    def _upload_part(self, part_number, data):
+        logger.info(f"Uploading part {part_number}...")
+        part = get_client("s3").upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=data,
+            PartNumber=part_number,
+            UploadId=self._upload_id,
+        )
+        return {"PartNumber": part_number, "ETag": part["ETag"]}
+
+    def _upload_part_copy(self, part_number, bucket, key, start, end):
+        logger.info(f"Copying part {part_number} from s3://{bucket}/{key}...")
+        part = get_client("s3").upload_part_copy(
+            Bucket=self.bucket,
+            Key=self.key,
+            PartNumber=part_number,
+            UploadId=self._upload_id,
+            CopySource={"Bucket": bucket, "Key": key},
+            CopySourceRange=f"bytes={start}-{end - 1}",
+        )
+        return {"PartNumber": part_number, "ETag": part["CopyPartResult"]["ETag"]}
+
+    def add_part(self, data):
+        """Queue bytes to be uploaded as the next part"""
+        self._submit(self._upload_part, data=data)
+
+    def add_copy_parts(self, bucket, key, start, end, part_size=MAX_COPY_PART_SIZE):
+        """
+        Queue bytes start to end of an existing object to be copied by S3 as the next
+        parts, without passing through the function. Ranges larger than part_size are
+        split into equal parts.
+        """
+        part_size = min(part_size, MAX_COPY_PART_SIZE)
+        part_count = math.ceil((end - start) / part_size)
+        for index in range(part_count):
+            self._submit(
+                self._upload_part_copy,
+                bucket=bucket,
+                key=key,
+                start=start + (end - start) * index // part_count,
+                end=start + (end - start) * (index + 1) // part_count,
+            )
+
+    def complete(self):
+        parts = [future.result() for future in self._futures]
+        self._executor.shutdown()
+        logger.info("Completing multi part upload...")
+        get_client("s3").complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+
+    def abort(self):
+        # Parts still uploading when an upload is aborted would be stored, so wait
+        self._executor.shutdown(cancel_futures=True)
+        try:
+            get_client("s3").abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+            )
+        except (BotoCoreError, ClientError) as err:
+            # The error that caused the abort is the one raised
+            logger.error(f"Error aborting multipart upload: {err}")
+
+
+def read_parts(stream, part_size):
+    """Read a binary stream in parts of part_size bytes, the last may be shorter"""
+    while data := stream.read(part_size):
+        yield data
+
+
 @tracer.capture_method(capture_response=False)
-def s3_upload(data, bucket, prefix):
-    part_size = 50_000_000  # 50MB chunks
+def s3_upload_stream(
+    stream,
+    bucket,
+    prefix,
+    concurrency=UPLOAD_CONCURRENCY,
+    memory_mb=None,
+    before_complete=None,
+    expected_size=None,
+):
+    """
+    Upload a binary stream as it is read, such as the output of ffmpeg.
+
+    Parts are uploaded while the next is read, so the upload keeps up with whatever
+    is writing to the stream and only the parts in flight are held in memory.
+
+    Args:
+        stream: Binary file-like object to read until EOF
+        bucket: Bucket to upload to
+        prefix: Prefix of the key, which ends with a random identifier
+        concurrency: Number of parts to upload at once
+        memory_mb: Memory the parts may use a quarter of, the function's by default
+        before_complete: Called once the stream is read and before the upload is
+            completed, so an exception from it leaves no object behind
+        expected_size: Size of the stream where it is known, such as a file
+
+    Returns:
+        The key of the uploaded object
+    """
     key = f"{prefix}{str(uuid.uuid4())}"
-    if len(data) < part_size:
+    part_size = get_part_size(expected_size, concurrency, memory_mb)
+    parts = read_parts(stream, part_size)
+    first_part = next(parts, b"")
+    if len(first_part) < part_size:
         logger.info(
             "Upload smaller than threshold so performing upload in one chunk..."
         )
-        s3.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=data,
+        if before_complete is not None:
+            before_complete()
+        get_client("s3").put_object(Bucket=bucket, Key=key, Body=first_part)
+        return key
+    logger.info("Upload larger than threshold so using multi-part upload...")
+    with MultipartUpload(bucket, key, concurrency) as upload:
+        upload.add_part(first_part)
+        del first_part
+        for data in parts:
+            upload.add_part(data)
+        if before_complete is not None:
+            before_complete()
+    return key
+
+
+def write_stream(body, stdin):
+    """
+    Copy a streaming S3 body to the stdin of a process, then close it.
+
+    Raises BrokenPipeError when the process stops reading before the end of body.
+    """
+    try:
+        for chunk in body.iter_chunks(STREAM_CHUNK_SIZE):
+            stdin.write(chunk)
+        # Flushes what is buffered, so also fails when the process stopped reading
+        stdin.close()
+    except BrokenPipeError as ex:
+        raise BrokenPipeError(
+            ex.errno, "Process stopped reading before the end of its input"
+        ) from ex
+    finally:
+        body.close()
+        with contextlib.suppress(BrokenPipeError):
+            stdin.close()
+
+
+def format_args(args_list):
+    """Format arguments for logging, without the signatures of pre-signed URLs"""
+    return " ".join(
+        a.split("?", 1)[0] if a.startswith("https://") else a for a in args_list
+    )
+
+
+def upload_ffmpeg_output(args_list, bucket, prefix, body=None, **upload_args):
+    """
+    Run ffmpeg writing to pipe:1 and upload its output as it is produced.
+
+    The upload is only completed once ffmpeg has exited successfully and all of body
+    was written to it, otherwise it raises without leaving an object behind.
+
+    Args:
+        args_list: The ffmpeg command line, with pipe:1 as the output
+        bucket: Bucket to upload the output to
+        prefix: Prefix of the key of the output
+        body: Streaming S3 body to write to ffmpeg on another thread when it reads
+            pipe:0
+        **upload_args: Passed on to s3_upload_stream
+
+    Returns:
+        The key of the uploaded output
+    """
+    logger.info(format_args(args_list))
+    p = subprocess.Popen(
+        args_list,
+        shell=False,  # nosec B603 - subprocess call is safe as command input is controlled
+        stdin=subprocess.DEVNULL if body is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        writer = (
+            executor.submit(write_stream, body, p.stdin) if body is not None else None
         )
-    else:
+
+        def check_ffmpeg():
+            # ffmpeg exits 0 when its input ends early, so the output is only kept
+            # once all the input was written as well as ffmpeg succeeding. ffmpeg
+            # stops reading when it fails, in which case its error is raised
+            p.wait()
+            write_error = writer.exception() if writer is not None else None
+            if p.returncode != 0:
+                raise subprocess.CalledProcessError(
+                    returncode=p.returncode, cmd=format_args(args_list)
+                ) from write_error
+            if write_error is not None:
+                raise write_error
+
         try:
-            logger.info("Upload larger than threshold so using multi-part upload...")
-            # Initiate multipart upload
-            mpu = s3.create_multipart_upload(Bucket=bucket, Key=key)
-            # Copy parts
-            parts = []
-            for part_number in range(math.ceil(len(data) / part_size)):
-                # Calculate byte range for this part
-                start_byte = part_number * part_size
-                end_byte = min(start_byte + part_size, len(data))
-                logger.info(f"Uploading part {part_number + 1}...")
-                part = s3.upload_part(
-                    Bucket=bucket,
-                    Key=key,
-                    Body=data[start_byte:end_byte],
-                    PartNumber=part_number + 1,
-                    UploadId=mpu["UploadId"],
+            with p.stdout:
+                return s3_upload_stream(
+                    p.stdout,
+                    bucket,
+                    prefix,
+                    before_complete=check_ffmpeg,
+                    **upload_args,
                 )
-                parts.append({"PartNumber": part_number + 1, "ETag": part["ETag"]})
-            # Complete multipart upload
-            logger.info("Completing multi part upload...")
-            s3.complete_multipart_upload(
-                Bucket=bucket,
-                Key=key,
-                UploadId=mpu["UploadId"],
-                MultipartUpload={"Parts": parts},
-            )
-        except Exception as ex:
-            if "mpu" in locals():
-                try:
-                    s3.abort_multipart_upload(
-                        Bucket=bucket,
-                        Key=key,
-                        UploadId=mpu["UploadId"],
-                    )
-                except ClientError as err:
-                    logger.error(f"Error aborting multipart upload: {err}")
-            raise ex
-    return key
+        except Exception:
+            # Stops the writer too, as ffmpeg no longer reads its input
+            p.kill()
+            raise
+        finally:
+            p.wait()
 
 
 @tracer.capture_method(capture_response=False)
-def execute_ffmpeg_memory(input_bytes, ffmpeg_command, timing_args):
+def execute_ffmpeg_stream(body, ffmpeg_command, timing_args, bucket, prefix):
+    """
+    Transcode a streaming S3 body with ffmpeg, uploading the output as it is produced.
+
+    The input is written to ffmpeg on another thread while its output is uploaded,
+    so memory use does not depend on the size of the segment.
+
+    Returns:
+        The key of the uploaded output
+    """
     args_list = [
         "/opt/bin/ffmpeg",
         "-hide_banner",
@@ -158,18 +459,14 @@ def execute_ffmpeg_memory(input_bytes, ffmpeg_command, timing_args):
         *[str(a) for k, v in ffmpeg_command.items() for a in [k, v] if a is not None],
         "pipe:1",
     ]
-    logger.info(" ".join(args_list))
-    p = subprocess.Popen(
+    return upload_ffmpeg_output(
         args_list,
-        shell=False,  # nosec B603 - subprocess call is safe as command input is controlled
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
+        bucket,
+        prefix,
+        body=body,
+        concurrency=SEGMENT_UPLOAD_CONCURRENCY,
+        memory_mb=SEGMENT_WORKER_MEMORY_MB,
     )
-    stdout, _ = p.communicate(input=input_bytes)
-    if p.returncode != 0:
-        raise subprocess.CalledProcessError(returncode=p.returncode, cmd=ffmpeg_command)
-    else:
-        return stdout
 
 
 @tracer.capture_method(capture_response=False)
@@ -182,7 +479,7 @@ def execute_ffmpeg_file(input_list, ffmpeg_command, output_path):
         output_path,
         "-y",
     ]
-    logger.info(" ".join(args_list))
+    logger.info(format_args(args_list))
     subprocess.run(
         args_list,
         check=True,
@@ -190,153 +487,228 @@ def execute_ffmpeg_file(input_list, ffmpeg_command, output_path):
     )
 
 
+def needs_seekable_output(ffmpeg_command):
+    """
+    Whether the output has to be written to a file rather than piped.
+
+    Only formats known to stream are piped, which includes fragmented MP4. Any other
+    format, or a command without -f, is written to a file.
+    """
+    output_format = ffmpeg_command.get("-f")
+    if output_format in STREAMABLE_OUTPUT_FORMATS:
+        return False
+    if output_format in FRAGMENTABLE_OUTPUT_FORMATS:
+        # Flags are set as flag1+flag2, with a leading - clearing the flag instead
+        movflags = re.findall(r"(?:^|\+)(\w+)", ffmpeg_command.get("-movflags") or "")
+        return not (
+            FRAGMENTING_MOVFLAGS.intersection(movflags)
+            or any(ffmpeg_command.get(option) for option in FRAGMENTING_OPTIONS)
+        )
+    return True
+
+
 @tracer.capture_method(capture_response=False)
-def download_object(obj):
-    bucket = obj["bucket"]
-    key = obj["key"]
-    download_path = f'/tmp/{key.rsplit("/", 1)[-1]}'  # nosec B108 - /tmp folder used for ephemeral storage
-    logger.info(f"Downloading s3://{bucket}/{key}...")
-    with open(download_path, "wb") as data:
-        s3.download_fileobj(bucket, key, data)
-    return download_path
+def execute_ffmpeg_upload(input_list, ffmpeg_command, bucket, prefix):
+    """
+    Run ffmpeg on inputs such as pre-signed URLs and upload its output.
+
+    The output is piped to the upload as it is produced, unless the format has to
+    seek back into its output. Such output is written to /tmp and uploaded from the
+    file as it is read.
+
+    Returns:
+        The key of the uploaded output
+    """
+    if needs_seekable_output(ffmpeg_command):
+        output_path = f"/tmp/{str(uuid.uuid4())}"  # nosec B108 - /tmp folder used for ephemeral storage
+        try:
+            execute_ffmpeg_file(input_list, ffmpeg_command, output_path)
+            logger.info("Uploading output to S3...")
+            with open(output_path, mode="rb") as file:
+                return s3_upload_stream(
+                    file, bucket, prefix, expected_size=os.path.getsize(output_path)
+                )
+        finally:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+    args_list = [
+        "/opt/bin/ffmpeg",
+        "-hide_banner",
+        *input_list,
+        *[a for k, v in ffmpeg_command.items() for a in [k, v] if a],
+        "pipe:1",
+    ]
+    return upload_ffmpeg_output(args_list, bucket, prefix)
+
+
+def get_segment_workers(segment_count):
+    """Number of segments to transcode at once, limited by vCPUs and memory"""
+    memory_mb = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "1024"))
+    workers = min(os.cpu_count() or 1, memory_mb // SEGMENT_WORKER_MEMORY_MB)
+    return max(1, min(workers, segment_count))
 
 
 @tracer.capture_method(capture_response=False)
-def download_objects_parallel(s3_objects):
-    futures = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for s3_object in s3_objects:
-            futures.append(executor.submit(download_object, s3_object))
-    return [future.result() for future in futures]
+def process_segment(message, segment):
+    logger.info(f'Processing Object Id: {segment["object_id"]}...')
+    timing_args = calculate_ffmpeg_timing(segment)
+    get_segment = get_client("s3").get_object(
+        Bucket=TAMS_MEDIA_BUCKET, Key=segment["object_id"]
+    )
+    logger.info("Transcoding and uploading output to S3...")
+    key = execute_ffmpeg_stream(
+        get_segment["Body"],
+        message["ffmpeg"]["command"],
+        timing_args,
+        message["outputBucket"],
+        message["outputPrefix"],
+    )
+    logger.info(
+        f'Processing complete, Timerange: {segment["timerange"]}, FlowId: {message["outputFlow"]}...'
+    )
+    logger.info(f"Sending SQS message to {INGEST_QUEUE_URL}...")
+    send_ingest_message(
+        {
+            "flowId": message["outputFlow"],
+            "timerange": segment["timerange"],
+            "uri": f's3://{message["outputBucket"]}/{key}',
+            "deleteSource": True,
+        }
+    )
 
 
 @tracer.capture_method(capture_response=False)
 def process_message(message):
-    for segment in message.get("segments", []):
-        logger.info(f'Processing Object Id: {segment["object_id"]}...')
-        timing_args = calculate_ffmpeg_timing(segment)
-        get_segment = s3.get_object(Bucket=TAMS_MEDIA_BUCKET, Key=segment["object_id"])
-        output = execute_ffmpeg_memory(
-            get_segment["Body"].read(),
-            message["ffmpeg"]["command"],
-            timing_args,
-        )
-        logger.info("Uploading output to S3...")
-        key = s3_upload(output, message["outputBucket"], message["outputPrefix"])
-        logger.info(
-            f'Processing complete, Timerange: {segment["timerange"]}, FlowId: {message["outputFlow"]}...'
-        )
-        logger.info(f"Sending SQS message to {INGEST_QUEUE_URL}...")
-        send_ingest_message(
-            {
-                "flowId": message["outputFlow"],
-                "timerange": segment["timerange"],
-                "uri": f's3://{message["outputBucket"]}/{key}',
-                "deleteSource": True,
-            }
-        )
+    """
+    Transcode the segments of a message concurrently.
+
+    The ingest message for each segment is sent as soon as it has been uploaded. If
+    a segment fails, segments that have not started are cancelled and the error is
+    raised once those in progress have finished.
+    """
+    segments = message.get("segments", [])
+    if not segments:
+        return
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=get_segment_workers(len(segments))
+    )
+    try:
+        futures = [
+            executor.submit(process_segment, message, segment) for segment in segments
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
 
 
 @tracer.capture_method(capture_response=False)
 def ffmpeg_concat(message):
-    logger.info("Downloading segments to /tmp...")
-    download_paths = download_objects_parallel(message["s3Objects"])
-    logger.info("Executing FFmpeg concat...")
-    execute_ffmpeg_file(
-        ["-i", f'concat:{"|".join(download_paths)}'],
-        message["ffmpeg"]["command"],
-        "/tmp/ffmpegOutput",  # nosec B108 - /tmp folder used for ephemeral storage
-    )
-    logger.info("Deleting downloaded segments...")
-    for tmp_path in download_paths:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-    logger.info("Uploading output to S3...")
-    with open(
-        "/tmp/ffmpegOutput", mode="rb"
-    ) as file:  # nosec B108 - /tmp folder used for ephemeral storage
-        fileContent = file.read()
-    output_key = s3_upload(fileContent, message["outputBucket"], "concat/")
-    logger.info("Deleting ffmpeg output...")
-    if os.path.exists(
-        "/tmp/ffmpegOutput"
-    ):  # nosec B108 - /tmp folder used for ephemeral storage
-        os.remove(
-            "/tmp/ffmpegOutput"
-        )  # nosec B108 - /tmp folder used for ephemeral storage
+    """
+    Concatenate segments with ffmpeg, which reads them from pre-signed URLs.
+
+    The URLs are listed in a file read with the concatf protocol, so the command line
+    does not grow with the number of segments. concatf was added in FFmpeg 5.1, and the
+    FFmpeg layer is built from the latest FFmpeg build.
+    """
+    list_path = f"/tmp/{str(uuid.uuid4())}.txt"  # nosec B108 - /tmp folder used for ephemeral storage
+    with open(list_path, mode="w", encoding="utf-8") as file:
+        for s3_object in message["s3Objects"]:
+            url = get_signed_url(
+                s3_object["bucket"], s3_object["key"], PRESIGNED_URL_EXPIRY
+            )
+            file.write(f"{url}\n")
+    try:
+        logger.info("Executing FFmpeg concat...")
+        output_key = execute_ffmpeg_upload(
+            ["-i", f"concatf:{list_path}"],
+            message["ffmpeg"]["command"],
+            message["outputBucket"],
+            "concat/",
+        )
+    finally:
+        os.remove(list_path)
     return {"s3Object": {"bucket": message["outputBucket"], "key": output_key}}
 
 
+def get_object_sizes(s3_objects):
+    def get_object_size(obj):
+        return get_client("s3").head_object(Bucket=obj["bucket"], Key=obj["key"])[
+            "ContentLength"
+        ]
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=UPLOAD_CONCURRENCY
+    ) as executor:
+        return list(executor.map(get_object_size, s3_objects))
+
+
+def read_object(bucket, key, start=None, end=None):
+    """Read an object, or bytes start to end of it"""
+    byte_range = {} if start is None else {"Range": f"bytes={start}-{end - 1}"}
+    return (
+        get_client("s3").get_object(Bucket=bucket, Key=key, **byte_range)["Body"].read()
+    )
+
+
 @tracer.capture_method(capture_response=False)
 def file_concat(message):
+    """
+    Append MPEG-TS segments into a single object.
+
+    Segments of at least the minimum part size are copied into the output by S3 with
+    UploadPartCopy. Only smaller segments are read and uploaded by the function,
+    buffered until they make up a part. When a buffer that is too small to be a part
+    is followed by a large segment, it is topped up with the start of that segment.
+    """
     bytes_buffer = bytearray()
-    part_size = 50_000_000  # 50MB chunks
     output_bucket = message["outputBucket"]
     output_key = f"concat/{str(uuid.uuid4())}"
-    try:
-        mpu = s3.create_multipart_upload(Bucket=output_bucket, Key=output_key)
-        parts = []
-        part_number = 1
-        for obj in message["s3Objects"]:
+    s3_objects = message["s3Objects"]
+    # Every copied segment is at least one part, which must fit in the part limit
+    if len(s3_objects) < MAX_PART_COUNT:
+        object_sizes = get_object_sizes(s3_objects)
+    else:
+        object_sizes = [0] * len(s3_objects)
+    part_size = get_part_size(sum(object_sizes) or None)
+    with contextlib.ExitStack() as stack:
+        upload = None
+        for obj, object_size in zip(s3_objects, object_sizes):
             bucket = obj["bucket"]
             key = obj["key"]
+            top_up = max(MIN_PART_SIZE - len(bytes_buffer), 0) if bytes_buffer else 0
+            if object_size - top_up >= MIN_PART_SIZE:
+                upload = upload or stack.enter_context(
+                    MultipartUpload(output_bucket, output_key)
+                )
+                if bytes_buffer:
+                    if top_up:
+                        logger.info(f"Reading start of s3://{bucket}/{key}...")
+                        bytes_buffer.extend(read_object(bucket, key, 0, top_up))
+                    upload.add_part(bytes_buffer)
+                    bytes_buffer = bytearray()
+                upload.add_copy_parts(bucket, key, top_up, object_size)
+                continue
             logger.info(f"Reading s3://{bucket}/{key}...")
-            get_object = s3.get_object(Bucket=bucket, Key=key)
-            bytes_buffer.extend(get_object["Body"].read())
-            if len(bytes_buffer) > part_size:
-                logger.info(f"Uploading part {part_number}...")
-                part = s3.upload_part(
-                    Bucket=output_bucket,
-                    Key=output_key,
-                    Body=bytes_buffer,
-                    PartNumber=part_number,
-                    UploadId=mpu["UploadId"],
+            bytes_buffer.extend(read_object(bucket, key))
+            if len(bytes_buffer) >= part_size:
+                upload = upload or stack.enter_context(
+                    MultipartUpload(output_bucket, output_key)
                 )
+                upload.add_part(bytes_buffer)
                 bytes_buffer = bytearray()
-                parts.append({"PartNumber": part_number, "ETag": part["ETag"]})
-                part_number += 1
-        if len(parts) > 0:
-            logger.info(f"Uploading part {part_number}...")
-            part = s3.upload_part(
-                Bucket=output_bucket,
-                Key=output_key,
-                Body=bytes_buffer,
-                PartNumber=part_number,
-                UploadId=mpu["UploadId"],
-            )
-            bytes_buffer = bytearray()
-            parts.append({"PartNumber": part_number, "ETag": part["ETag"]})
-            logger.info("Completing multi part upload...")
-            s3.complete_multipart_upload(
-                Bucket=output_bucket,
-                Key=output_key,
-                UploadId=mpu["UploadId"],
-                MultipartUpload={"Parts": parts},
-            )
+        if upload is not None:
+            if bytes_buffer:
+                upload.add_part(bytes_buffer)
         else:
             logger.info(
                 "Upload smaller than threshold so no need for multi-part upload..."
             )
-            s3.abort_multipart_upload(
-                Bucket=output_bucket,
-                Key=output_key,
-                UploadId=mpu["UploadId"],
-            )
-            s3.put_object(
+            get_client("s3").put_object(
                 Bucket=output_bucket,
                 Key=output_key,
                 Body=bytes_buffer,
             )
-    except Exception as ex:
-        try:
-            s3.abort_multipart_upload(
-                Bucket=output_bucket,
-                Key=output_key,
-                UploadId=mpu["UploadId"],
-            )
-        except ClientError as err:
-            logger.error(f"Error aborting multipart upload: {err}")
-        raise ex
     return {"s3Object": {"bucket": output_bucket, "key": output_key}}
 
 
@@ -354,53 +726,28 @@ def concat_action(message):
 
 @tracer.capture_method(capture_response=False)
 def move_s3_object(bucket, source_key, dest_key):
-    try:
-        head_object = s3.head_object(Bucket=bucket, Key=source_key)
-        object_size = head_object["ContentLength"]
-        # If object is smaller than 5GB, use simple copy
-        logger.info("Copying concat file to export location...")
-        if object_size < 5_000_000_000:
-            s3.copy_object(
-                CopySource={"Bucket": bucket, "Key": source_key},
-                Bucket=bucket,
-                Key=dest_key,
-            )
-        else:
-            mpu = s3.create_multipart_upload(Bucket=bucket, Key=dest_key)
-            parts = []
-            copied_bytes = 0
-            part_number = 1
-            part_size = 50_000_000  # 50MB chunks
-            while copied_bytes < object_size:
-                range_start = copied_bytes
-                range_end = min(copied_bytes + part_size - 1, object_size - 1)
-                part = s3.upload_part_copy(
-                    Bucket=bucket,
-                    Key=dest_key,
-                    PartNumber=part_number,
-                    UploadId=mpu["UploadId"],
-                    CopySource={"Bucket": bucket, "Key": source_key},
-                    CopySourceRange=f"bytes={range_start}-{range_end}",
-                )
-                parts.append(
-                    {"PartNumber": part_number, "ETag": part["CopyPartResult"]["ETag"]}
-                )
-                copied_bytes = range_end + 1
-                part_number += 1
-            s3.complete_multipart_upload(
-                Bucket=bucket,
-                Key=dest_key,
-                UploadId=mpu["UploadId"],
-                MultipartUpload={"Parts": parts},
-            )
-        logger.info("Deleting S3 concat file...")
-        s3.delete_object(Bucket=bucket, Key=source_key)
-    except ClientError as ex:
-        if "mpu" in locals():
-            s3.abort_multipart_upload(
-                Bucket=bucket, Key=dest_key, UploadId=mpu["UploadId"]
+    head_object = get_client("s3").head_object(Bucket=bucket, Key=source_key)
+    object_size = head_object["ContentLength"]
+    # If object is smaller than 5GB, use simple copy
+    logger.info("Copying concat file to export location...")
+    if object_size < 5_000_000_000:
+        get_client("s3").copy_object(
+            CopySource={"Bucket": bucket, "Key": source_key},
+            Bucket=bucket,
+            Key=dest_key,
+        )
+    else:
+        with MultipartUpload(bucket, dest_key) as upload:
+            # Split so the parts are copied concurrently
+            upload.add_copy_parts(
+                bucket,
+                source_key,
+                0,
+                object_size,
+                math.ceil(object_size / UPLOAD_CONCURRENCY),
             )
-        raise ex
+    logger.info("Deleting S3 concat file...")
+    get_client("s3").delete_object(Bucket=bucket, Key=source_key)
 
 
 @tracer.capture_method(capture_response=False)
@@ -419,38 +766,29 @@ def merge_action(message):
         logger.info(
             "Requested export format is not mpegts so proceeding with ffmpeg job."
         )
-    logger.info("Downloading concat files to /tmp...")
-    download_paths = download_objects_parallel(message["s3Objects"])
     logger.info("Executing FFmpeg merge...")
-    execute_ffmpeg_file(
-        [a for dp in download_paths for a in ["-i", dp]],
+    output_key = execute_ffmpeg_upload(
+        [
+            a
+            for s3_object in message["s3Objects"]
+            for a in [
+                "-i",
+                get_signed_url(
+                    s3_object["bucket"], s3_object["key"], PRESIGNED_URL_EXPIRY
+                ),
+            ]
+        ],
         message["ffmpeg"]["command"],
-        "/tmp/ffmpegOutput",  # nosec B108 - /tmp folder used for ephemeral storage
+        message["outputBucket"],
+        "export/",
     )
-    logger.info("Deleting downloaded concat files...")
-    for tmp_path in download_paths:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
     logger.info("Deleting S3 concat files...")
-    s3.delete_objects(
+    get_client("s3").delete_objects(
         Bucket=message["s3Objects"][0]["bucket"],
         Delete={
             "Objects": [{"Key": s3_object["key"]} for s3_object in message["s3Objects"]]
         },
     )
-    logger.info("Uploading output to S3...")
-    with open(
-        "/tmp/ffmpegOutput", mode="rb"
-    ) as file:  # nosec B108 - /tmp folder used for ephemeral storage
-        fileContent = file.read()
-    output_key = s3_upload(fileContent, message["outputBucket"], "export/")
-    logger.info("Deleting ffmpeg output...")
-    if os.path.exists(
-        "/tmp/ffmpegOutput"
-    ):  # nosec B108 - /tmp folder used for ephemeral storage
-        os.remove(
-            "/tmp/ffmpegOutput"
-        )  # nosec B108 - /tmp folder used for ephemeral storage
     return {"s3Object": {"bucket": message["outputBucket"], "key": output_key}}
 
 
@@ -466,6 +804,7 @@ def record_handler(record: SQSRecord) -> None:
 @metrics.log_metrics(capture_cold_start_metric=True)
 # pylint: disable=unused-argument
 def lambda_handler(event: dict, context: LambdaContext) -> dict:
+    add_init_duration_metric(metrics)
     if "Records" in event:
         return process_partial_response(
             event=event,
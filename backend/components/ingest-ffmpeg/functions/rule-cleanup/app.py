@@ -1,13 +1,12 @@
 import os
 
-import boto3
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
+from lambda_init import get_client
 
 tracer = Tracer()
 logger = Logger()
 
-events = boto3.client("events")
 queue_arn = os.environ["QUEUE_ARN"]
 event_bus_name = os.environ["EVENT_BUS_NAME"]
 rule_id_prefix = "ffmpeg-flow-segments-"
@@ -23,18 +22,18 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
         # Check if deleted flow was the rule trigger or deleted flow is the only rule target
         if (rule[len(rule_id_prefix) :] == flow_id) or (target_ids == [flow_id]):
             for target_id in target_ids:
-                events.remove_targets(
+                get_client("events").remove_targets(
                     Rule=rule,
                     EventBusName=event_bus_name,
                     Ids=[target_id],
                 )
-            events.delete_rule(
+            get_client("events").delete_rule(
                 Name=rule,
                 EventBusName=event_bus_name,
             )
         # Check if delete flow is a rule target
         elif flow_id in target_ids:
-            events.remove_targets(
+            get_client("events").remove_targets(
                 Rule=rule,
                 EventBusName=event_bus_name,
                 Ids=[flow_id],
@@ -43,13 +42,13 @@ def lambda_handler(event: dict, context: LambdaContext) -> dict:
 
 @tracer.capture_method(capture_response=False)
 def get_rule_names():
-    list_rules = events.list_rule_names_by_target(
+    list_rules = get_client("events").list_rule_names_by_target(
         TargetArn=queue_arn, EventBusName=event_bus_name
     )
     for rule in list_rules["RuleNames"]:
         yield rule
     while "NextToken" in list_rules:
-        list_rules = events.list_rule_names_by_target(
+        list_rules = get_client("events").list_rule_names_by_target(
             TargetArn=queue_arn,
             EventBusName=event_bus_name,
             NextToken=list_rules["NextToken"],
@@ -60,13 +59,13 @@ def get_rule_names():
 
 @tracer.capture_method(capture_response=False)
 def get_rule_targets(rule_name):
-    list_targets = events.list_targets_by_rule(
+    list_targets = get_client("events").list_targets_by_rule(
         Rule=rule_name,
         EventBusName=event_bus_name,
     )
     targets = list_targets["Targets"]
     while "NextToken" in list_targets:
-        list_targets = events.list_targets_by_rule(
+        list_targets = get_client("events").list_targets_by_rule(
             Rule=rule_name,
             EventBusName=event_bus_name,
             NextToken=list_targets["NextToken"],
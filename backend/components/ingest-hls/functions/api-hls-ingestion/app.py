@@ -2,21 +2,17 @@ import os
 from pathlib import Path
 from urllib.parse import urlparse
 
-import boto3
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.event_handler import APIGatewayHttpResolver, CORSConfig
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from botocore.exceptions import ClientError
+from lambda_init import get_client
 
 tracer = Tracer()
 logger = Logger()
 app = APIGatewayHttpResolver(cors=CORSConfig())
 
-mc = boto3.client("mediaconvert")
-ml = boto3.client("medialive")
-s3 = boto3.client("s3")
-sfn = boto3.client("stepfunctions")
 state_machine_arn = os.environ["STATE_MACHINE_ARN"]
 tams_endpoint = os.environ["TAMS_ENDPOINT"]
 
@@ -39,7 +35,7 @@ def manifest_exists(uri):
         return False
     try:
         uri_parse = urlparse(uri)
-        s3.head_object(
+        get_client("s3").head_object(
             Bucket=uri_parse.netloc,
             Key=uri_parse.path[1:],
         )
@@ -52,7 +48,7 @@ def manifest_exists(uri):
 @app.get("/job-ingestion")
 @tracer.capture_method(capture_response=False)
 def get_job_ingestions():
-    paginator = mc.get_paginator("list_jobs")
+    paginator = get_client("mediaconvert").get_paginator("list_jobs")
     jobs = []
     for page in paginator.paginate():
         for job in page["Jobs"]:
@@ -90,11 +86,13 @@ def get_job_ingestions():
 @app.get("/channel-ingestion")
 @tracer.capture_method(capture_response=False)
 def get_channel_ingestions():
-    paginator = ml.get_paginator("list_channels")
+    paginator = get_client("medialive").get_paginator("list_channels")
     channels = []
     for page in paginator.paginate():
         for channel in page["Channels"]:
-            describe_channel = ml.describe_channel(ChannelId=channel["Id"])
+            describe_channel = get_client("medialive").describe_channel(
+                ChannelId=channel["Id"]
+            )
             first_output_group_type = (
                 describe_channel.get("EncoderSettings", {})
                 .get("OutputGroups", [{}])[0]
@@ -124,7 +122,7 @@ def get_channel_ingestions():
 @app.get("/workflows")
 @tracer.capture_method(capture_response=False)
 def get_workflows():
-    paginator = sfn.get_paginator("list_executions")
+    paginator = get_client("stepfunctions").get_paginator("list_executions")
     workflows = []
     for page in paginator.paginate(stateMachineArn=state_machine_arn):
         for execution in page["executions"]:
@@ -7,7 +7,6 @@ from fractions import Fraction
 from functools import lru_cache
 from urllib.parse import urlparse
 
-import boto3
 import m3u8
 import requests
 from aws_lambda_powertools import Logger, Tracer, single_metric
@@ -15,21 +14,24 @@ from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from botocore.exceptions import ClientError
 from ffprobe import ffprobe_link
+from lambda_init import get_client
 
 tracer = Tracer()
 logger = Logger()
 
-ssm = boto3.client("ssm")
-s3 = boto3.client("s3")
 codec_parameter = os.environ["CODEC_PARAMETER"]
 containers_parameter = os.environ["CONTAINERS_PARAMETER"]
+# Manifests are usually fetched from a single origin so connections are kept alive
+session = requests.Session()
 
 
 @tracer.capture_method(capture_response=False)
 @lru_cache()
 def get_containers_mappings() -> dict:
     """Returns a dictionary of containers mappings from the parameter store"""
-    get_parameter = ssm.get_parameter(Name=containers_parameter)["Parameter"]
+    get_parameter = get_client("ssm").get_parameter(Name=containers_parameter)[
+        "Parameter"
+    ]
     return json.loads(get_parameter["Value"])
 
 
@@ -54,7 +56,9 @@ def map_container(probe: dict) -> str:
 @lru_cache()
 def get_codec_mappings() -> dict:
     """Returns a dictionary of codec mappings from the parameter store"""
-    get_parameter = ssm.get_parameter(Name=codec_parameter)["Parameter"]
+    get_parameter = get_client("ssm").get_parameter(Name=codec_parameter)[
+        "Parameter"
+    ]
     codecs_list = json.loads(get_parameter["Value"])
     return {codec["hls"]: codec["tams"] for codec in codecs_list}
 
@@ -121,12 +125,12 @@ def get_file(source: str) -> bytes:
     source_parse = urlparse(source)
     match source_parse.scheme:
         case "s3":
-            response = s3.get_object(
+            response = get_client("s3").get_object(
                 Bucket=source_parse.netloc, Key=source_parse.path[1:]
             )
             return response["Body"].read()
         case "https" | "http":
-            response = requests.get(source, timeout=30)
+            response = session.get(source, timeout=30)
             response.raise_for_status()
             return response.content
 
@@ -138,19 +142,19 @@ def get_last_modified(source: str) -> int:
     match source_parse.scheme:
         case "s3":
             try:
-                response = s3.head_object(
+                response = get_client("s3").head_object(
                     Bucket=source_parse.netloc, Key=source_parse.path[1:]
                 )
                 return int(response["LastModified"].timestamp())
             except ClientError as ex:
                 if ex.response["Error"]["Code"] == "404":
-                    raise s3.exceptions.NoSuchKey(
+                    raise get_client("s3").exceptions.NoSuchKey(
                         ex.response["Error"], "HeadObject"
                     ) from ex
                 else:
                     raise ex
         case "https" | "http":
-            response = requests.head(source, timeout=30)
+            response = session.head(source, timeout=30)
             response.raise_for_status()
             if response.headers.get("Last-Modified"):
                 return int(
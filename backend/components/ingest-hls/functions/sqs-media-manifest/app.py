@@ -1,10 +1,9 @@
 import json
 import os
 import time
-from urllib.parse import urlparse
 from fractions import Fraction
+from urllib.parse import urlparse
 
-import boto3
 import m3u8
 import requests
 from aws_lambda_powertools import Logger, Metrics, Tracer, single_metric
@@ -26,6 +25,7 @@ from aws_lambda_powertools.utilities.idempotency.persistence.datarecord import (
 )
 from mediatimestamp.immutable import TimeRange, Timestamp
 from ffprobe import ffprobe_link
+from lambda_init import get_client
 
 tracer = Tracer()
 logger = Logger()
@@ -48,9 +48,6 @@ idempotency_config = IdempotencyConfig(
     response_hook=idempotency_hook,
 )
 
-s3 = boto3.client("s3")
-sfn = boto3.client("stepfunctions")
-sqs = boto3.client("sqs")
 manifest_queue_url = os.environ["MANIFEST_QUEUE_URL"]
 ingest_queue_url = os.environ["INGEST_QUEUE_URL"]
 
@@ -64,7 +61,7 @@ def send_message_batch(messages: list) -> None:
         {"Id": str(i), "MessageBody": json.dumps(message)}
         for i, message in enumerate(messages)
     ]
-    sqs.send_message_batch(QueueUrl=ingest_queue_url, Entries=entries)
+    get_client("sqs").send_message_batch(QueueUrl=ingest_queue_url, Entries=entries)
 
 
 @tracer.capture_method(capture_response=False)
@@ -80,7 +77,7 @@ def get_file(source: str) -> bytes:
     source_parse = urlparse(source)
     match source_parse.scheme:
         case "s3":
-            response = s3.get_object(
+            response = get_client("s3").get_object(
                 Bucket=source_parse.netloc, Key=source_parse.path[1:]
             )
             return response["Body"].read()
@@ -172,10 +169,12 @@ def process_message(message: dict, task_token: str) -> None:
     send_message_batch(segments)
     # pylint: disable=no-member
     if manifest.is_endlist:
-        sfn.send_task_success(taskToken=task_token, output=json.dumps({}))
+        get_client("stepfunctions").send_task_success(
+            taskToken=task_token, output=json.dumps({})
+        )
     else:
-        sfn.send_task_heartbeat(taskToken=task_token)
-        sqs.send_message(
+        get_client("stepfunctions").send_task_heartbeat(taskToken=task_token)
+        get_client("sqs").send_message(
             QueueUrl=manifest_queue_url,
             MessageAttributes={
                 "TaskToken": {
@@ -205,7 +204,9 @@ def record_handler(record: SQSRecord) -> None:
             process_message(message=record.json_body, task_token=task_token)
         # pylint: disable=broad-exception-caught
         except Exception as ex:
-            sfn.send_task_failure(taskToken=task_token, error=str(ex))
+            get_client("stepfunctions").send_task_failure(
+                taskToken=task_token, error=str(ex)
+            )
 
 
 @logger.inject_lambda_context(log_event=True)
@@ -3,7 +3,6 @@ import os
 from datetime import datetime
 from urllib.parse import urlparse
 
-import boto3
 import requests
 from aws_lambda_powertools import Logger, Metrics, Tracer, single_metric
 from aws_lambda_powertools.metrics import MetricUnit
@@ -15,7 +14,9 @@ from aws_lambda_powertools.utilities.batch import (
     process_partial_response,
 )
 from botocore.exceptions import ClientError
+from lambda_init import add_init_duration_metric, get_client
 from openid_auth import Credentials
+from tams_client import TamsClient
 
 tracer = Tracer()
 logger = Logger()
@@ -23,12 +24,12 @@ metrics = Metrics()
 batch_processor = BatchProcessor(event_type=EventType.SQS)
 
 IMAGE_FORMAT = "urn:x-tam:format:image"
-s3 = boto3.client("s3")
 endpoint = os.environ["TAMS_ENDPOINT"]
 creds = Credentials(
     scopes=["tams-api/read", "tams-api/write"],
     secret_arn=os.environ["SECRET_ARN"],
 )
+tams = TamsClient(endpoint, creds)
 
 
 @tracer.capture_method(capture_response=False)
@@ -47,14 +48,14 @@ def get_file(source: str, byterange: str | None) -> bytes:
             if byterange:
                 params["Range"] = range_string
             try:
-                response = s3.get_object(**params)
+                response = get_client("s3").get_object(**params)
                 return response["Body"].read()
-            except s3.exceptions.NoSuchKey as ex:
+            except get_client("s3").exceptions.NoSuchKey as ex:
                 logger.error("NoSuchKey", error=ex.response["Error"])
                 return False
         case "https" | "http":
             headers = {"Range": f"bytes={range_string}"} if byterange else None
-            response = requests.get(source, headers=headers, timeout=30)
+            response = tams.session.get(source, headers=headers, timeout=30)
             return response.content
 
 
@@ -62,18 +63,10 @@ def get_file(source: str, byterange: str | None) -> bytes:
 def upload_file(flow_id: str, data: bytes, object_id: str | None) -> dict:
     """Uploads a file to the TAMS API"""
     logger.info("Requesting pre-signed PUT URL...")
-    get_url = requests.post(
-        f"{endpoint}/flows/{flow_id}/storage",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        data=json.dumps({"object_ids": [object_id]} if object_id else {"limit": 1}),
-        timeout=30,
-    )
     try:
-        get_url.raise_for_status()
-        logger.info(f"Response status: {get_url.status_code}")
+        media_object = tams.allocate_storage(
+            flow_id, object_ids=[object_id] if object_id else None
+        )[0]
     except requests.exceptions.HTTPError as ex:
         if ex.response.status_code == 404:
             logger.error(ex.response.text)
@@ -91,9 +84,8 @@ def upload_file(flow_id: str, data: bytes, object_id: str | None) -> dict:
             raise ex
         else:
             raise ex
-    media_object = get_url.json()["media_objects"][0]
     logger.info("Using pre-signed URL to put file in S3...")
-    put_file = requests.put(
+    put_file = tams.session.put(
         media_object["put_url"]["url"],
         headers={"Content-Type": media_object["put_url"]["content-type"]},
         data=data,
@@ -112,18 +104,8 @@ def post_segment(flow_id: str, segment_data: dict) -> bool:
     segment = {k: v for k, v in segment_data.items() if k not in excluded_fields}
 
     logger.info("Posting segment to TAMS...")
-    post = requests.post(
-        f"{endpoint}/flows/{flow_id}/segments",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        data=json.dumps(segment),
-        timeout=30,
-    )
     try:
-        post.raise_for_status()
-        logger.info(f"Response status: {post.status_code}")
+        tams.post_segments(flow_id, segment)
     except requests.exceptions.HTTPError as ex:
         if ex.response.status_code == 400:
             logger.error(ex.response.text, body=segment)
@@ -140,7 +122,9 @@ def delete_s3_file(source: str) -> None:
     match source_parse.scheme:
         case "s3":
             try:
-                s3.delete_object(Bucket=source_parse.netloc, Key=source_parse.path[1:])
+                get_client("s3").delete_object(
+                    Bucket=source_parse.netloc, Key=source_parse.path[1:]
+                )
             except ClientError as ex:
                 logger.error(ex)
 
@@ -148,13 +132,7 @@ def delete_s3_file(source: str) -> None:
 @tracer.capture_method(capture_response=False)
 def get_flow_format(flow_id: str) -> str:
     """Get the format of a flow"""
-    response = requests.get(
-        f"{endpoint}/flows/{flow_id}",
-        headers={"Authorization": f"Bearer {creds.token()}"},
-        timeout=30,
-    )
-    response.raise_for_status()
-    return response.json()["format"]
+    return tams.get_flow(flow_id)["format"]
 
 
 @tracer.capture_method(capture_response=False)
@@ -201,6 +179,7 @@ def record_handler(record: SQSRecord) -> None:
 @metrics.log_metrics(capture_cold_start_metric=True)
 # pylint: disable=unused-argument
 def lambda_handler(event: SQSEvent, context: LambdaContext) -> dict:
+    add_init_duration_metric(metrics)
     return process_partial_response(
         event=event,
         record_handler=record_handler,
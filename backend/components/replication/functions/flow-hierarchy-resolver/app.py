@@ -1,83 +1,69 @@
+import asyncio
 import json
-from typing import Any
-import requests
-import boto3
+import os
+from typing import TYPE_CHECKING, Any
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+from lambda_init import get_client
 from openid_auth import Credentials
+from tams_client import get_timerange_shards
+
+if TYPE_CHECKING:
+    from tams_client_async import AsyncTamsClient
 
 tracer = Tracer()
 logger = Logger()
 
-eventbridge = boto3.client("events")
-secrets_manager = boto3.client("secretsmanager")
+# Backfill of each flow is split into this many timeranges listed in parallel
+segment_list_shards = int(os.environ.get("SEGMENT_LIST_SHARDS", "8"))
 
 
-@tracer.capture_method(capture_response=False)
-def get_flow(creds: Credentials, endpoint: str, flow_id: str) -> dict[str, Any]:
+# The coroutines below run concurrently on one thread so are traced as a whole by
+# resolve_flows rather than individually
+async def get_flow(tams: "AsyncTamsClient", flow_id: str) -> dict[str, Any]:
     """
     Retrieve flow information from the TAMS API.
 
     Args:
-        creds: The OAuth2 creds object from which to retrieve the access token
-        endpoint: The TAMS API endpoint to use
+        tams: The client for the TAMS API to use
         flow_id: The unique identifier of the flow to retrieve
 
     Returns:
         The flow data as a dictionary
     """
-    get = requests.get(
-        f"{endpoint}/flows/{flow_id}?include_timerange=true",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
-    )
-    get.raise_for_status()
-    return get.json()
+    return await tams.get_flow(flow_id, include_timerange=True)
 
 
-@tracer.capture_method(capture_response=False)
-def get_flows_by_source(
-    creds: Credentials, endpoint: str, source_id: str
+async def get_flows_by_source(
+    tams: "AsyncTamsClient", source_id: str
 ) -> list[dict[str, Any]]:
     """
     Retrieve flow information for the supplied source_id from the TAMS API.
 
     Args:
-        creds: The OAuth2 creds object from which to retrieve the access token
-        endpoint: The TAMS API endpoint to use
+        tams: The client for the TAMS API to use
         source_id: The unique identifier of the source to retrieve the flows for
 
     Returns:
         A list of flow data as a dictionary
     """
-    get = requests.get(
-        f"{endpoint}/flows?source_id={source_id}",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
-    )
-    get.raise_for_status()
-    return get.json()
+    return await tams.get_flows(source_id=source_id)
 
 
-@tracer.capture_method
-def resolve_flow_hierarchy(
-    creds: Credentials,
-    endpoint: str,
+async def resolve_flow_hierarchy(
+    tams: "AsyncTamsClient",
     flow_id: str,
     flow_tree: dict[str, dict[str, Any]] = None,
 ) -> dict[str, dict[str, Any]]:
     """
     Recursively resolve the full hierarchy tree from an initial flow_id.
 
+    Child flows are resolved concurrently.
+
     Args:
-        creds: The OAuth2 creds object from which to retrieve the access token
-        endpoint: The TAMS API endpoint to use
+        tams: The client for the TAMS API to use
         flow_id: The unique identifier of the flow to start with
         flow_tree: Dictionary to store the flow hierarchy (used in recursion)
 
@@ -88,24 +74,72 @@ def resolve_flow_hierarchy(
     if flow_tree is None:
         flow_tree = {}
 
-    # Skip if we've already processed this flow
+    # Skip if we've already processed or started processing this flow
     if flow_id in flow_tree:
         return flow_tree
+    flow_tree[flow_id] = {}
 
     # Get flow details
-    flow_details = get_flow(creds, endpoint, flow_id)
+    flow_details = await get_flow(tams, flow_id)
     flow_tree[flow_id] = flow_details
 
     # Check if this flow has a flow_collection
     if "flow_collection" in flow_details and flow_details["flow_collection"]:
-        for child_flow in flow_details["flow_collection"]:
-            if "id" in child_flow:
-                # Recursively process each child flow
-                resolve_flow_hierarchy(creds, endpoint, child_flow["id"], flow_tree)
+        # Recursively process each child flow
+        await asyncio.gather(
+            *(
+                resolve_flow_hierarchy(tams, child_flow["id"], flow_tree)
+                for child_flow in flow_details["flow_collection"]
+                if "id" in child_flow
+            )
+        )
 
     return flow_tree
 
 
+async def resolve_source_hierarchy(
+    tams: "AsyncTamsClient", source_id: str
+) -> dict[str, dict[str, Any]]:
+    """
+    Resolve the hierarchy trees of every flow of a source.
+
+    Args:
+        tams: The client for the TAMS API to use
+        source_id: The unique identifier of the source
+
+    Returns:
+        Dictionary containing the flow hierarchy trees
+    """
+    flows = {}
+    flow_list = await get_flows_by_source(tams, source_id)
+    await asyncio.gather(
+        *(resolve_flow_hierarchy(tams, flow["id"], flows) for flow in flow_list)
+    )
+    return flows
+
+
+@tracer.capture_method(capture_response=False)
+def resolve_flows(
+    tams: "AsyncTamsClient", source_id: str | None, flow_id: str | None
+) -> dict[str, dict[str, Any]]:
+    """
+    Resolve the flow hierarchy of a source or a flow.
+
+    Args:
+        tams: The client for the TAMS API to use
+        source_id: The unique identifier of the source, takes precedence over flow_id
+        flow_id: The unique identifier of the flow
+
+    Returns:
+        Dictionary containing the flow hierarchy tree, empty when neither is given
+    """
+    if source_id:
+        return tams.run(resolve_source_hierarchy(tams, source_id))
+    if flow_id:
+        return tams.run(resolve_flow_hierarchy(tams, flow_id))
+    return {}
+
+
 @tracer.capture_method(capture_response=False)
 def get_connection_secret_values(connection_arn: str) -> dict[str, str]:
     """
@@ -124,7 +158,7 @@ def get_connection_secret_values(connection_arn: str) -> dict[str, str]:
     connection_name = connection_arn.split("/")[1]
 
     # Get connection details
-    connection_response = eventbridge.describe_connection(Name=connection_name)
+    connection_response = get_client("events").describe_connection(Name=connection_name)
 
     # Extract the secret ARN from the connection
     secret_arn = connection_response.get("SecretArn")
@@ -132,7 +166,7 @@ def get_connection_secret_values(connection_arn: str) -> dict[str, str]:
         raise ValueError(f"Secret ARN not found in connection: {connection_arn}")
 
     # Get the secret value
-    secret_response = secrets_manager.get_secret_value(SecretId=secret_arn)
+    secret_response = get_client("secretsmanager").get_secret_value(SecretId=secret_arn)
 
     # Parse the secret value
     secret_string = secret_response.get("SecretString")
@@ -193,6 +227,38 @@ def topological_sort_flows(flows: list[dict[str, Any]]) -> list[dict[str, Any]]:
     return ordered_flows
 
 
+@tracer.capture_method(capture_response=False)
+def get_flow_timerange_shards(
+    flows: list[dict[str, Any]], timerange: str | None
+) -> dict[str, list[str]]:
+    """
+    Split the timerange to replicate of each flow into shards that can be listed
+    concurrently.
+
+    Args:
+        flows: List of flow dictionaries, including their timerange
+        timerange: The timerange to replicate, None for the whole of each flow
+
+    Returns:
+        Dictionary mapping flow IDs to their shards, empty when there is nothing
+        to replicate
+    """
+    shards = {}
+    for flow in flows:
+        segment_duration = flow.get("segment_duration")
+        shards[flow["id"]] = get_timerange_shards(
+            timerange or "_",
+            flow.get("timerange", "()"),
+            segment_list_shards,
+            (
+                segment_duration["numerator"] / segment_duration.get("denominator", 1)
+                if segment_duration
+                else 0
+            ),
+        )
+    return shards
+
+
 @logger.inject_lambda_context(log_event=True)
 @tracer.capture_lambda_handler
 # pylint: disable=unused-argument
@@ -209,13 +275,20 @@ def lambda_handler(
 
     source_id = event.pop("sourceId", None)
     flow_id = event.pop("flowId", None)
-    endpoint = event["originEndpoint"]
-
-    flows = {}
-    if source_id:
-        flow_list = get_flows_by_source(creds, endpoint, source_id)
-        for flow in flow_list:
-            flows.update(resolve_flow_hierarchy(creds, endpoint, flow["id"], flows))
-    elif flow_id:
-        flows = resolve_flow_hierarchy(creds, endpoint, flow_id)
-    return {**event, "flows": topological_sort_flows(flows.values())}
+    # aiohttp is slow to import so is left out of the init phase
+    # pylint: disable=import-outside-toplevel
+    from tams_client_async import AsyncTamsClient
+
+    # The endpoint differs between invocations so the client is not kept
+    tams = AsyncTamsClient(event["originEndpoint"], creds)
+    try:
+        flows = resolve_flows(tams, source_id, flow_id)
+    finally:
+        tams.run(tams.close())
+    return {
+        **event,
+        "flows": topological_sort_flows(flows.values()),
+        "timerangeShards": get_flow_timerange_shards(
+            flows.values(), event.get("timerange")
+        ),
+    }
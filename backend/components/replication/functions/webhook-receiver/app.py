@@ -1,7 +1,6 @@
 import os
 import json
 from datetime import datetime
-import boto3
 
 from aws_lambda_powertools import Logger, Tracer
 from aws_lambda_powertools.event_handler import APIGatewayRestResolver
@@ -9,13 +8,12 @@ from aws_lambda_powertools.event_handler.openapi.params import Path, Body
 from aws_lambda_powertools.logging import correlation_paths
 from aws_lambda_powertools.utilities.typing import LambdaContext
 from typing_extensions import Annotated
+from lambda_init import get_client
 
 tracer = Tracer()
 logger = Logger()
 app = APIGatewayRestResolver(enable_validation=True)
 
-sqs = boto3.client("sqs")
-eb = boto3.client("events")
 queue_url = os.environ["QUEUE_URL"]
 event_bus_name = os.environ["EVENT_BUS_NAME"]
 
@@ -49,12 +47,12 @@ def segments_added(event):
     if len(entries) == 0:
         # Only send messages if messages exist
         return
-    sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+    get_client("sqs").send_message_batch(QueueUrl=queue_url, Entries=entries)
 
 
 @tracer.capture_method(capture_response=False)
 def put_event(path_id, payload):
-    eb.put_events(
+    get_client("events").put_events(
         Entries=[
             {
                 "EventBusName": event_bus_name,
@@ -1,12 +1,11 @@
 import logging
 
-import boto3
 from crhelper import CfnResource
+from lambda_init import get_client
 
 logger = logging.getLogger(__name__)
 helper = CfnResource()
 
-idp = boto3.client("cognito-idp")
 
 try:
     pass
@@ -31,7 +30,7 @@ def lambda_handler(event, context):
 
 
 def get_client_secret(user_pool_id, client_id):
-    user_pool_client = idp.describe_user_pool_client(
+    user_pool_client = get_client("cognito-idp").describe_user_pool_client(
         UserPoolId=user_pool_id, ClientId=client_id
     )
     return user_pool_client["UserPoolClient"]["ClientSecret"]
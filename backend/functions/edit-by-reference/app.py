@@ -2,7 +2,7 @@ import os
 import json
 import uuid
 from collections import defaultdict
-from collections.abc import Generator
+from functools import lru_cache
 from typing import Any
 import requests
 
@@ -15,6 +15,7 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 
 from mediatimestamp.immutable import TimeRange, Timestamp
 from openid_auth import Credentials
+from tams_client import TamsClient
 
 tracer = Tracer()
 logger = Logger()
@@ -23,16 +24,29 @@ endpoint = os.environ["TAMS_ENDPOINT"]
 creds = Credentials(
     scopes=["tams-api/read", "tams-api/write"], secret_arn=os.environ["SECRET_ARN"]
 )
+tams = TamsClient(endpoint, creds)
 
 FORMAT_AUDIO = "urn:x-nmos:format:audio"
 FORMAT_VIDEO = "urn:x-nmos:format:video"
 FORMAT_MULTI = "urn:x-nmos:format:multi"
 DEFAULT_START_TIME = "0:0"
 DEFAULT_DESCRIPTION = "Edit By Reference"
+# Long edit timeranges are split into shards that are listed concurrently
+SEGMENT_LIST_SHARDS = 8
 
 
-@tracer.capture_method(capture_response=False)
-def get_flow(flow_id: str) -> dict[str, Any]:
+@lru_cache()
+def get_async_tams():
+    """Client used to fan out flow and segment lookups, imported on first use"""
+    # pylint: disable=import-outside-toplevel
+    from tams_client_async import AsyncTamsClient
+
+    return AsyncTamsClient(endpoint, creds)
+
+
+# The coroutines below run concurrently on the handler thread so are traced by the
+# functions running them rather than individually
+async def get_flow(flow_id: str) -> dict[str, Any]:
     """
     Retrieve flow information from the TAMS API.
 
@@ -42,70 +56,62 @@ def get_flow(flow_id: str) -> dict[str, Any]:
     Returns:
         The flow data as a dictionary
     """
-    get = requests.get(
-        f"{endpoint}/flows/{flow_id}?include_timerange=true",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-        },
-        timeout=30,
-    )
-    get.raise_for_status()
-    return get.json()
+    return await get_async_tams().get_flow(flow_id, include_timerange=True)
 
 
-@tracer.capture_method(capture_response=False)
-def put_flow(flow: dict[str, Any]) -> None:
+async def get_segments(
+    flow_id: str, timerange: str, flow: dict[str, Any]
+) -> list[dict[str, Any]]:
     """
-    Update or create a flow in the TAMS API.
+    Retrieve segments for a flow within a specified timerange.
 
     Args:
-        flow: The flow data to update or create
+        flow_id: The unique identifier of the flow
+        timerange: The timerange string to filter segments
+        flow: The flow data, used to split the timerange into shards
+
+    Returns:
+        Segment dictionaries from the TAMS API in timerange order
     """
-    put = requests.put(
-        f'{endpoint}/flows/{flow["id"]}',
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps(flow),
-        timeout=30,
-    )
-    put.raise_for_status()
+    flow_segment_duration = flow.get("segment_duration")
+    return [
+        segment
+        async for segment in get_async_tams().get_segments_sharded(
+            flow_id,
+            timerange,
+            flow.get("timerange"),
+            shards=SEGMENT_LIST_SHARDS,
+            segment_duration=(
+                flow_segment_duration["numerator"]
+                / flow_segment_duration.get("denominator", 1)
+                if flow_segment_duration
+                else 0
+            ),
+            accept_get_urls="",
+        )
+    ]
 
 
 @tracer.capture_method(capture_response=False)
-def get_segments(flow_id: str, timerange: str) -> Generator[dict[str, Any], None, None]:
+def put_flow(flow: dict[str, Any]) -> None:
     """
-    Retrieve segments for a flow within a specified timerange.
+    Update or create a flow in the TAMS API.
 
     Args:
-        flow_id: The unique identifier of the flow
-        timerange: The timerange string to filter segments
-
-    Yields:
-        Segment dictionaries from the TAMS API
+        flow: The flow data to update or create
     """
-    get = requests.get(
-        f"{endpoint}/flows/{flow_id}/segments?accept_get_urls=&timerange={timerange}",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
+    tams.put_flow(flow)
+
+
+def log_failed_segments(flow_id: str, segment_chunk: list, response_body) -> None:
+    logger.error(
+        "Some segments failed to be posted",
+        extra={
+            "flow_id": flow_id,
+            "request_body": segment_chunk,
+            "response_body": response_body,
         },
-        timeout=30,
     )
-    get.raise_for_status()
-    for segment in get.json():
-        yield segment
-    while "next" in get.links:
-        get = requests.get(
-            get.links["next"]["url"],
-            headers={
-                "Authorization": f"Bearer {creds.token()}",
-            },
-            timeout=30,
-        )
-        get.raise_for_status()
-        for segment in get.json():
-            yield segment
 
 
 @tracer.capture_method(capture_response=False)
@@ -117,25 +123,13 @@ def post_segment_chunk(flow_id: str, segment_chunk: list) -> None:
         flow_id: The unique identifier of the flow
         segment_chunk: A list of segment dictionaries to post
     """
-    post = requests.post(
-        f"{endpoint}/flows/{flow_id}/segments",
-        headers={
-            "Authorization": f"Bearer {creds.token()}",
-            "Content-Type": "application/json",
-        },
-        data=json.dumps(segment_chunk),
-        timeout=30,
-    )
-    if post.status_code != 201:
-        logger.error(
-            "Some segments failed to be posted",
-            extra={
-                "flow_id": flow_id,
-                "request_body": segment_chunk,
-                "response_body": post.json(),
-            },
-        )
-    post.raise_for_status()
+    try:
+        failed_segments = tams.post_segments(flow_id, segment_chunk)
+    except requests.exceptions.HTTPError as ex:
+        log_failed_segments(flow_id, segment_chunk, ex.response.text)
+        raise
+    if failed_segments:
+        log_failed_segments(flow_id, segment_chunk, failed_segments)
 
 
 @tracer.capture_method(capture_response=False)
@@ -178,6 +172,7 @@ def initialize_flow_data(
     edit_payload: dict[str, Any],
     flows: dict[str, dict[str, Any]],
     format_source_ids: dict[str, str],
+    source_flows: dict[str, dict[str, Any]],
 ) -> tuple[dict[str, dict[str, Any]], dict[str, str]]:
     """
     Initialize flow data for a new flow based on an existing flow.
@@ -187,6 +182,7 @@ def initialize_flow_data(
         edit_payload: The edit payload containing configuration
         flows: Dictionary of existing flows
         format_source_ids: Dictionary of existing format source IDs
+        source_flows: Dictionary of the flows referenced by the edit payload
 
     Returns:
         A tuple containing (updated_flows, updated_format_source_ids)
@@ -195,7 +191,7 @@ def initialize_flow_data(
     updated_format_source_ids = format_source_ids.copy()
 
     if not updated_flows.get(flow_id):
-        flow_data = get_flow(flow_id)
+        flow_data = source_flows[flow_id]
         # Only process multi, video and audio flows
         if flow_data["format"] not in [FORMAT_AUDIO, FORMAT_VIDEO, FORMAT_MULTI]:
             return updated_flows, updated_format_source_ids
@@ -306,48 +302,70 @@ def get_new_flows_and_segments(
     flow_segments = defaultdict(list)
     format_source_ids = {}
 
+    flow_ids = list(
+        dict.fromkeys(
+            flow_id
+            for edit_item in edit_payload["edit"]
+            for flow_id in edit_item["flows"]
+        )
+    )
     # Set start of all new segments per flow to be as per edit payload
     next_start = {
         flow_id: Timestamp.from_str(
             edit_payload["configuration"].get("start", DEFAULT_START_TIME)
         )
-        for flow_id in set(
-            flow_id
-            for edit_item in edit_payload["edit"]
-            for flow_id in edit_item["flows"]
-        )
+        for flow_id in flow_ids
     }
 
+    # Every referenced flow is fetched concurrently
+    source_flows = dict(
+        zip(
+            flow_ids,
+            get_async_tams().run_all(get_flow(flow_id) for flow_id in flow_ids),
+        )
+    )
+
     for edit_item in edit_payload["edit"]:
         for flow_id in edit_item["flows"]:
             # Initialize flow data if needed
             flows, format_source_ids = initialize_flow_data(
-                flow_id, edit_payload, flows, format_source_ids
+                flow_id, edit_payload, flows, format_source_ids, source_flows
+            )
+
+    # Skip flows that were not added (e.g., image flows)
+    edit_flows = [
+        (edit_item, flow_id)
+        for edit_item in edit_payload["edit"]
+        for flow_id in edit_item["flows"]
+        if flow_id in flows
+    ]
+
+    # Segments of every edit item and flow are listed concurrently
+    edit_segments = get_async_tams().run_all(
+        get_segments(flow_id, edit_item["timerange"], source_flows[flow_id])
+        for edit_item, flow_id in edit_flows
+    )
+
+    for (edit_item, flow_id), segments in zip(edit_flows, edit_segments):
+        # Process segments for this flow and edit item in edit order
+        for segment in segments:
+            # Calculate timeranges
+            intersection_timerange, new_timerange = calculate_segment_timeranges(
+                segment, edit_item["timerange"], next_start[flow_id]
+            )
+
+            # Update next start time
+            next_start[flow_id] = new_timerange.end
+
+            # Calculate offsets
+            old_ts_offset = Timestamp.from_str(segment.get("ts_offset", "0:0"))
+            new_ts_offset = (
+                old_ts_offset + new_timerange.start - intersection_timerange.start
             )
 
-            # Skip if flow was not added (e.g., image flows)
-            if flow_id not in flows:
-                continue
-
-            # Process segments for this flow and edit item
-            for segment in get_segments(flow_id, edit_item["timerange"]):
-                # Calculate timeranges
-                intersection_timerange, new_timerange = calculate_segment_timeranges(
-                    segment, edit_item["timerange"], next_start[flow_id]
-                )
-
-                # Update next start time
-                next_start[flow_id] = new_timerange.end
-
-                # Calculate offsets
-                old_ts_offset = Timestamp.from_str(segment.get("ts_offset", "0:0"))
-                new_ts_offset = (
-                    old_ts_offset + new_timerange.start - intersection_timerange.start
-                )
-
-                # Create and store the new segment
-                new_segment = build_new_segment(segment, new_timerange, new_ts_offset)
-                flow_segments[flows[flow_id]["id"]].append(new_segment)
+            # Create and store the new segment
+            new_segment = build_new_segment(segment, new_timerange, new_ts_offset)
+            flow_segments[flows[flow_id]["id"]].append(new_segment)
 
     return flows, dict(flow_segments)
 
@@ -1,11 +1,202 @@
+import hashlib
 import json
-from datetime import datetime, timedelta
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Protocol
+
 import requests
-import boto3
 from botocore.exceptions import BotoCoreError, ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Tokens are treated as expired this many seconds before they actually expire
+EXPIRY_OVERLAP = 30
+# Tokens are refreshed once they expire within this many seconds
+REFRESH_MARGIN = 300
+
+# Token requests are retried when the token endpoint throttles or is unavailable
+session = requests.Session()
+adapter = HTTPAdapter(
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 503),
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
+
+@dataclass
+class CachedToken:
+    access_token: str
+    issued_at: float
+    expires_at: float
+
+    def expires_in(self) -> float:
+        return self.expires_at - time.time()
+
+
+class TokenCache(Protocol):
+    def get(self, key: str) -> CachedToken | None: ...
+
+    def set(self, key: str, token: CachedToken) -> None: ...
+
+
+class MemoryTokenCache:
+    """Tokens shared by every Credentials in the process"""
+
+    def __init__(self) -> None:
+        self._tokens = {}
+
+    def get(self, key: str) -> CachedToken | None:
+        return self._tokens.get(key)
+
+    def set(self, key: str, token: CachedToken) -> None:
+        self._tokens[key] = token
+
+
+class FileTokenCache:
+    """
+    Tokens shared by the processes of a host in files only readable by their owner.
+
+    In Lambda /tmp is kept between invocations of an execution environment.
+    """
+
+    def __init__(self, directory: str = "/tmp/openid-auth") -> None:
+        self._directory = directory
+
+    def get(self, key: str) -> CachedToken | None:
+        try:
+            with open(os.path.join(self._directory, key), encoding="utf-8") as f:
+                return CachedToken(**json.load(f))
+        except (OSError, TypeError, ValueError):
+            return None
+
+    def set(self, key: str, token: CachedToken) -> None:
+        path = os.path.join(self._directory, key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.makedirs(self._directory, mode=0o700, exist_ok=True)
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(token.__dict__, f)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+
+
+class DynamoDBTokenCache:
+    """
+    Tokens shared across cold starts and functions in a DynamoDB table.
+
+    The table has a string partition key named key and should have time to live
+    enabled on the ttl attribute. Any client with the get_item and put_item methods
+    of the boto3 DynamoDB client can stand in for DynamoDB, such as
+    MemoryDynamoDBClient when testing or running locally.
+    """
+
+    def __init__(self, table_name: str, client=None) -> None:
+        self._table_name = table_name
+        if client is None:
+            import boto3  # pylint: disable=import-outside-toplevel
+
+            client = boto3.client("dynamodb")
+        self._client = client
+
+    def get(self, key: str) -> CachedToken | None:
+        try:
+            item = self._client.get_item(
+                TableName=self._table_name, Key={"key": {"S": key}}
+            ).get("Item")
+        except (BotoCoreError, ClientError):
+            return None
+        if not item:
+            return None
+        return CachedToken(
+            access_token=item["access_token"]["S"],
+            issued_at=float(item["issued_at"]["N"]),
+            expires_at=float(item["expires_at"]["N"]),
+        )
+
+    def set(self, key: str, token: CachedToken) -> None:
+        try:
+            self._client.put_item(
+                TableName=self._table_name,
+                Item={
+                    "key": {"S": key},
+                    "access_token": {"S": token.access_token},
+                    "issued_at": {"N": str(token.issued_at)},
+                    "expires_at": {"N": str(token.expires_at)},
+                    "ttl": {"N": str(int(token.expires_at) + EXPIRY_OVERLAP)},
+                },
+            )
+        except (BotoCoreError, ClientError):
+            return
+
+
+class MemoryDynamoDBClient:
+    """
+    In-memory stand-in for the get_item and put_item methods of the boto3 DynamoDB
+    client, keyed on the key attribute used by DynamoDBTokenCache. Items whose ttl
+    has passed are not returned, as DynamoDB would eventually delete them.
+    """
+
+    def __init__(self) -> None:
+        self._items = {}
+        self._lock = threading.Lock()
+
+    # pylint: disable=invalid-name,unused-argument
+    def get_item(self, TableName: str, Key: dict) -> dict:
+        with self._lock:
+            item = self._items.get((TableName, Key["key"]["S"]))
+        if item is None or ("ttl" in item and float(item["ttl"]["N"]) < time.time()):
+            return {}
+        return {"Item": dict(item)}
+
+    # pylint: disable=invalid-name
+    def put_item(self, TableName: str, Item: dict) -> dict:
+        with self._lock:
+            self._items[(TableName, Item["key"]["S"])] = dict(Item)
+        return {}
+
+
+memory_token_cache = MemoryTokenCache()
+
+
+def get_default_token_caches() -> list[TokenCache]:
+    """
+    Caches used when none are given, fastest first.
+
+    Tokens are kept in memory and under TOKEN_CACHE_DIR (default /tmp/openid-auth),
+    and in the DynamoDB table TOKEN_CACHE_TABLE when it is set.
+    """
+    caches = [
+        memory_token_cache,
+        FileTokenCache(os.environ.get("TOKEN_CACHE_DIR", "/tmp/openid-auth")),
+    ]
+    if os.environ.get("TOKEN_CACHE_TABLE"):
+        caches.append(DynamoDBTokenCache(os.environ["TOKEN_CACHE_TABLE"]))
+    return caches
 
 
 class Credentials:
+    """
+    OAuth client credentials, thread-safe.
+
+    Tokens are shared through the token caches so a new process can reuse a token
+    another has already requested. Client secrets are only fetched the first time a
+    token has to be requested. A token close to expiry is refreshed by the first
+    caller to notice, while other callers keep using it, so only that caller waits
+    for the refresh. Refreshing inline rather than in a background thread keeps it
+    working in Lambda, which freezes threads between invocations.
+    """
+
     def __init__(
         self,
         scopes: list[str],
@@ -14,39 +205,109 @@ class Credentials:
         client_secret: str = None,
         user_pool_id: str = None,
         secret_arn: str = None,
+        token_caches: list[TokenCache] = None,
     ) -> None:
         if sum((bool(client_secret), bool(user_pool_id), bool(secret_arn))) != 1:
             raise ValueError(
                 "Exactly one of client_secret, user_pool_id or secret_arn must be provided"
             )
+        if not secret_arn and (not token_url or not client_id):
+            raise ValueError("Failed to obtain required credentials")
         self._token_url = token_url
         self._user_pool_id = user_pool_id
         self._client_id = client_id
         self._scope = " ".join(scopes)
         self._client_secret = client_secret
         self._secret_arn = secret_arn
-        self._access_token = None
-        self._expires_at = None
+        self._token = None
+        self._token_caches = (
+            get_default_token_caches() if token_caches is None else token_caches
+        )
+        identity = (secret_arn, user_pool_id, token_url, client_id, self._scope)
+        self._cache_key = hashlib.sha256(
+            "|".join(str(value) for value in identity).encode("utf-8")
+        ).hexdigest()
+        # Each instance refreshes at a different point so a fleet does not refresh
+        # a shared token at the same time
+        self._refresh_jitter = random.uniform(0.5, 1)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._secret_lock = threading.Lock()
 
-        if self._secret_arn:
-            self._get_secret_values()
-        elif self._user_pool_id:
-            self._get_client_secret()
+    def token(self) -> str:
+        token = self._token
+        if token is None or token.expires_in() <= 0:
+            with self._lock:
+                token = self._get_token()
+        elif token.expires_in() < self._get_refresh_margin(token):
+            token = self._refresh() or token
+        return token.access_token
 
-        if not self._client_secret or not self._token_url or not self._client_id:
-            raise ValueError("Failed to obtain required credentials")
+    def current_token(self) -> str | None:
+        """The token if it is held and not due a refresh, without blocking"""
+        token = self._token
+        if token is None or token.expires_in() < self._get_refresh_margin(token):
+            return None
+        return token.access_token
 
-    def token(self) -> str:
-        if (
-            self._access_token is None
-            or self._expires_at is None
-            or (self._expires_at and self._expires_at < datetime.now())
-        ):
-            self._request_token()
-        return self._access_token
+    def _get_refresh_margin(self, token: CachedToken) -> float:
+        lifetime = token.expires_at - token.issued_at
+        return min(REFRESH_MARGIN, lifetime / 2) * self._refresh_jitter
+
+    def _get_token(self) -> CachedToken:
+        """Get a valid token, requesting one when none is cached. Hold the lock"""
+        # Another thread may have got a token while this one waited for the lock
+        if self._token is None or self._token.expires_in() <= 0:
+            self._token = self._get_cached_token() or self._request_token()
+        return self._token
+
+    def _get_cached_token(self, newer_than: float = 0) -> CachedToken | None:
+        for index, cache in enumerate(self._token_caches):
+            token = cache.get(self._cache_key)
+            if token and token.expires_in() > 0 and token.expires_at > newer_than:
+                for faster_cache in self._token_caches[:index]:
+                    faster_cache.set(self._cache_key, token)
+                return token
+        return None
+
+    def _refresh(self) -> CachedToken | None:
+        """Replace a token close to expiry, None when another caller is doing so"""
+        # Only one refresh is in progress at a time
+        if not self._refresh_lock.acquire(blocking=False):
+            return None
+        try:
+            current = self._token
+            # Another process may already have refreshed the shared token
+            token = (
+                self._get_cached_token(current.expires_at if current else 0)
+                or self._request_token()
+            )
+            with self._lock:
+                if self._token is None or token.expires_at > self._token.expires_at:
+                    self._token = token
+                return self._token
+        except (requests.RequestException, KeyError, ValueError):
+            # The current token is still valid, so the next call tries again
+            return None
+        finally:
+            self._refresh_lock.release()
+
+    def _load_client_secret(self) -> None:
+        with self._secret_lock:
+            if self._client_secret:
+                return
+            if self._secret_arn:
+                self._get_secret_values()
+            elif self._user_pool_id:
+                self._get_client_secret()
+            if not self._client_secret or not self._token_url or not self._client_id:
+                raise ValueError("Failed to obtain required credentials")
 
     def _get_client_secret(self):
         """Get client secret from Cognito"""
+        # boto3 is slow to import and only needed when no token is cached
+        import boto3  # pylint: disable=import-outside-toplevel
+
         try:
             client = boto3.client("cognito-idp")
             user_pool_client = client.describe_user_pool_client(
@@ -58,6 +319,8 @@ class Credentials:
 
     def _get_secret_values(self):
         """Get secret value from Secrets Manager"""
+        import boto3  # pylint: disable=import-outside-toplevel
+
         try:
             client = boto3.client("secretsmanager")
             secret_response = client.get_secret_value(SecretId=self._secret_arn)
@@ -74,20 +337,24 @@ class Credentials:
         except json.JSONDecodeError as e:
             raise ValueError("Secret value not valid json") from e
 
-    def _request_token(self):
-        """Request access token"""
+    def _request_token(self) -> CachedToken:
+        """Request access token and share it through the token caches"""
+        self._load_client_secret()
         form_data = {
             "client_id": self._client_id,
             "client_secret": self._client_secret,
             "grant_type": "client_credentials",
             "scope": self._scope,
         }
-        resp = requests.post(self._token_url, data=form_data, timeout=30)
+        issued_at = time.time()
+        resp = session.post(self._token_url, data=form_data, timeout=30)
         resp.raise_for_status()
         token_response = resp.json()
-        self._access_token = token_response["access_token"]
-        self._expires_at = datetime.now() + timedelta(
-            seconds=(
-                token_response["expires_in"] - 30
-            )  # 30 seconds of overlap with expiry
+        token = CachedToken(
+            access_token=token_response["access_token"],
+            issued_at=issued_at,
+            expires_at=issued_at + token_response["expires_in"] - EXPIRY_OVERLAP,
         )
+        for cache in self._token_caches:
+            cache.set(self._cache_key, token)
+        return token
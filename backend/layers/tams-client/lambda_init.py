@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Protocol
+
+import boto3
+
+# Initialisation type whose first invocation immediately follows the init phase
+ON_DEMAND = "on-demand"
+
+_client_lock = threading.Lock()
+# Held for good once the init duration has been reported
+_init_unreported = threading.Lock()
+
+
+class MetricsProvider(Protocol):
+    def add_metric(self, name: str, unit: str, value: float) -> None: ...
+
+
+@lru_cache()
+def get_client(service_name):
+    """AWS clients are created on first use rather than during cold start"""
+    # Creating clients from the default session is not thread safe
+    with _client_lock:
+        return boto3.client(service_name)
+
+
+def get_process_uptime() -> float | None:
+    """Seconds since this process started, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces so fields are counted from its closing
+    # parenthesis, starttime being the 22nd field in clock ticks since boot
+    started = int(stat.rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+
+
+def add_init_duration_metric(metrics: MetricsProvider) -> None:
+    """
+    Adds an InitDuration metric, in milliseconds, on the first invocation only.
+
+    The duration runs from the runtime process starting to the first invocation, so
+    covers the imports and module level setup of the function. It is not reported
+    for provisioned concurrency or SnapStart, where the first invocation can come
+    long after initialisation, nor outside Lambda.
+    """
+    if not _init_unreported.acquire(blocking=False):
+        return
+    if os.environ.get("AWS_LAMBDA_INITIALIZATION_TYPE") != ON_DEMAND:
+        return
+    uptime = get_process_uptime()
+    if uptime is not None:
+        metrics.add_metric(
+            name="InitDuration", unit="Milliseconds", value=uptime * 1000
+        )
@@ -0,0 +1,463 @@
+import contextvars
+import queue
+import threading
+from collections.abc import Generator, Iterable
+from typing import Any, Protocol
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Shards are only worthwhile when they span at least a page of segments
+MIN_SHARD_SEGMENTS = 100
+# Marks the end of the items read by start_reading
+_END = object()
+
+
+class TokenProvider(Protocol):
+    def token(self) -> str: ...
+
+
+class TamsRetry(Retry):
+    """Retry policy that only retries POST requests when they were throttled"""
+
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        # A throttled request was not processed, so even a POST is safe to repeat
+        if method.upper() == "POST" and status_code == 429:
+            return bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def parse_timestamp(timestamp: str) -> int:
+    """Parse a TAMS timestamp string (secs:nanos) into nanoseconds"""
+    sign = -1 if timestamp.startswith("-") else 1
+    secs, _, nanos = timestamp.lstrip("+-").partition(":")
+    return sign * (int(secs) * 1_000_000_000 + int(nanos or 0))
+
+
+def format_timestamp(timestamp_ns: int) -> str:
+    """Format nanoseconds as a TAMS timestamp string (secs:nanos)"""
+    sign = "-" if timestamp_ns < 0 else ""
+    secs, nanos = divmod(abs(timestamp_ns), 1_000_000_000)
+    return f"{sign}{secs}:{nanos}"
+
+
+def parse_timerange_bounds(timerange: str) -> tuple[int | None, int | None]:
+    """Parse a TAMS timerange string into nanosecond bounds, None when unbounded"""
+    start, separator, end = timerange.strip("[]()").partition("_")
+    start_ns = parse_timestamp(start) if start else None
+    if not separator:
+        return start_ns, start_ns
+    return start_ns, parse_timestamp(end) if end else None
+
+
+def get_timerange_shards(
+    timerange: str,
+    flow_timerange: str,
+    shard_count: int,
+    segment_duration: float = 0,
+) -> list[str]:
+    """
+    Split the part of a timerange covered by a flow into contiguous shards.
+
+    Args:
+        timerange: The timerange to list, "_" for the whole flow
+        flow_timerange: The timerange of the flow, from include_timerange
+        shard_count: Maximum number of shards
+        segment_duration: Nominal segment duration of the flow in seconds, used to
+            avoid shards of less than MIN_SHARD_SEGMENTS segments when known
+
+    Returns:
+        The shards in timerange order, empty when the flow has nothing in timerange.
+        An unbounded timerange cannot be split and is returned as a single shard.
+    """
+    if not timerange.strip("[]()") or not flow_timerange.strip("[]()"):
+        return []
+    start, end = parse_timerange_bounds(timerange)
+    flow_start, flow_end = parse_timerange_bounds(flow_timerange)
+    # Keep the inclusivity of whichever timerange provides each bound
+    start_bracket = timerange[0] if timerange[0] in "[(" else "["
+    if start is None or (flow_start is not None and start < flow_start):
+        start = flow_start
+        start_bracket = flow_timerange[0] if flow_timerange[0] in "[(" else "["
+    end_bracket = timerange[-1] if timerange[-1] in ")]" else ")"
+    if end is None or (flow_end is not None and end > flow_end):
+        end = flow_end
+        end_bracket = flow_timerange[-1] if flow_timerange[-1] in ")]" else ")"
+    if start is None or end is None:
+        return [
+            start_bracket
+            + (format_timestamp(start) if start is not None else "")
+            + "_"
+            + (format_timestamp(end) if end is not None else "")
+            + end_bracket
+        ]
+    if end < start:
+        return []
+    if end == start:
+        return [f"[{format_timestamp(start)}]"]
+    if segment_duration > 0:
+        segment_count = (end - start) / 1_000_000_000 / segment_duration
+        shard_count = min(shard_count, int(segment_count // MIN_SHARD_SEGMENTS))
+    shard_count = max(1, shard_count)
+    boundaries = sorted(
+        set(start + (end - start) * i // shard_count for i in range(shard_count + 1))
+    )
+    shards = [
+        f"[{format_timestamp(shard_start)}_{format_timestamp(shard_end)})"
+        for shard_start, shard_end in zip(boundaries, boundaries[1:])
+    ]
+    shards[0] = start_bracket + shards[0][1:]
+    shards[-1] = shards[-1][:-1] + end_bracket
+    return shards
+
+
+def start_reading(
+    iterable: Iterable[Any], size: int, stopped: threading.Event
+) -> queue.Queue:
+    """
+    Read an iterable into a queue in a background thread, see read_ahead.
+
+    Args:
+        iterable: The items to read, such as pages of a list being fetched
+        size: Maximum number of items read ahead of the consumer
+        stopped: Set by the consumer to stop reading, after any request in flight
+
+    Returns:
+        The queue to pass to drain
+    """
+    items = queue.Queue(maxsize=size)
+
+    def offer(item, error=None) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not offer(item):
+                    return
+            offer(_END)
+        # pylint: disable=broad-exception-caught
+        except Exception as ex:
+            offer(_END, ex)
+
+    # The context is copied so request scoped context variables are visible
+    threading.Thread(
+        target=contextvars.copy_context().run, args=(produce,), daemon=True
+    ).start()
+    return items
+
+
+def drain(items: queue.Queue) -> Generator[Any, None, None]:
+    """Yield the items read by start_reading, re-raising any exception reading them"""
+    while True:
+        item, error = items.get()
+        if error is not None:
+            raise error
+        if item is _END:
+            return
+        yield item
+
+
+def read_ahead(iterable: Iterable[Any], size: int) -> Generator[Any, None, None]:
+    """
+    Iterate in a background thread while the items already read are consumed.
+
+    Args:
+        iterable: The items to read, such as pages of a list being fetched
+        size: Maximum number of items read ahead of the consumer
+
+    Yields:
+        The items of iterable in order, re-raising any exception raised reading them
+    """
+    stopped = threading.Event()
+    items = start_reading(iterable, size, stopped)
+    try:
+        yield from drain(items)
+    finally:
+        # Stops reading once the consumer stops, after any request in flight
+        stopped.set()
+
+
+def create_session(
+    pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.5
+) -> requests.Session:
+    """
+    Create a keep-alive session with a connection pool per host and retries.
+
+    Args:
+        pool_size: Connections kept open per host, match the concurrency in use
+        retries: Number of retries on connection errors and retryable statuses
+        backoff_factor: Base of the exponential backoff between retries in seconds
+
+    Returns:
+        The configured session
+    """
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=TamsRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False,
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class TamsClient:
+    """
+    Client for a TAMS API that reuses connections between calls.
+
+    Responses with a retryable status are retried with exponential backoff, honouring
+    Retry-After. POST requests are only retried when throttled as they are not
+    idempotent.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        credentials: TokenProvider,
+        pool_size: int = 10,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 30,
+    ) -> None:
+        self.endpoint = endpoint.rstrip("/")
+        self.session = create_session(pool_size, retries, backoff_factor)
+        self._credentials = credentials
+        self._timeout = timeout
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        headers: dict[str, str] | None = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """
+        Make an authorised request without raising for the response status.
+
+        Args:
+            method: The HTTP method
+            path: Path relative to the endpoint, or an absolute URL such as a next link
+            headers: Additional request headers
+            **kwargs: Passed on to requests, such as params or json
+
+        Returns:
+            The response
+        """
+        url = path if path.startswith(("https://", "http://")) else self.endpoint + path
+        return self.session.request(
+            method,
+            url,
+            headers={
+                "Authorization": f"Bearer {self._credentials.token()}",
+                **(headers or {}),
+            },
+            timeout=kwargs.pop("timeout", self._timeout),
+            **kwargs,
+        )
+
+    def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        """GET a path and return the JSON body, raising for error statuses"""
+        get = self.request("GET", path, params=params)
+        get.raise_for_status()
+        return get.json()
+
+    def get_pages(
+        self, path: str, params: dict[str, Any] | None = None
+    ) -> Generator[list[Any], None, None]:
+        """Iterate over the pages of a paged list, following next links on demand"""
+        get = self.request("GET", path, params=params)
+        get.raise_for_status()
+        yield get.json()
+        while "next" in get.links:
+            get = self.request("GET", get.links["next"]["url"])
+            get.raise_for_status()
+            yield get.json()
+
+    def paginate(
+        self, path: str, params: dict[str, Any] | None = None, prefetch: int = 0
+    ) -> Generator[Any, None, None]:
+        """
+        Iterate over every item of a paged list.
+
+        Args:
+            path: Path of the list relative to the endpoint
+            params: Query string parameters of the first page
+            prefetch: Number of pages to fetch ahead in the background while earlier
+                pages are consumed, 0 to only fetch a page when it is needed
+
+        Yields:
+            The items of each page in turn
+        """
+        pages = self.get_pages(path, params)
+        if prefetch > 0:
+            pages = read_ahead(pages, prefetch)
+        for page in pages:
+            yield from page
+
+    def get_source(self, source_id: str) -> dict[str, Any]:
+        return self.get_json(f"/sources/{source_id}")
+
+    def get_flow(self, flow_id: str, include_timerange: bool = False) -> dict[str, Any]:
+        return self.get_json(
+            f"/flows/{flow_id}",
+            {"include_timerange": "true"} if include_timerange else None,
+        )
+
+    def get_flows(self, **params: Any) -> list[dict[str, Any]]:
+        """List flows matching the query string parameters, such as source_id"""
+        return list(self.paginate("/flows", params))
+
+    def put_flow(self, flow: dict[str, Any]) -> None:
+        put = self.request("PUT", f'/flows/{flow["id"]}', json=flow)
+        put.raise_for_status()
+
+    def get_segments(
+        self,
+        flow_id: str,
+        timerange: str | None = None,
+        reverse_order: bool = False,
+        limit: int | None = None,
+        prefetch: int = 0,
+        **params: Any,
+    ) -> Generator[dict[str, Any], None, None]:
+        """
+        Iterate over the segments of a flow, fetching pages as they are consumed.
+
+        Args:
+            flow_id: The unique identifier of the flow
+            timerange: Only list segments overlapping this timerange
+            reverse_order: List the most recent segments first
+            limit: Page size to request
+            prefetch: Number of pages to fetch ahead of the consumer
+            **params: Other query string parameters, such as accept_get_urls
+
+        Yields:
+            Segment dictionaries from the TAMS API
+        """
+        yield from self.paginate(
+            f"/flows/{flow_id}/segments",
+            {
+                **({"timerange": timerange} if timerange else {}),
+                **({"reverse_order": "true"} if reverse_order else {}),
+                **({"limit": limit} if limit else {}),
+                **params,
+            },
+            prefetch,
+        )
+
+    def get_segments_sharded(
+        self,
+        flow_id: str,
+        timerange: str | None = None,
+        flow_timerange: str | None = None,
+        shards: int = 8,
+        segment_duration: float = 0,
+        buffer_pages: int = 16,
+        **params: Any,
+    ) -> Generator[dict[str, Any], None, None]:
+        """
+        Iterate over the segments of a flow in playing order, listing shards of the
+        timerange concurrently.
+
+        Args:
+            flow_id: The unique identifier of the flow
+            timerange: Only list segments overlapping this timerange
+            flow_timerange: The timerange of the flow, the flow is listed in a single
+                shard when neither this nor timerange is bounded
+            shards: Maximum number of shards listed concurrently
+            segment_duration: Nominal segment duration of the flow in seconds
+            buffer_pages: Maximum number of pages each shard lists ahead of the
+                consumer, bounding the memory used by shards not yet reached
+            **params: Other query string parameters, such as accept_get_urls
+
+        Yields:
+            Segment dictionaries from the TAMS API, as the pages of each shard are
+            listed
+        """
+        stopped = threading.Event()
+        shard_pages = [
+            start_reading(
+                self.get_pages(
+                    f"/flows/{flow_id}/segments",
+                    {"timerange": shard_timerange, **params},
+                ),
+                buffer_pages,
+                stopped,
+            )
+            for shard_timerange in get_timerange_shards(
+                timerange or "_", flow_timerange or "_", shards, segment_duration
+            )
+        ]
+        try:
+            # Segments spanning shard boundaries are listed by every shard they span
+            last_end = None
+            for pages in shard_pages:
+                for page in drain(pages):
+                    for segment in page:
+                        start, end = parse_timerange_bounds(segment["timerange"])
+                        if last_end is not None and start < last_end:
+                            continue
+                        last_end = end
+                        yield segment
+        finally:
+            # Shards not yet needed are abandoned when the consumer stops early
+            stopped.set()
+
+    def post_segments(
+        self, flow_id: str, segments: dict[str, Any] | list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        """
+        Register one or more segments with a flow.
+
+        Args:
+            flow_id: The unique identifier of the flow
+            segments: A segment or a list of segments
+
+        Returns:
+            The segments that failed to be added, empty when all were added
+        """
+        post = self.request("POST", f"/flows/{flow_id}/segments", json=segments)
+        post.raise_for_status()
+        return post.json() if post.status_code == 200 else []
+
+    def allocate_storage(
+        self,
+        flow_id: str,
+        object_ids: list[str] | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Allocate media objects with pre-signed PUT URLs for a flow.
+
+        Args:
+            flow_id: The unique identifier of the flow
+            object_ids: Specific object ids to allocate
+            limit: Number of objects to allocate when object_ids is not given
+
+        Returns:
+            The allocated media objects
+        """
+        post = self.request(
+            "POST",
+            f"/flows/{flow_id}/storage",
+            json={"object_ids": object_ids} if object_ids else {"limit": limit or 1},
+        )
+        post.raise_for_status()
+        return post.json()["media_objects"]
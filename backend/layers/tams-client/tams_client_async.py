@@ -0,0 +1,347 @@
+import asyncio
+import json
+import threading
+from collections.abc import AsyncGenerator, Awaitable, Iterable
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import aiohttp
+
+from tams_client import (
+    RETRY_STATUSES,
+    TokenProvider,
+    get_timerange_shards,
+    parse_timerange_bounds,
+)
+
+T = TypeVar("T")
+
+
+@dataclass
+class AsyncResponse:
+    """A response that has been read in full, with the interface of requests"""
+
+    status_code: int
+    headers: Any
+    next_url: str | None
+    content: bytes
+    response: aiohttp.ClientResponse
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        self.response.raise_for_status()
+
+
+@dataclass
+class _LoopState:
+    loop: asyncio.AbstractEventLoop
+    session: aiohttp.ClientSession
+    semaphore: asyncio.Semaphore
+
+
+class AsyncTamsClient:
+    """
+    Asyncio client for a TAMS API for fanning out many requests from one thread.
+
+    Every request made from an event loop shares a connection pool, and the number
+    of requests in flight is limited by a semaphore. Responses with a retryable
+    status are retried with exponential backoff, honouring Retry-After. POST requests
+    are only retried when throttled as they are not idempotent.
+
+    Synchronous code such as a Lambda handler uses run and run_all, which run on an
+    event loop kept per thread so connections are reused between invocations.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        credentials: TokenProvider,
+        max_concurrency: int = 100,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 30,
+    ) -> None:
+        self.endpoint = endpoint.rstrip("/")
+        self._credentials = credentials
+        self._max_concurrency = max_concurrency
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._local = threading.local()
+
+    def run(self, awaitable: Awaitable[T]) -> T:
+        """Run a coroutine to completion on the event loop of the calling thread"""
+        loop = getattr(self._local, "loop", None)
+        if loop is None:
+            loop = self._local.loop = asyncio.new_event_loop()
+        return loop.run_until_complete(awaitable)
+
+    def run_all(self, awaitables: Iterable[Awaitable[T]]) -> list[T]:
+        """Run coroutines concurrently, returning their results in order"""
+
+        async def gather() -> list[T]:
+            return await asyncio.gather(*awaitables)
+
+        return self.run(gather())
+
+    def _get_state(self) -> _LoopState:
+        # Sessions and semaphores are bound to the event loop they are used from
+        loop = asyncio.get_running_loop()
+        state = getattr(self._local, "state", None)
+        if state is None or state.loop is not loop or state.session.closed:
+            state = self._local.state = _LoopState(
+                loop,
+                aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=self._max_concurrency,
+                        limit_per_host=self._max_concurrency,
+                    ),
+                    timeout=self._timeout,
+                ),
+                asyncio.Semaphore(self._max_concurrency),
+            )
+        return state
+
+    async def close(self) -> None:
+        """Close the connection pool of the calling thread"""
+        state = getattr(self._local, "state", None)
+        if state is not None:
+            self._local.state = None
+            await state.session.close()
+
+    def _get_current_token(self) -> str | None:
+        # Providers without a non-blocking accessor are always called off the loop
+        current_token = getattr(self._credentials, "current_token", None)
+        return current_token() if current_token else None
+
+    def _get_delay(self, attempt: int, headers: Any = None) -> float:
+        retry_after = (headers or {}).get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+        return self._backoff_factor * 2**attempt
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        headers: dict[str, str] | None = None,
+        **kwargs: Any,
+    ) -> AsyncResponse:
+        """
+        Make an authorised request without raising for the response status.
+
+        Args:
+            method: The HTTP method
+            path: Path relative to the endpoint, or an absolute URL such as a next link
+            headers: Additional request headers
+            **kwargs: Passed on to aiohttp, such as params or json
+
+        Returns:
+            The response, with its body read
+        """
+        url = path if path.startswith(("https://", "http://")) else self.endpoint + path
+        state = self._get_state()
+        # Only a failure to connect is known not to have sent a POST request
+        retry_errors = (
+            (aiohttp.ClientConnectorError,)
+            if method.upper() == "POST"
+            else (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        )
+        attempt = 0
+        while True:
+            # Getting a token can block on a token request, so only goes off the
+            # loop when the provider has no current token
+            token = self._get_current_token() or await state.loop.run_in_executor(
+                None, self._credentials.token
+            )
+            try:
+                async with state.semaphore:
+                    async with state.session.request(
+                        method,
+                        url,
+                        headers={
+                            "Authorization": f"Bearer {token}",
+                            **(headers or {}),
+                        },
+                        **kwargs,
+                    ) as response:
+                        content = await response.read()
+            except retry_errors:
+                if attempt >= self._retries:
+                    raise
+                delay = self._get_delay(attempt)
+            else:
+                next_link = response.links.get("next")
+                result = AsyncResponse(
+                    response.status,
+                    response.headers,
+                    str(next_link["url"]) if next_link else None,
+                    content,
+                    response,
+                )
+                retryable = response.status in RETRY_STATUSES and (
+                    method.upper() != "POST" or response.status == 429
+                )
+                if not retryable or attempt >= self._retries:
+                    return result
+                delay = self._get_delay(attempt, response.headers)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        """GET a path and return the JSON body, raising for error statuses"""
+        get = await self.request("GET", path, params=params)
+        get.raise_for_status()
+        return get.json()
+
+    async def get_pages(
+        self, path: str, params: dict[str, Any] | None = None
+    ) -> AsyncGenerator[list[Any], None]:
+        """Iterate over the pages of a paged list, following next links on demand"""
+        get = await self.request("GET", path, params=params)
+        get.raise_for_status()
+        yield get.json()
+        while get.next_url:
+            get = await self.request("GET", get.next_url)
+            get.raise_for_status()
+            yield get.json()
+
+    async def paginate(
+        self, path: str, params: dict[str, Any] | None = None
+    ) -> AsyncGenerator[Any, None]:
+        """Iterate over every item of a paged list"""
+        async for page in self.get_pages(path, params):
+            for item in page:
+                yield item
+
+    async def get_source(self, source_id: str) -> dict[str, Any]:
+        return await self.get_json(f"/sources/{source_id}")
+
+    async def get_flow(
+        self, flow_id: str, include_timerange: bool = False
+    ) -> dict[str, Any]:
+        return await self.get_json(
+            f"/flows/{flow_id}",
+            {"include_timerange": "true"} if include_timerange else None,
+        )
+
+    async def get_flows(self, **params: Any) -> list[dict[str, Any]]:
+        """List flows matching the query string parameters, such as source_id"""
+        return [flow async for flow in self.paginate("/flows", params)]
+
+    async def put_flow(self, flow: dict[str, Any]) -> None:
+        put = await self.request("PUT", f'/flows/{flow["id"]}', json=flow)
+        put.raise_for_status()
+
+    async def get_segments(
+        self,
+        flow_id: str,
+        timerange: str | None = None,
+        reverse_order: bool = False,
+        limit: int | None = None,
+        **params: Any,
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        """
+        Iterate over the segments of a flow, fetching pages as they are consumed.
+
+        Args:
+            flow_id: The unique identifier of the flow
+            timerange: Only list segments overlapping this timerange
+            reverse_order: List the most recent segments first
+            limit: Page size to request
+            **params: Other query string parameters, such as accept_get_urls
+
+        Yields:
+            Segment dictionaries from the TAMS API
+        """
+        async for segment in self.paginate(
+            f"/flows/{flow_id}/segments",
+            {
+                **({"timerange": timerange} if timerange else {}),
+                **({"reverse_order": "true"} if reverse_order else {}),
+                **({"limit": limit} if limit else {}),
+                **params,
+            },
+        ):
+            yield segment
+
+    async def get_segments_sharded(
+        self,
+        flow_id: str,
+        timerange: str | None = None,
+        flow_timerange: str | None = None,
+        shards: int = 8,
+        segment_duration: float = 0,
+        buffer_pages: int = 16,
+        **params: Any,
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        """
+        Iterate over the segments of a flow in playing order, listing shards of the
+        timerange concurrently. See TamsClient.get_segments_sharded.
+        """
+
+        async def list_shard(shard_timerange: str, pages: asyncio.Queue) -> None:
+            try:
+                async for page in self.get_pages(
+                    f"/flows/{flow_id}/segments",
+                    {"timerange": shard_timerange, **params},
+                ):
+                    await pages.put((page, None))
+                await pages.put((None, None))
+            # pylint: disable=broad-exception-caught
+            except Exception as ex:
+                await pages.put((None, ex))
+
+        shard_pages = []
+        tasks = []
+        for shard_timerange in get_timerange_shards(
+            timerange or "_", flow_timerange or "_", shards, segment_duration
+        ):
+            pages = asyncio.Queue(maxsize=buffer_pages)
+            shard_pages.append(pages)
+            tasks.append(asyncio.create_task(list_shard(shard_timerange, pages)))
+        try:
+            # Segments spanning shard boundaries are listed by every shard they span
+            last_end = None
+            for pages in shard_pages:
+                while True:
+                    page, error = await pages.get()
+                    if error is not None:
+                        raise error
+                    if page is None:
+                        break
+                    for segment in page:
+                        start, end = parse_timerange_bounds(segment["timerange"])
+                        if last_end is not None and start < last_end:
+                            continue
+                        last_end = end
+                        yield segment
+        finally:
+            # Shards not yet needed are abandoned when the consumer stops early
+            for task in tasks:
+                task.cancel()
+
+    async def post_segments(
+        self, flow_id: str, segments: dict[str, Any] | list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        """Register segments with a flow, returning those that failed to be added"""
+        post = await self.request("POST", f"/flows/{flow_id}/segments", json=segments)
+        post.raise_for_status()
+        return post.json() if post.status_code == 200 else []
+
+    async def allocate_storage(
+        self,
+        flow_id: str,
+        object_ids: list[str] | None = None,
+        limit: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Allocate media objects with pre-signed PUT URLs for a flow"""
+        post = await self.request(
+            "POST",
+            f"/flows/{flow_id}/storage",
+            json={"object_ids": object_ids} if object_ids else {"limit": limit or 1},
+        )
+        post.raise_for_status()
+        return post.json()["media_objects"]
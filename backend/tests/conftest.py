@@ -0,0 +1,26 @@
+import importlib.util
+import os
+import sys
+
+BACKEND = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+HLS_GENERATOR = os.path.join(BACKEND, "components", "hls", "functions", "hls-generator")
+
+# Layers are on the path of every function, as they are in Lambda
+for layer in ("openid-auth", "tams-client"):
+    sys.path.insert(0, os.path.join(BACKEND, "layers", layer))
+# The HLS generator modules other than app have names unique to the function
+sys.path.insert(0, HLS_GENERATOR)
+
+
+def load_function(function_dir: str, name: str):
+    """Import the app module of a function under a name of its own"""
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(BACKEND, function_dir, "app.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.join(BACKEND, function_dir))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(os.path.join(BACKEND, function_dir))
+    return module
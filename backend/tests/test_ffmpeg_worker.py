@@ -0,0 +1,136 @@
+import subprocess
+import sys
+
+import pytest
+from botocore.exceptions import EndpointConnectionError
+from conftest import load_function
+
+MB = 1_048_576
+
+
+@pytest.fixture(name="worker")
+def fixture_worker(monkeypatch):
+    monkeypatch.setenv("INGEST_QUEUE_URL", "https://sqs.example.com/queue")
+    monkeypatch.setenv("FFMPEG_BUCKET", "ffmpeg")
+    monkeypatch.setenv("TAMS_MEDIA_BUCKET", "media")
+    return load_function(
+        "components/ingest-ffmpeg/functions/ffmpeg-worker", "ffmpeg_worker_app"
+    )
+
+
+class FakeS3:
+    def __init__(self, abort_error=None):
+        self.objects = {}
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+        self._abort_error = abort_error
+
+    def put_object(self, Key, Body, **_):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, **_):
+        return {"UploadId": "upload"}
+
+    def upload_part(self, Body, PartNumber, **_):
+        self.parts[PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, MultipartUpload, **_):
+        self.completed = MultipartUpload["Parts"]
+
+    def abort_multipart_upload(self, **_):
+        self.aborted = True
+        if self._abort_error:
+            raise self._abort_error
+
+
+def test_part_size_splits_known_size_between_uploads(worker):
+    assert worker.get_part_size(80 * MB, concurrency=8, memory_mb=1024) == 10 * MB
+
+
+def test_part_size_is_limited_by_memory_but_not_below_minimum(worker):
+    # A quarter of 1024MB shared by 8 uploads and the part being read
+    assert worker.get_part_size(None, concurrency=8, memory_mb=1024) == 256 * MB // 9
+    assert worker.get_part_size(None, concurrency=8, memory_mb=128) == (
+        worker.MIN_PART_SIZE
+    )
+
+
+def test_part_size_keeps_large_objects_within_part_count(worker):
+    size = 200_000 * MB
+    part_size = worker.get_part_size(size, concurrency=8, memory_mb=128)
+
+    assert part_size * worker.MAX_PART_COUNT >= size
+
+
+def test_multipart_upload_completes_parts_in_order(worker, monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(worker, "get_client", lambda _: s3)
+
+    with worker.MultipartUpload("bucket", "key", concurrency=2) as upload:
+        for data in (b"a", b"b", b"c"):
+            upload.add_part(data)
+
+    assert s3.parts == {1: b"a", 2: b"b", 3: b"c"}
+    assert s3.completed == [
+        {"PartNumber": number, "ETag": f"etag-{number}"} for number in (1, 2, 3)
+    ]
+    assert not s3.aborted
+
+
+def test_multipart_upload_abort_error_keeps_original_error(worker, monkeypatch):
+    s3 = FakeS3(abort_error=EndpointConnectionError(endpoint_url="https://s3"))
+    monkeypatch.setattr(worker, "get_client", lambda _: s3)
+
+    with pytest.raises(ValueError, match="ffmpeg failed"):
+        with worker.MultipartUpload("bucket", "key") as upload:
+            upload.add_part(b"a")
+            raise ValueError("ffmpeg failed")
+
+    assert s3.aborted
+    assert s3.completed is None
+
+
+class Body:
+    def __init__(self, data):
+        self._data = data
+
+    def iter_chunks(self, size):
+        for start in range(0, len(self._data), size):
+            yield self._data[start : start + size]
+
+    def close(self):
+        pass
+
+
+def run_ffmpeg(worker, monkeypatch, script, data=b"x" * 8 * MB):
+    """Upload the output of a Python script standing in for ffmpeg"""
+    s3 = FakeS3()
+    monkeypatch.setattr(worker, "get_client", lambda _: s3)
+    args_list = [sys.executable, "-c", f"import sys\n{script}", "pipe:1"]
+    key = worker.upload_ffmpeg_output(args_list, "bucket", "output/", body=Body(data))
+    return s3.objects[key]
+
+
+def test_ffmpeg_output_of_all_input_is_uploaded(worker, monkeypatch):
+    script = "sys.stdout.buffer.write(sys.stdin.buffer.read())"
+
+    assert run_ffmpeg(worker, monkeypatch, script, b"media") == b"media"
+
+
+def test_ffmpeg_stopping_before_end_of_input_fails(worker, monkeypatch):
+    script = "sys.stdin.buffer.read(1)\nsys.stdout.buffer.write(b'partial')"
+
+    with pytest.raises(BrokenPipeError):
+        run_ffmpeg(worker, monkeypatch, script)
+
+
+def test_ffmpeg_error_is_raised_over_broken_pipe(worker, monkeypatch):
+    script = "sys.stdin.buffer.read(1)\nsys.exit(3)"
+
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        run_ffmpeg(worker, monkeypatch, script)
+
+    assert raised.value.returncode == 3
+    assert isinstance(raised.value.__cause__, BrokenPipeError)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import openid_auth
+from openid_auth import (
+    CachedToken,
+    Credentials,
+    DynamoDBTokenCache,
+    MemoryDynamoDBClient,
+    MemoryTokenCache,
+)
+
+
+def make_token(access_token: str, expires_in: float) -> CachedToken:
+    now = time.time()
+    return CachedToken(access_token, issued_at=now, expires_at=now + expires_in)
+
+
+def test_dynamodb_token_cache_round_trip():
+    cache = DynamoDBTokenCache("tokens", client=MemoryDynamoDBClient())
+    token = make_token("token", 3600)
+
+    cache.set("key", token)
+
+    assert cache.get("key") == token
+    assert cache.get("other") is None
+
+
+def test_dynamodb_token_cache_ignores_expired_items():
+    cache = DynamoDBTokenCache("tokens", client=MemoryDynamoDBClient())
+
+    cache.set("key", make_token("token", -openid_auth.EXPIRY_OVERLAP - 1))
+
+    assert cache.get("key") is None
+
+
+def test_token_close_to_expiry_is_refreshed_inline(monkeypatch):
+    credentials = Credentials(
+        scopes=["read"],
+        token_url="https://auth.example.com/token",
+        client_id="client",
+        client_secret="secret",
+        token_caches=[MemoryTokenCache()],
+    )
+    now = time.time()
+    # pylint: disable=protected-access
+    credentials._token = CachedToken("old", issued_at=now - 3590, expires_at=now + 10)
+    monkeypatch.setattr(credentials, "_request_token", lambda: make_token("new", 3600))
+    threads = threading.active_count()
+
+    assert credentials.token() == "new"
+    assert threading.active_count() == threads
+
+
+def test_current_token_is_none_once_a_refresh_is_due():
+    credentials = Credentials(
+        scopes=["read"],
+        token_url="https://auth.example.com/token",
+        client_id="client",
+        client_secret="secret",
+        token_caches=[MemoryTokenCache()],
+    )
+    now = time.time()
+
+    assert credentials.current_token() is None
+    # pylint: disable=protected-access
+    credentials._token = CachedToken("fresh", issued_at=now, expires_at=now + 3600)
+    assert credentials.current_token() == "fresh"
+    credentials._token = CachedToken("old", issued_at=now - 3590, expires_at=now + 10)
+    assert credentials.current_token() is None
@@ -0,0 +1,80 @@
+from playlist import get_skipped_segment_count, render_media_playlist
+from tams_client import format_timestamp
+
+SECOND = 1_000_000_000
+
+
+def make_segment(start: int, end: int, ts_offset: str = "") -> dict:
+    segment = {
+        "timerange": f"[{format_timestamp(start * SECOND)}_"
+        f"{format_timestamp(end * SECOND)})",
+        "get_urls": [
+            {"url": f"https://bucket.example.com/controlled-{start}"},
+            {"url": f"https://bucket.example.com/{start}", "presigned": True},
+        ],
+    }
+    if ts_offset:
+        segment["ts_offset"] = ts_offset
+    return segment
+
+
+SEGMENTS = [make_segment(start, start + 2) for start in range(0, 20, 2)]
+
+
+def test_skipped_segments_are_replaced_by_skip_tag():
+    playlist = render_media_playlist(
+        SEGMENTS[6:],
+        target_duration=2.0,
+        media_sequence=5,
+        version=9,
+        server_control={"CAN-SKIP-UNTIL": 12.0},
+        skipped_segments=6,
+    )
+
+    assert playlist.splitlines()[:6] == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:9",
+        "#EXT-X-TARGETDURATION:2",
+        "#EXT-X-MEDIA-SEQUENCE:5",
+        "#EXT-X-SERVER-CONTROL:CAN-SKIP-UNTIL=12",
+        "#EXT-X-SKIP:SKIPPED-SEGMENTS=6",
+    ]
+    assert playlist.count("#EXTINF:2.000000,") == 4
+    assert "https://bucket.example.com/12\n" in playlist
+    assert "https://bucket.example.com/10\n" not in playlist
+
+
+def test_date_time_is_of_first_segment_after_skip():
+    playlist = render_media_playlist(SEGMENTS[6:], 2.0, skipped_segments=6)
+
+    assert "#EXT-X-PROGRAM-DATE-TIME:1970-01-01T00:00:12.000+00:00" in playlist
+
+
+def test_discontinuity_is_detected_across_skip():
+    segments = [make_segment(0, 2), make_segment(2, 4, "10:0")]
+
+    unchanged = render_media_playlist(
+        segments[1:], 2.0, skipped_segments=1, prev_ts_offset="10:0"
+    )
+    changed = render_media_playlist(segments[1:], 2.0, skipped_segments=1)
+
+    assert "#EXT-X-DISCONTINUITY" not in unchanged
+    assert "#EXT-X-DISCONTINUITY" in changed
+
+
+def test_playlist_without_skip_has_no_skip_tag():
+    playlist = render_media_playlist(SEGMENTS, 2.0, endlist=True)
+
+    assert "#EXT-X-SKIP" not in playlist
+    assert playlist.count("#EXTINF:") == len(SEGMENTS)
+    assert playlist.endswith("#EXT-X-ENDLIST\n")
+
+
+def test_segments_ending_before_skip_boundary_are_skipped():
+    # The last 12 seconds of 20 are kept, so segments ending by 8 seconds are skipped
+    assert get_skipped_segment_count([2.0] * 10, 12.0) == 4
+
+
+def test_segment_crossing_skip_boundary_is_kept():
+    assert get_skipped_segment_count([3.0] * 4, 7.0) == 1
+    assert get_skipped_segment_count([3.0] * 4, 12.0) == 0
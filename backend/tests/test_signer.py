@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from botocore.auth import SigV4QueryAuth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from signer import UrlSigner
+
+BASE_URL = "https://abc123.lambda-url.eu-west-1.on.aws"
+NOW = 1_700_000_123
+BUCKET_SECONDS = 300
+EXPIRES_IN = 60
+
+
+def make_signer(token=None):
+    signer = UrlSigner(BASE_URL, "eu-west-1", bucket_seconds=BUCKET_SECONDS)
+    signer._credentials = Credentials("AKIDEXAMPLE", "secret", token)
+    return signer
+
+
+def sign_with_botocore(path, query, token=None):
+    """Pre-signed URL from botocore, signed at the start of the signer's bucket"""
+    request = AWSRequest(method="GET", url=f"{BASE_URL}/{path}", params=query)
+    auth = SigV4QueryAuth(
+        Credentials("AKIDEXAMPLE", "secret", token),
+        "lambda",
+        "eu-west-1",
+        expires=EXPIRES_IN + BUCKET_SECONDS,
+    )
+    signing_time = datetime.fromtimestamp(
+        NOW // BUCKET_SECONDS * BUCKET_SECONDS, timezone.utc
+    )
+    with mock.patch("botocore.auth.get_current_datetime", return_value=signing_time):
+        auth.add_auth(request)
+    return request.prepare().url
+
+
+def signed_query(url):
+    return {k: v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+
+
+def test_sign_all_matches_botocore():
+    paths = ["flows/0b1c/segments.m3u8", "flows/with%20space/manifest.m3u8"]
+    query = {"_HLS_msn": "10", "tag": "a/b"}
+    for token in (None, "session-token"):
+        with mock.patch("signer.time.time", return_value=NOW):
+            signed = make_signer(token).sign_all(
+                paths, expires_in=EXPIRES_IN, query=query
+            )
+        for path in paths:
+            expected = signed_query(sign_with_botocore(path, query, token))
+            assert signed_query(signed[path]) == expected
+
+
+def test_sign_all_reuses_urls_within_a_bucket():
+    signer = make_signer()
+    with mock.patch("signer.time.time", return_value=NOW):
+        first = signer.sign_all(["a.m3u8"])
+    with mock.patch("signer.time.time", return_value=NOW + 100):
+        assert signer.sign_all(["a.m3u8"]) == first
+    with mock.patch("signer.time.time", return_value=NOW + BUCKET_SECONDS):
+        assert signer.sign_all(["a.m3u8"]) != first
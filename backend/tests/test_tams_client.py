@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from tams_client import (
+    MIN_SHARD_SEGMENTS,
+    TamsClient,
+    format_timestamp,
+    get_timerange_shards,
+    parse_timerange_bounds,
+)
+
+SECOND = 1_000_000_000
+FLOW_TIMERANGE = "[0:0_40:0)"
+
+
+class Token:
+    def token(self) -> str:
+        return "token"
+
+
+def make_segment(start: int, end: int) -> dict:
+    return {
+        "object_id": f"object-{start}",
+        "timerange": f"[{format_timestamp(start * SECOND)}_"
+        f"{format_timestamp(end * SECOND)})",
+    }
+
+
+def list_overlapping(segments: list[dict], timerange: str) -> list[dict]:
+    """Segments overlapping a shard timerange, as the TAMS API lists them"""
+    start, end = parse_timerange_bounds(timerange)
+    return [
+        segment
+        for segment in segments
+        if parse_timerange_bounds(segment["timerange"])[1] > start
+        and parse_timerange_bounds(segment["timerange"])[0] < end
+    ]
+
+
+def get_pages(segments: list[dict], page_size: int = 2):
+    def pages(path, params=None):
+        listed = list_overlapping(segments, params["timerange"])
+        for i in range(0, len(listed), page_size):
+            yield listed[i : i + page_size]
+
+    return pages
+
+
+# Shards of FLOW_TIMERANGE start every 10 seconds
+SEGMENTS = [
+    make_segment(0, 4),
+    make_segment(4, 12),
+    make_segment(12, 20),
+    # Spans the boundaries at 20 and 30 seconds, so is listed by three shards
+    make_segment(20, 35),
+    make_segment(35, 40),
+]
+
+
+def test_shards_are_contiguous_and_cover_the_flow():
+    assert get_timerange_shards("_", FLOW_TIMERANGE, 4) == [
+        "[0:0_10:0)",
+        "[10:0_20:0)",
+        "[20:0_30:0)",
+        "[30:0_40:0)",
+    ]
+
+
+def test_shards_keep_the_inclusivity_of_the_timerange():
+    shards = get_timerange_shards("(10:0_30:0]", FLOW_TIMERANGE, 2)
+
+    assert shards == ["(10:0_20:0)", "[20:0_30:0]"]
+
+
+def test_shards_have_enough_segments_to_be_worth_listing():
+    duration = 40 / (2 * MIN_SHARD_SEGMENTS)
+
+    assert len(get_timerange_shards("_", FLOW_TIMERANGE, 8, duration)) == 2
+    assert len(get_timerange_shards("_", FLOW_TIMERANGE, 8, 40)) == 1
+
+
+def test_unbounded_timerange_is_a_single_shard():
+    assert get_timerange_shards("[5:0_", "(0:0_", 4) == ["[5:0_)"]
+
+
+def test_timerange_outside_the_flow_has_no_shards():
+    assert not get_timerange_shards("[50:0_60:0)", FLOW_TIMERANGE, 4)
+    assert not get_timerange_shards("_", "", 4)
+
+
+@pytest.fixture(name="client")
+def fixture_client(monkeypatch):
+    client = TamsClient("https://tams.example.com", Token())
+    monkeypatch.setattr(client, "get_pages", get_pages(SEGMENTS))
+    return client
+
+
+def test_segments_across_shards_are_listed_once(client):
+    segments = list(client.get_segments_sharded("flow", "_", FLOW_TIMERANGE, shards=4))
+
+    assert segments == SEGMENTS
+
+
+def test_segment_ending_on_a_shard_boundary_is_kept(client, monkeypatch):
+    boundary_segments = [make_segment(0, 10), make_segment(10, 20)]
+    monkeypatch.setattr(client, "get_pages", get_pages(boundary_segments))
+
+    segments = list(client.get_segments_sharded("flow", "_", "[0:0_20:0)", shards=2))
+
+    assert segments == boundary_segments
+
+
+def test_timerange_is_split_within_the_flow(client):
+    segments = list(
+        client.get_segments_sharded("flow", "[10:0_30:0)", FLOW_TIMERANGE, shards=4)
+    )
+
+    assert segments == SEGMENTS[1:4]
+
+
+def test_segments_are_yielded_while_shards_are_paged(client, monkeypatch):
+    release = threading.Event()
+    pages = get_pages(SEGMENTS, page_size=1)
+
+    def blocking_pages(path, params=None):
+        for i, page in enumerate(pages(path, params)):
+            # Every shard waits before listing its second page
+            if i > 0:
+                release.wait(5)
+            yield page
+
+    monkeypatch.setattr(client, "get_pages", blocking_pages)
+    segments = client.get_segments_sharded("flow", "_", FLOW_TIMERANGE, shards=4)
+    started = time.monotonic()
+    try:
+        assert next(segments) == SEGMENTS[0]
+        # Without streaming the first shard would only be yielded once waiting ends
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+    assert list(segments) == SEGMENTS[1:]
+
+
+def test_async_segments_across_shards_are_listed_once(monkeypatch):
+    # pylint: disable=import-outside-toplevel
+    from tams_client_async import AsyncTamsClient
+
+    client = AsyncTamsClient("https://tams.example.com", Token())
+    pages = get_pages(SEGMENTS)
+
+    async def async_pages(path, params=None):
+        for page in pages(path, params):
+            await asyncio.sleep(0)
+            yield page
+
+    monkeypatch.setattr(client, "get_pages", async_pages)
+
+    async def list_segments():
+        return [
+            segment
+            async for segment in client.get_segments_sharded(
+                "flow", "_", FLOW_TIMERANGE, shards=4
+            )
+        ]
+
+    assert client.run(list_segments()) == SEGMENTS